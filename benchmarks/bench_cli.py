@@ -0,0 +1,211 @@
+"""端到端测试 CLI 命令的延迟。
+
+    python benchmarks/bench_cli.py [--sizes 0,10000,1000000] [--rounds 20]
+                                   [--splits 3] [--out bench-cli.json]
+
+对每个数据量 (预先填充的已结束事件数量) 创建一个临时数据库，用 click 的
+CliRunner 重复执行 start -> split x k -> pause -> resume -> status -> list
+-> stop, 统计每个命令的 p50/p95/p99 延迟 (毫秒) 及执行的 SQL 语句数量
+(sqlite3 trace callback, 包括触发器中的语句), 结果同时保存为 JSON 文件，
+方便在 review 时比较。
+
+每个数据量在独立的子进程中执行 (tt.main 在导入时读取设置与数据库路径),
+不会读写真实的数据库与补全缓存。进程启动与导入 tt.main 的时间单独记录为
+"import".
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from tt import db, model, stmt
+
+BenchDirVar = "TT_BENCH_DIR"
+EventGap = 3000
+"""预先填充的事件的间隔 (秒)"""
+
+
+def prefill(db_path: str, n: int) -> None:
+    """创建数据库，填充 n 个已结束的事件 (每个事件两个工作小节与一次休息)"""
+    with db.connect(db_path) as conn:
+        db.create_tables(conn)
+        db.init_cfg(conn)
+        task = model.new_task({"name": "bench"}).unwrap()
+        db.insert_task(conn, task)
+    conn.execute(stmt.Enable_wal)
+
+    start = model.now() - (n + 1) * EventGap
+    rows = []
+    for i in range(n):
+        s = start + i * EventGap
+        laps = (
+            ("Split", s, s + 900, 900),
+            ("Pause", s + 900, s + 1200, 300),
+            ("Split", s + 1200, s + 2400, 1200),
+        )
+        rows.append(
+            dict(
+                id=model.base_repr(s, 36),
+                task_id=task.id,
+                started=s,
+                status="Stopped",
+                laps=model.pack(laps),
+                work=2100,
+                notes="",
+                updated_at=s * 1000,
+            )
+        )
+        if len(rows) == 50_000 or i == n - 1:
+            with conn:
+                conn.executemany(stmt.Upsert_event, rows)
+            rows = []
+    conn.close()
+
+
+def percentile(values: list[float], p: float) -> float:
+    """nearest-rank"""
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, round(p / 100 * len(values) + 0.5) - 1))
+    return values[k]
+
+
+def worker(rounds: int, splits: int) -> dict:
+    """在子进程中执行 (BenchDirVar 指定临时文件夹)"""
+    t0 = time.perf_counter()
+    bench_dir = Path(os.environ[BenchDirVar])
+    db.app_config_dir = bench_dir
+    db.app_cfg_path = bench_dir.joinpath(db.AppCfgFilename)
+    db.default_db_path = bench_dir.joinpath(db.DB_Filename)
+    from tt import complete
+
+    complete.cache_path = bench_dir.joinpath(complete.CacheFilename)
+
+    statements = [0]
+    connect = db.connect
+
+    def count(_: str) -> None:
+        statements[0] += 1
+
+    def traced_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conn.set_trace_callback(count)
+        return conn
+
+    db.connect = traced_connect
+    from click.testing import CliRunner
+    from tt.main import cli
+
+    import_ms = (time.perf_counter() - t0) * 1000
+    sequence = ["start bench"] + ["split"] * splits
+    sequence += ["pause", "resume", "status", "list", "stop"]
+    runner = CliRunner()
+    samples: dict[str, dict[str, list]] = {}
+    for _ in range(rounds):
+        for command in sequence:
+            statements[0] = 0
+            start = time.perf_counter()
+            result = runner.invoke(cli, command.split())
+            ms = (time.perf_counter() - start) * 1000
+            if result.exit_code != 0:
+                raise RuntimeError(f"{command}: {result.output}")
+            name = command.split()[0]
+            sample = samples.setdefault(name, {"ms": [], "sql": []})
+            sample["ms"].append(ms)
+            sample["sql"].append(statements[0])
+    return dict(import_ms=import_ms, samples=samples)
+
+
+def summarize(samples: dict) -> dict:
+    result = {}
+    for name, sample in samples.items():
+        ms, sql = sample["ms"], sample["sql"]
+        result[name] = dict(
+            n=len(ms),
+            p50=round(percentile(ms, 50), 3),
+            p95=round(percentile(ms, 95), 3),
+            p99=round(percentile(ms, 99), 3),
+            sql=round(percentile(sql, 50)),
+        )
+    return result
+
+
+def run_size(size: int, rounds: int, splits: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        prefill(str(Path(tmp, db.DB_Filename)), size)
+        prefill_s = time.perf_counter() - start
+
+        env = dict(os.environ, **{BenchDirVar: tmp})
+        src = Path(db.__file__).parents[1]
+        env["PYTHONPATH"] = os.pathsep.join(
+            filter(None, [str(src), env.get("PYTHONPATH")])
+        )
+        start = time.perf_counter()
+        out = subprocess.run(
+            [sys.executable, __file__, "--worker", str(rounds), str(splits)],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        process_ms = (time.perf_counter() - start) * 1000
+    r = json.loads(out.stdout)
+    return dict(
+        events=size,
+        prefill_s=round(prefill_s, 2),
+        import_ms=round(r["import_ms"], 3),
+        process_ms=round(process_ms, 1),
+        commands=summarize(r["samples"]),
+    )
+
+
+def print_result(r: dict) -> None:
+    print(
+        f"\n{r['events']} events (prefill {r['prefill_s']}s, "
+        f"import {r['import_ms']:.1f} ms)"
+    )
+    print(f"  {'command':<8} {'p50':>8} {'p95':>8} {'p99':>8} {'sql':>5}")
+    for name, c in r["commands"].items():
+        print(
+            f"  {name:<8} {c['p50']:>8.2f} {c['p95']:>8.2f} "
+            f"{c['p99']:>8.2f} {c['sql']:>5}"
+        )
+
+
+def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        rounds, splits = int(sys.argv[2]), int(sys.argv[3])
+        print(json.dumps(worker(rounds, splits)))
+        return
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="0,10000,1000000")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--splits", type=int, default=3)
+    parser.add_argument("--out", default="bench-cli.json")
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        r = run_size(size, args.rounds, args.splits)
+        print_result(r)
+        results.append(r)
+
+    data = dict(
+        python=sys.version.split()[0],
+        sqlite=db.sqlite3.sqlite_version,
+        rounds=args.rounds,
+        splits=args.splits,
+        results=results,
+    )
+    Path(args.out).write_text(json.dumps(data, indent=2), encoding="utf-8")
+    print(f"\n-> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""比较 tt stats 的纯 Python 与 NumPy 两种实现。
+
+    python benchmarks/bench_lap_stats.py [YEARS]
+
+按每天 8 个事件、每个事件 5 个小节生成 YEARS 年 (默认 5 年) 的数据，
+分别计算并检查两种实现的结果是否完全相同。
+"""
+
+import random
+import sys
+import time
+
+from tt import model, stats
+
+
+def make_rows(years: int) -> list[tuple[str, bytes]]:
+    rng = random.Random(years)
+    rows = []
+    t = 1420070400
+    for i in range(years * 365 * 8):
+        laps = []
+        start = t
+        for j in range(5):
+            name = "Split" if j % 2 == 0 else "Pause"
+            length = rng.randint(60, 3600)
+            laps.append((name, start, start + length, length))
+            start += length
+        rows.append((model.base_repr(t, 36), model.pack(tuple(laps))))
+        t = start + rng.randint(600, 7200)
+    return rows
+
+
+def bench(rows, use_numpy: bool) -> tuple[float, stats.FocusStats]:
+    start = time.perf_counter()
+    result = stats.collect(rows, use_numpy=use_numpy)
+    return time.perf_counter() - start, result
+
+
+def main() -> None:
+    years = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    rows = make_rows(years)
+    print(f"{years} years, {len(rows)} events, {len(rows) * 5} laps")
+
+    t_py, a = bench(rows, False)
+    print(f"python: {t_py:.3f}s")
+    if stats.np is None:
+        print("numpy : not installed")
+        return
+
+    t_np, b = bench(rows, True)
+    assert a == b, "results differ"
+    print(f"numpy : {t_np:.3f}s  ({t_py / t_np:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
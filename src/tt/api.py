@@ -0,0 +1,204 @@
+"""嵌入式 Python API
+
+    from tt.api import Session
+
+    with Session() as s:
+        event = s.start("coding").unwrap()
+        s.pause()
+
+Session 长期持有一个数据库连接及设定 (Config), 任务类型由该连接缓存，
+全部方法都只返回结果 (Result), 不会打印任何内容。
+状态转换与命令行一样，在提交之后执行用户钩子 (见 hooks.py),
+创建、删除事件之后重写补全缓存 (见 complete.py)。
+"""
+
+import sqlite3
+
+from result import Err, Ok, Result
+
+from . import complete, db, model, util
+from .model import Config, Event, EventStatus, MultiText, Task
+from .report import Summary, summarize
+
+
+class Session:
+    def __init__(self, db_path: str | None = None):
+        if db_path is None:
+            db.ensure_cfg_file()
+            db_path = db.load_app_cfg()["db_path"]
+        self.db_path = db_path
+        self.conn = db.connect(db_path)
+        self.cfg: Config = db.get_cfg(self.conn).unwrap()
+
+        # 最新的事件，只有在其他连接修改了数据库时才需要重新读取。
+        self._last: Event | None = None
+        self._version = -1
+
+    def __enter__(self) -> "Session":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def reload_cfg(self) -> Config:
+        self.cfg = db.get_cfg(self.conn).unwrap()
+        return self.cfg
+
+    def task(self, name: str) -> Result[Task, MultiText]:
+        """按名称或别名查找任务类型"""
+        r = db.get_task_by_name_or_alias(self.conn, name)
+        if r.is_ok() or r.unwrap_err() is not db.NoResultError:
+            return r
+        err = MultiText(
+            cn=f"不存在任务类型: {name}, 可使用 'tt add {name}' 添加此任务类型。",
+            en=f"Not Found: {name}. Try 'tt add {name}' to add it as a task type.",
+        )
+        return Err(err)
+
+    def last_event(self) -> Result[Event, MultiText]:
+        version = db.data_version(self.conn)
+        if self._last is None or version != self._version:
+            r = db.get_last_event(self.conn)
+            if r.is_err():
+                return r
+            self._last = r.unwrap()
+            self._version = version
+        return Ok(self._last)
+
+    def status(self) -> Result[Event, MultiText]:
+        """最新的一个事件 (可能已结束)"""
+        return self.last_event()
+
+    def start(self, name: str | None = None) -> Result[Event, MultiText]:
+        """启动一个新事件。省略 name 则采用上一个事件的任务类型。"""
+        last = self.last_event().ok()
+        if last is not None and last.status is not EventStatus.Stopped:
+            return Err(util.check_last_event_stopped(self.conn).unwrap_err())
+
+        if name is None:
+            if last is None:
+                return Err(db.get_last_event(self.conn).unwrap_err())
+            task = self.task_by_id(last.task_id)
+        else:
+            match self.task(name):
+                case Err(err):
+                    return Err(err)
+                case Ok(task):
+                    pass
+        return Ok(self.new_event(task))
+
+    def task_by_id(self, task_id: str) -> Task:
+        return db.get_task_by_id(self.conn, task_id).unwrap()
+
+    def new_event(self, task: Task) -> Event:
+        event = Event({"task_id": task.id})
+        with self.conn:
+            db.insert_event(self.conn, event)
+        self._last = event
+        util.fire_hooks(self.conn, "start", event)
+        self.refresh_complete_cache()
+        return event
+
+    def refresh_complete_cache(self) -> None:
+        """与命令行一样，事件增减后重写补全缓存 (split/pause 等不调用)"""
+        try:
+            complete.refresh(self.conn, self.db_path, force=True)
+        except (OSError, sqlite3.Error):
+            pass  # 补全缓存不影响正常使用
+
+    def operate(self, op: str) -> Result[Event, MultiText]:
+        """op: split/pause/resume/stop
+
+        事件结束时，如果总工作时长小于下限则自动删除该事件。
+        如果 resume 时休息时长超过上限，则该事件自动结束，并启动一个新事件
+        (此时返回新事件)。
+        """
+        r = self.last_event()
+        if r.is_err():
+            return r
+        event = r.unwrap()
+        if event.status is EventStatus.Stopped:
+            return Err(util.get_last_event(self.conn).unwrap_err())
+
+        err = util.check_op(op, event.status)
+        if err is not None:
+            return Err(err)
+
+        at = model.now()
+        event.apply(op, self.cfg, at)
+        deleted = False
+        with self.conn:
+            db.append_lap_op(self.conn, event, op, at, self.cfg)
+            if event.status is EventStatus.Stopped and util.below_min(
+                self.cfg, event
+            ):
+                db.delete_event(self.conn, event.id)
+                self._last = None
+                deleted = True
+        util.fire_hooks(self.conn, op, event, deleted)
+        if deleted:
+            self.refresh_complete_cache()
+
+        if op == "resume" and event.status is EventStatus.Stopped:
+            return Ok(self.new_event(self.task_by_id(event.task_id)))
+        return Ok(event)
+
+    def split(self) -> Result[Event, MultiText]:
+        return self.operate("split")
+
+    def pause(self) -> Result[Event, MultiText]:
+        return self.operate("pause")
+
+    def resume(self) -> Result[Event, MultiText]:
+        return self.operate("resume")
+
+    def stop(self) -> Result[Event, MultiText]:
+        return self.operate("stop")
+
+    def undo(self) -> Result[Event | None, MultiText]:
+        """撤销最新事件的最后一个操作，撤销 start 即删除该事件 (返回 None)"""
+        r = self.last_event()
+        if r.is_err():
+            return Err(r.unwrap_err())
+        with self.conn:
+            result = db.undo_last_op(self.conn, r.unwrap().id)
+        self._last = None
+        if result.is_ok() and result.unwrap() is None:
+            self.refresh_complete_cache()  # 撤销 start 删除了该事件
+        return result
+
+    def list_by_date(
+        self, date: str, d_or_m: str
+    ) -> Result[list[Event], MultiText]:
+        """d_or_m: "day" (YYYY-MM-DD) 或 "month" (YYYY-MM)"""
+        return db.get_events_by_date(self.conn, date, d_or_m)
+
+    def report(
+        self,
+        start: int = 0,
+        end: int | None = None,
+        jobs: int = 1,
+        task: str | None = None,
+    ) -> Result[Summary, MultiText]:
+        """[start, end) 范围内每个任务类型的事件数量与工作时长
+
+        task: 只统计该任务类型 (名称或别名)
+        """
+        task_id = None
+        if task is not None:
+            match self.task(task):
+                case Err(err):
+                    return Err(err)
+                case Ok(found):
+                    task_id = found.id
+        if end is None:
+            end = model.now() + 1
+        return Ok(summarize(self.conn, start, end, jobs, task_id))
+
+    # list 会遮蔽内置的 list, 因此放在最后。
+    def list(self, n: int = model.RecentItemsMax) -> list[Event]:
+        """最近的 n 个事件"""
+        return db.get_recent_events(self.conn, n).unwrap_or([])
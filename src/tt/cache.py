@@ -0,0 +1,146 @@
+"""报表、统计等查询结果的缓存
+
+仪表板、状态栏会不停地查询 "今天" 与 "本周" 的数据。缓存的键是
+(数据库文件, 查询名称, 参数, 修改计数), 修改计数保存在 metadata 表中，
+由触发器在每次修改 task/event/lap_op 时增大 (见 stmt.Change_counter_schema),
+因此数据库没有变化时，重复的查询只读取一行 metadata, 不会读取 event 表。
+
+- 长期运行的程序 (tt serve, api.Session) 使用内存中的 LRU 缓存 (默认)。
+- 命令行 (每次都是新的进程) 使用 use_disk() 切换为磁盘上的小缓存文件，
+  与 tt-focus.cfg 在同一个文件夹。文件用 pickle 保存 (只保存本程序计算的
+  结果，该文件夹中的 tt-focus-hooks.json 本来就可以执行任意命令)。
+"""
+
+import copy
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Final, Hashable, TypeVar
+
+from . import db, model, stmt
+
+CacheFilename: Final = "tt-focus-results.cache"
+MemoryEntries: Final = 256
+DiskEntries: Final = 32
+
+T = TypeVar("T")
+
+
+class MemoryCache:
+    """线程安全的 LRU 缓存。取出的是副本，调用者可以随意修改。"""
+
+    def __init__(self, maxsize: int = MemoryEntries):
+        self.maxsize = maxsize
+        self.items: OrderedDict[Hashable, Any] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> tuple[bool, Any]:
+        with self.lock:
+            if key not in self.items:
+                self.misses += 1
+                return False, None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return True, copy.deepcopy(self.items[key])
+
+    def put(self, key: Hashable, value: Any, stale: Callable) -> None:
+        """stale(key) 为真的旧项目 (修改计数较小) 会同时删除"""
+        with self.lock:
+            for old in [k for k in self.items if stale(k)]:
+                del self.items[old]
+            self.items[key] = copy.deepcopy(value)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+            self.changed()
+
+    def changed(self) -> None:
+        pass
+
+
+class DiskCache(MemoryCache):
+    """第一次使用时读取文件，每次写入后立即保存 (先写临时文件再改名)。"""
+
+    def __init__(self, path: Path, maxsize: int = DiskEntries):
+        super().__init__(maxsize)
+        self.path = path
+        self.loaded = False
+
+    def load(self) -> None:
+        self.loaded = True
+        try:
+            items = pickle.loads(self.path.read_bytes())
+        except Exception:  # 文件不存在或已损坏，都当作空缓存
+            return
+        if isinstance(items, OrderedDict):
+            self.items = items
+
+    def get(self, key: Hashable) -> tuple[bool, Any]:
+        if not self.loaded:
+            self.load()
+        return super().get(key)
+
+    def put(self, key: Hashable, value: Any, stale: Callable) -> None:
+        if not self.loaded:
+            self.load()
+        super().put(key, value, stale)
+
+    def changed(self) -> None:
+        temp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        try:
+            temp.write_bytes(pickle.dumps(self.items))
+            os.replace(temp, self.path)
+        except OSError:
+            temp.unlink(missing_ok=True)
+
+
+store: MemoryCache = MemoryCache()
+
+
+def use_disk(path: Path) -> None:
+    global store
+    store = DiskCache(path)
+
+
+def use_memory() -> None:
+    global store
+    store = MemoryCache()
+
+
+def change_counter(conn: db.Conn) -> int | None:
+    """旧数据库 (尚未升级) 没有修改计数，返回 None (不使用缓存)。"""
+    row = conn.execute(stmt.Get_change_counter).fetchone()
+    return None if row is None else row[0]
+
+
+def range_key(start: int, end: int) -> tuple[int, int | None]:
+    """省略 date_to 时 end 是 "现在 + 1", 每次都不同。事件的开始时间不会晚于
+    现在，所以 end 晚于现在的范围都包含同样的事件，在缓存的键中统一为 None.
+    """
+    return start, (None if end > model.now() else end)
+
+
+def cached(
+    conn: db.Conn, name: str, args: tuple, compute: Callable[[], T]
+) -> T:
+    """查询结果 compute() 的缓存。
+
+    读取 event 表的查询应先调用 db.compact_pending, 否则 compute() 中的压缩
+    会增大修改计数，刚保存的结果下一次就不能使用。
+    """
+    counter = change_counter(conn)
+    if counter is None:
+        return compute()
+
+    db_file = str(db.db_file(conn))
+    key = (db_file, name, args, counter)
+    found, value = store.get(key)
+    if found:
+        return value
+
+    value = compute()
+    store.put(key, value, lambda k: k[0] == db_file and k[3] != counter)
+    return value
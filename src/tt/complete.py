@@ -0,0 +1,196 @@
+"""Shell 补全 (任务名称、别名及最近的事件 ID)
+
+命令行入口 (tt) 是本模块的 main(). 每按一次 TAB 键，shell 都会以
+_TT_COMPLETE=<shell>_complete 启动一次 tt, 如果导入整个 tt.main
+(arrow, sqlite3, 读取数据库), 补全就会明显卡顿。因此，补全任务名称与
+事件 ID 时只读取一个小小的缓存文件 (JSON), 不导入 arrow 也不打开数据库；
+其他情况 (子命令、选项等) 仍交给 click 处理。
+
+修改任务类型或创建、删除事件的命令 (add, start, stop, delete 等) 执行后
+重写缓存文件 (见 main.refresh_complete_cache); split/pause 等频繁执行的
+命令不会改变补全的内容，因此不重写。
+"""
+
+import json
+import os
+import shlex
+import sys
+import time
+from pathlib import Path
+from typing import Final
+
+from appdirs import AppDirs
+
+from . import stmt
+
+CompleteVar: Final = "_TT_COMPLETE"
+CacheFilename: Final = "tt-focus-complete.json"
+RecentEventsMax: Final = 50
+"""缓存中的最近事件数量"""
+
+# 与 db.app_config_dir 相同 (为了不导入 arrow, 这里不能导入 db)。
+app_config_dir = Path(AppDirs("tt-focus", "github-ahui2016").user_config_dir)
+cache_path = app_config_dir.joinpath(CacheFilename)
+
+TaskOptions: Final = ("-t", "--task")
+EventOptions: Final = ("-e", "--event")
+TaskCommands: Final = ("delete", "set", "stats", "report", "top", "goals")
+"""这些子命令的 -t/--task 选项的值是任务名称"""
+AliasCommands: Final = ("stats", "report", "top", "goals")
+"""TaskCommands 中也接受别名的子命令 (补全时列出名称与别名)"""
+EventCommands: Final = ("delete", "set")
+"""这些子命令的 -e/--event 选项的值是事件 ID"""
+ListFlags: Final = ("-v", "--verbose")
+
+
+def load_cache() -> dict | None:
+    try:
+        return json.loads(cache_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def is_stale(cache: dict | None, db_path: str) -> bool:
+    """缓存不存在，或属于另一个数据库文件 (tt set -db)"""
+    return cache is None or cache.get("db") != db_path
+
+
+def write_cache(conn, db_path: str) -> dict:
+    """conn 是 sqlite3 连接 (调用者已导入 sqlite3)"""
+    rows = conn.execute(stmt.Get_all_tasks)
+    tasks = [[row["name"], row["alias"]] for row in rows]
+    events = []
+    for event_id, name, started in conn.execute(
+        stmt.Get_recent_event_ids, (RecentEventsMax,)
+    ):
+        day = time.strftime("%Y-%m-%d", time.localtime(started))
+        events.append([event_id, f"{name or ''} {day}".strip()])
+
+    cache = dict(db=db_path, tasks=tasks, events=events)
+    temp = cache_path.with_suffix(".tmp")
+    temp.write_text(json.dumps(cache, ensure_ascii=False), encoding="utf-8")
+    os.replace(temp, cache_path)
+    return cache
+
+
+def refresh(conn, db_path: str, force: bool = False) -> dict:
+    """缓存过期 (或 force) 则重写，返回最新的缓存。"""
+    cache = None if force else load_cache()
+    if is_stale(cache, db_path):
+        cache = write_cache(conn, db_path)
+    return cache  # type: ignore[return-value]
+
+
+def task_items(cache: dict, incomplete: str, alias: bool = True):
+    """[(任务名称或别名, 说明)]"""
+    items = []
+    for name, task_alias in cache["tasks"]:
+        items.append((name, task_alias))
+        if alias and task_alias:
+            items.append((task_alias, name))
+    return match_items(items, incomplete)
+
+
+def event_items(cache: dict, incomplete: str):
+    """[(事件 ID, 说明)]"""
+    return match_items(cache["events"], incomplete)
+
+
+def match_items(items, incomplete: str) -> list[tuple[str, str]]:
+    prefix = incomplete.lower()
+    return [(v, h) for v, h in items if v.lower().startswith(prefix)]
+
+
+def what_to_complete(args: list[str], incomplete: str) -> str | None:
+    """根据已输入的参数判断需要补全的内容: "task", "alias", "event"
+
+    返回 None 表示交给 click 处理。
+    """
+    if incomplete.startswith("-"):
+        return None
+    words = [w for w in args if not w.startswith("-")]
+    if not words:
+        return None  # 正在输入子命令
+    cmd = words[0]
+    prev = args[-1]
+
+    if prev in TaskOptions and cmd in TaskCommands:
+        return "alias" if cmd in AliasCommands else "task"
+    if prev in EventOptions and cmd in EventCommands:
+        return "event"
+    if prev == "--task" and cmd == "list":
+        return "alias"  # list 的 -t 是 --tasks (列出全部任务类型)
+    if cmd == "start" and prev == cmd:
+        return "alias"
+    if cmd == "list" and (prev == cmd or prev in ListFlags):
+        return "event"
+    rest = args[args.index(cmd) + 1 :]
+    if cmd == "merge" and not any(w.startswith("-") for w in rest):
+        return "event"  # 只有在没有任何选项时，merge 的参数才是事件 ID
+    return None
+
+
+def completion_args(shell: str) -> tuple[list[str], str] | None:
+    """与 click.shell_completion 中各 shell 的 get_completion_args 相同"""
+    try:
+        cwords = shlex.split(os.environ["COMP_WORDS"])
+        if shell == "fish":
+            incomplete = os.environ["COMP_CWORD"]
+            incomplete = shlex.split(incomplete)[0] if incomplete else ""
+            args = cwords[1:]
+            if incomplete and args and args[-1] == incomplete:
+                args.pop()
+            return args, incomplete
+        cword = int(os.environ["COMP_CWORD"])
+    except (KeyError, ValueError, IndexError):
+        return None
+    args = cwords[1:cword]
+    incomplete = cwords[cword] if cword < len(cwords) else ""
+    return args, incomplete
+
+
+def format_item(shell: str, value: str, help_: str) -> str:
+    """与 click.shell_completion 中各 shell 的 format_completion 相同"""
+    if shell == "zsh":
+        if help_:
+            value = value.replace(":", r"\:")
+        return f"plain\n{value}\n{help_ or '_'}"
+    if shell == "fish" and help_:
+        return f"plain,{value}\t{help_}"
+    return f"plain,{value}"
+
+
+def fast_complete(instruction: str, cache: dict | None) -> bool:
+    """直接从缓存回答补全请求，不能回答 (需要 click 处理) 时返回 False."""
+    shell, _, action = instruction.partition("_")
+    if action != "complete" or shell not in ("bash", "zsh", "fish"):
+        return False
+    r = completion_args(shell)
+    if r is None:
+        return False
+    args, incomplete = r
+    kind = what_to_complete(args, incomplete)
+    if kind is None:
+        return False
+    if cache is None:
+        return False  # 由 click 处理 (同时会写入缓存)
+
+    if kind == "event":
+        items = event_items(cache, incomplete)
+    else:
+        items = task_items(cache, incomplete, kind == "alias")
+    out = "\n".join(format_item(shell, v, h) for v, h in items)
+    sys.stdout.write(out + "\n")
+    return True
+
+
+def main() -> None:
+    instruction = os.environ.get(CompleteVar, "")
+    if instruction.endswith("_complete") and fast_complete(
+        instruction, load_cache()
+    ):
+        return
+
+    from .main import cli
+
+    cli()
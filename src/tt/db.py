@@ -1,16 +1,20 @@
+import os
+import shutil
 import sqlite3
-from dataclasses import asdict
+import string
+from dataclasses import asdict, dataclass
 
 import arrow
 import msgpack
 from pathlib import Path
 from appdirs import AppDirs
 from result import Err, Ok, Result
-from typing import Final, Iterable, TypeAlias
+from typing import Callable, Final, Iterable, TypeAlias
 from . import stmt, model
 from .model import (
     Config,
     ConfigName,
+    DateFormat,
     AppConfig,
     Task,
     MultiText,
@@ -18,6 +22,16 @@ from .model import (
     UnknownReturn,
 )
 
+
+class Connection(sqlite3.Connection):
+    """附带任务类型缓存的数据库连接 (由 connect 创建)"""
+
+    task_cache: "TaskCache | None" = None
+    readonly: bool = False
+    skip_compact: bool = False
+    """为真时 compact_pending 不写入 (由唯一的写入者压缩，见 server.Writer)"""
+
+
 Conn: TypeAlias = sqlite3.Connection
 
 NoResultError: Final = MultiText(cn="数据库检索无结果", en="db-query-no-result")
@@ -25,6 +39,20 @@ OK: Final = Ok("OK")
 
 AppCfgFilename: Final = "tt-focus.cfg"
 DB_Filename: Final = "tt-focus.db"
+ArchiveFilename: Final = "tt-focus-archive-{year}.db"
+BackupFilename: Final = "tt-focus-{time}.db"
+"""旧版本的备份 (只有 tt-focus.db), 轮换时仍然计入。"""
+BackupFolderName: Final = "tt-focus-{time}"
+"""一次备份 (快照) 的文件夹，包括 tt-focus.db 及全部归档数据库。"""
+BackupTimeFormat: Final = "YYYYMMDD-HHmmss"
+BackupPages: Final = 128
+"""在线备份时每一步复制的页数，步与步之间其他进程可以写入数据库。"""
+DeleteBatch: Final = 2000
+"""删除任务类型时每个事务删除的事件数量，事务之间其他进程可以写入数据库。"""
+ReadMmapSize: Final = 256 * 1024 * 1024
+"""只读连接的 mmap_size, 读取大数据库时减少系统调用与内存复制。"""
+CompactOps: Final = 16
+"""未结束的事件累计这么多个未压缩的操作后，把 laps 写回 event 表。"""
 
 app_dirs = AppDirs("tt-focus", "github-ahui2016")
 app_config_dir = Path(app_dirs.user_config_dir)
@@ -40,13 +68,40 @@ def load_app_cfg() -> AppConfig:
     return model.unpack(app_cfg_path.read_bytes())
 
 
-def connect(db_path: str) -> Conn:
-    conn = sqlite3.connect(db_path)
+def connect(
+    db_path: str, readonly: bool = False, check_same_thread: bool = True
+) -> Conn:
+    """readonly: 只读连接 (mode=ro, query_only), 供只读取数据的命令使用。
+
+    数据库是 WAL 模式，只读连接与其他终端的写入互不阻塞。
+    check_same_thread=False 时连接可以在线程之间传递 (见 server.ReadPool),
+    但同一时间只能由一个线程使用。
+    """
+    if readonly:
+        uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(
+            uri,
+            uri=True,
+            factory=Connection,
+            check_same_thread=check_same_thread,
+        )
+        conn.execute("PRAGMA query_only = 1;")
+        conn.execute(f"PRAGMA mmap_size = {ReadMmapSize};")
+        conn.readonly = True
+    else:
+        conn = sqlite3.connect(
+            db_path, factory=Connection, check_same_thread=check_same_thread
+        )
     conn.row_factory = sqlite3.Row
     conn.execute(stmt.Enable_foreign_keys)
     return conn
 
 
+def data_version(conn: Conn) -> int:
+    """其他连接每提交一次修改，该值就会改变 (本连接的修改不影响该值)。"""
+    return conn.execute("PRAGMA data_version;").fetchone()[0]
+
+
 def conn_update(
     conn: Conn, query: str, param: Iterable, many: bool = False
 ) -> Result[int, str]:
@@ -69,8 +124,44 @@ def ensure_cfg_file() -> None:
     db_path = Path(app_cfg["db_path"])
     if not db_path.exists():
         with connect(str(db_path)) as conn:
-            conn.executescript(stmt.Create_tables)
+            create_tables(conn)
             init_cfg(conn)
+    else:
+        with connect(str(db_path)) as conn:
+            migrate(conn)
+    conn.execute(stmt.Enable_wal)  # 保存在数据库文件中，只需设置一次
+    conn.close()
+
+
+def user_version(conn: Conn) -> int:
+    return conn.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def create_tables(conn: Conn) -> None:
+    """新数据库: Create_tables 已是最新的结构，不需要执行 Migrations."""
+    conn.executescript(stmt.Create_tables)
+    conn.execute(f"PRAGMA user_version = {len(stmt.Migrations)};")
+
+
+def migrate(conn: Conn) -> None:
+    """按顺序执行尚未执行的 stmt.Migrations (每一项都在独立的事务中)
+
+    执行期间关闭外键约束，否则重建 event 表时 DROP TABLE 会级联删除 lap_op.
+    """
+    version = user_version(conn)
+    if version == len(stmt.Migrations):
+        return
+    conn.commit()
+    conn.execute("PRAGMA foreign_keys = 0;")  # 在事务之外才有效
+    try:
+        for i, script in enumerate(stmt.Migrations[version:], version + 1):
+            conn.executescript(
+                f"BEGIN; {script} PRAGMA user_version = {i}; COMMIT;"
+            )
+    finally:
+        if conn.in_transaction:
+            conn.rollback()  # 出错的 migration 不会留下一半的修改
+        conn.execute(stmt.Enable_foreign_keys)
 
 
 def get_cfg(conn: Conn) -> Result[Config, MultiText]:
@@ -89,6 +180,18 @@ def update_cfg(conn: Conn, cfg: Config) -> None:
     ).unwrap()
 
 
+def get_meta(conn: Conn, name: str):
+    """metadata 表中的任意数据 (model.pack 打包), 不存在时返回 None."""
+    row = conn.execute(stmt.Get_metadata, (name,)).fetchone()
+    return None if row is None else model.unpack(row[0])
+
+
+def set_meta(conn: Conn, name: str, value) -> None:
+    conn.execute(
+        stmt.Upsert_metadata, {"name": name, "value": model.pack(value)}
+    )
+
+
 def init_cfg(conn: Conn) -> None:
     if get_cfg(conn).is_err():
         conn_update(
@@ -98,27 +201,95 @@ def init_cfg(conn: Conn) -> None:
         ).unwrap()
 
 
-def get_task(conn: Conn, query: str, value: str) -> Result[Task, MultiText]:
-    row = conn.execute(query, (value,)).fetchone()
-    if row is None:
-        return Err(NoResultError)
+AsciiLower: Final = str.maketrans(
+    string.ascii_uppercase, string.ascii_lowercase
+)
 
-    task = model.new_task(dict(row)).unwrap()
-    return Ok(task)
+
+def nocase(s: str) -> str:
+    """与 SQLite 的 COLLATE NOCASE 一致 (只忽略 ASCII 字母的大小写)"""
+    return s.translate(AsciiLower)
+
+
+@dataclass
+class TaskCache:
+    """全部任务类型 (task 表很小，一次全部读取)"""
+
+    version: int
+    """读取时的 PRAGMA data_version, 其他连接修改数据库后缓存失效。"""
+    by_id: dict[str, Task]
+    by_name: dict[str, Task]
+    by_alias: dict[str, list[Task]]
+
+
+def load_tasks(conn: Conn, version: int) -> TaskCache:
+    cache = TaskCache(version, {}, {}, {})
+    for row in conn.execute(stmt.Get_all_tasks):
+        task = model.new_task(dict(row)).unwrap()
+        cache.by_id[nocase(task.id)] = task
+        cache.by_name[nocase(task.name)] = task
+        if task.alias:
+            cache.by_alias.setdefault(nocase(task.alias), []).append(task)
+    return cache
+
+
+def task_cache(conn: Conn) -> TaskCache:
+    version = data_version(conn)
+    cache = getattr(conn, "task_cache", None)
+    if cache is None or cache.version != version:
+        cache = load_tasks(conn, version)
+        if isinstance(conn, Connection):
+            conn.task_cache = cache
+    return cache
+
+
+def invalidate_tasks(conn: Conn) -> None:
+    """本连接修改 task 表后调用 (本连接的修改不会改变 data_version)"""
+    if isinstance(conn, Connection):
+        conn.task_cache = None
 
 
 def get_task_by_name(conn: Conn, name: str) -> Result[Task, MultiText]:
-    return get_task(conn, stmt.Get_task_by_name, name)
+    task = task_cache(conn).by_name.get(nocase(name))
+    if task is None:
+        return Err(NoResultError)
+    return Ok(task)
 
 
 def get_task_by_id(conn: Conn, task_id: str) -> Result[Task, MultiText]:
-    return get_task(conn, stmt.Get_task_by_id, task_id)
+    task = task_cache(conn).by_id.get(nocase(task_id))
+    if task is None:
+        return Err(NoResultError)
+    return Ok(task)
+
+
+def get_task_by_name_or_alias(
+    conn: Conn, name: str
+) -> Result[Task, MultiText]:
+    """先按名称查找，找不到再按别名查找 (别名不唯一时视为找不到)。"""
+    cache = task_cache(conn)
+    task = cache.by_name.get(nocase(name))
+    if task is not None:
+        return Ok(task)
+
+    tasks = cache.by_alias.get(nocase(name), [])
+    if len(tasks) == 1:
+        return Ok(tasks[0])
+    if len(tasks) > 1:
+        names = ", ".join(str(t) for t in tasks)
+        err = MultiText(
+            cn=f"有多个任务类型使用此别名: {names}",
+            en=f"Alias is ambiguous: {names}",
+        )
+        return Err(err)
+    return Err(NoResultError)
 
 
 def insert_task(conn: Conn, task: Task) -> Result[str, MultiText]:
     old_task = get_task_by_name(conn, task.name).ok()
     if old_task is None:
         conn_update(conn, stmt.Insert_task, asdict(task)).unwrap()
+        invalidate_tasks(conn)
         return OK
 
     err = MultiText(
@@ -129,24 +300,27 @@ def insert_task(conn: Conn, task: Task) -> Result[str, MultiText]:
 
 
 def get_all_task(conn: Conn) -> list[Task]:
-    rows = conn.execute(stmt.Get_all_tasks).fetchall()
-    return [model.new_task(dict(row)).unwrap() for row in rows]
+    tasks = task_cache(conn).by_name
+    return [tasks[name] for name in sorted(tasks)]
 
 
 def set_task_alias(conn: Conn, alias: str, name: str) -> None:
     conn_update(
         conn, stmt.Set_task_alias, dict(alias=alias, name=name)
     ).unwrap()
+    invalidate_tasks(conn)
 
 
 def set_task_name(conn: Conn, new_name: str, old_name: str) -> None:
     conn_update(
         conn, stmt.Set_task_name, dict(new_name=new_name, old_name=old_name)
     ).unwrap()
+    invalidate_tasks(conn)
 
 
 def insert_event(conn: Conn, event: Event) -> None:
     conn_update(conn, stmt.Insert_event, event.to_dict()).unwrap()
+    insert_lap_op(conn, event.id, "start", event.started, compacted=1)
 
 
 def set_event_notes(conn: Conn, notes: str, event_id: str) -> None:
@@ -163,7 +337,15 @@ def get_event_by_id(conn: Conn, event_id: str) -> Result[Event, MultiText]:
         )
         return Err(err)
 
-    return Ok(Event(dict(row)))
+    return Ok(load_event(conn, row))
+
+
+def get_events_by_ids(conn: Conn, event_ids: Iterable[str]) -> list[Event]:
+    """用一次 IN (...) 查询取得全部指定事件，按开始时间排序。"""
+    event_ids = tuple(event_ids)
+    marks = ",".join("?" * len(event_ids))
+    rows = conn.execute(stmt.Get_events_by_ids.format(marks), event_ids)
+    return [load_event(conn, row) for row in rows.fetchall()]
 
 
 def get_last_event(conn: Conn) -> Result[Event, MultiText]:
@@ -183,8 +365,14 @@ def count_events_range(conn: Conn, start: int, end: int) -> int:
     return row[0]
 
 
-def get_recent_events(conn: Conn, n: int) -> Result[list[Event], MultiText]:
-    rows = conn.execute(stmt.Get_recent_events, (n,)).fetchall()
+def get_recent_events(
+    conn: Conn, n: int, task_id: str | None = None
+) -> Result[list[Event], MultiText]:
+    if task_id is None:
+        cursor = conn.execute(stmt.Get_recent_events, (n,))
+    else:
+        cursor = conn.execute(stmt.Get_recent_task_events, (task_id, n))
+    rows = cursor.fetchall()
     if not rows:
         err = MultiText(
             cn="没有任何事件数据，可使用 'tt start TASK' 启动一个事件。",
@@ -192,7 +380,7 @@ def get_recent_events(conn: Conn, n: int) -> Result[list[Event], MultiText]:
         )
         return Err(err)
 
-    events = [Event(dict(row)) for row in rows]
+    events = [load_event(conn, row) for row in rows]
     return Ok(events)
 
 
@@ -220,7 +408,7 @@ def get_dates(date: str, ymd: str) -> Result[tuple[int, int], MultiText]:
     try:
         start = arrow.get(date)
         end = start.shift(days=1) if ymd == "day" else start.shift(months=1)
-    except arrow.parser.ParserError:
+    except (arrow.parser.ParserError, ValueError):
         err = err1 if ymd == "day" else err2
         return Err(err)
 
@@ -230,31 +418,78 @@ def get_dates(date: str, ymd: str) -> Result[tuple[int, int], MultiText]:
     return Ok((start.int_timestamp, end.int_timestamp))
 
 
+def get_date_range(
+    date_from: str | None, date_to: str | None
+) -> Result[tuple[int, int], MultiText]:
+    """把 YYYY-MM-DD (本地时间) 转换为范围 [start, end), 包括 date_to 当天。
+
+    省略 date_from 表示从最早的事件开始，省略 date_to 表示到现在为止。
+    """
+    start, end = 0, model.now() + 1
+    try:
+        if date_from:
+            start = arrow.get(date_from, DateFormat, tzinfo="local").int_timestamp
+        if date_to:
+            day = arrow.get(date_to, DateFormat, tzinfo="local")
+            end = day.shift(days=1).int_timestamp
+    except (arrow.parser.ParserError, ValueError):
+        date = date_to if date_from is None else f"{date_from} / {date_to}"
+        err = MultiText(
+            cn=f"日期格式错误: {date}  正确示范: 2022-05-01",
+            en=f"Wrong date: {date}  A correct example: 2022-05-01",
+        )
+        return Err(err)
+    return Ok((start, end))
+
+
 def get_events_by_date(
-    conn: Conn, date: str, d_or_m: str
+    conn: Conn, date: str, d_or_m: str, task_id: str | None = None
 ) -> Result[list[Event], MultiText]:
+    """task_id 为 None 时不限任务类型"""
     match get_dates(date, d_or_m):
         case Err(err):
             return Err(err)
         case Ok((start, end)):
+            schemas = attach_archives(conn, start, end)
+            query = (
+                stmt.Get_events_by_date_in
+                if task_id is None
+                else stmt.Get_task_events_by_date_in
+            )
+            param = dict(start=start, end=end, task_id=task_id)
             rows = conn.execute(
-                stmt.Get_events_by_date, dict(start=start, end=end)
+                union_query(query, schemas) + " ORDER BY started DESC;", param
             ).fetchall()
-            events = [Event(dict(row)) for row in rows]
+            events = [load_event(conn, row) for row in rows]
             return Ok(events)
         case _:
             raise UnknownReturn
 
 
-def count_events_by_date(conn: Conn, start: int, end: int) -> int:
-    row = conn.execute(
-        stmt.Count_events_by_date, dict(start=start, end=end)
-    ).fetchone()
-    return row[0]
+def get_events_range(conn: Conn, start: int, end: int) -> list[Event]:
+    """取得 [start, end) 范围内的全部事件，按开始时间升序排列。"""
+    rows = conn.execute(
+        stmt.Get_events_by_date_asc, dict(start=start, end=end)
+    ).fetchall()
+    return [load_event(conn, row) for row in rows]
+
+
+def count_events_by_date(
+    conn: Conn, start: int, end: int, task_id: str | None = None
+) -> int:
+    schemas = attach_archives(conn, start, end)
+    query = (
+        stmt.Count_events_by_date_in
+        if task_id is None
+        else stmt.Count_task_events_by_date_in
+    )
+    param = dict(start=start, end=end, task_id=task_id)
+    rows = conn.execute(union_query(query, schemas), param).fetchall()
+    return sum(row[0] for row in rows)
 
 
 def events_year_count(
-    conn: Conn, year: str
+    conn: Conn, year: str, task_id: str | None = None
 ) -> Result[list[tuple[str, int]], MultiText]:
     match get_dates(year, "year"):
         case Err(err):
@@ -267,7 +502,7 @@ def events_year_count(
                 start = arrow.get(date)
                 end = start.shift(months=1)
                 count = count_events_by_date(
-                    conn, start.int_timestamp, end.int_timestamp
+                    conn, start.int_timestamp, end.int_timestamp, task_id
                 )
                 count_list.append(count)
 
@@ -277,6 +512,17 @@ def events_year_count(
             raise UnknownReturn
 
 
+def day_work(conn: Conn, start: int, end: int) -> dict[str, int]:
+    """[start, end) 范围内每天 (本地时间) 的工作时长合计 {YYYY-MM-DD: 秒}"""
+    compact_pending(conn)
+    schemas = attach_archives(conn, start, end)
+    query = union_query(stmt.Get_day_work_in, schemas)
+    result: dict[str, int] = {}
+    for day, work in conn.execute(query, dict(start=start, end=end)):
+        result[day] = result.get(day, 0) + work
+    return result
+
+
 def update_laps(conn: Conn, event: Event) -> None:
     data = event.to_dict()
     conn_update(
@@ -291,10 +537,471 @@ def update_laps(conn: Conn, event: Event) -> None:
     ).unwrap()
 
 
+def insert_lap_op(
+    conn: Conn,
+    event_id: str,
+    op: str,
+    at: int,
+    cfg: Config | None = None,
+    snapshot: bytes | None = None,
+    compacted: int = 0,
+) -> None:
+    """cfg 是执行操作时的设置 (start 与 edit 不需要)"""
+    limits = {} if cfg is None else dict(cfg)
+    conn.execute(
+        stmt.Insert_lap_op,
+        dict(
+            event_id=event_id,
+            op=op,
+            at=at,
+            split_min=limits.get("split_min"),
+            pause_min=limits.get("pause_min"),
+            pause_max=limits.get("pause_max"),
+            snapshot=snapshot,
+            compacted=compacted,
+        ),
+    )
+
+
+def append_lap_op(
+    conn: Conn, event: Event, op: str, at: int, cfg: Config
+) -> None:
+    """记录已在内存中执行的操作 event.apply(op, cfg, at).
+
+    平时只插入一行 lap_op, 事件结束或未压缩的操作达到 CompactOps 个时，
+    才把 laps 写回 event 表 (压缩)。
+    """
+    insert_lap_op(conn, event.id, op, at, cfg)
+    if event.status is model.EventStatus.Stopped:
+        compact_event(conn, event)
+        return
+    row = conn.execute(stmt.Count_pending_lap_ops, (event.id,)).fetchone()
+    if row[0] >= CompactOps:
+        compact_event(conn, event)
+
+
+def compact_event(conn: Conn, event: Event) -> None:
+    """event 是已重放全部操作的事件"""
+    update_laps(conn, event)
+    conn.execute(stmt.Compact_lap_ops, (event.id,))
+
+
+def save_edit(conn: Conn, event: Event) -> None:
+    """直接修改 laps/work 后 (不是 split/pause/resume/stop) 保存事件，
+    并记录修改后的快照，撤销时可以从该快照重放。
+    """
+    compact_event(conn, event)
+    snapshot = model.pack((event.status.name, event.laps, event.work))
+    insert_lap_op(
+        conn, event.id, "edit", model.now(), snapshot=snapshot, compacted=1
+    )
+
+
+def replay(event: Event, ops: Iterable) -> Event:
+    """按顺序重放操作 (op, at, split_min, pause_min, pause_max)"""
+    for op, at, split_min, pause_min, pause_max in ops:
+        cfg = Config(
+            split_min=split_min, pause_min=pause_min, pause_max=pause_max
+        )
+        event.apply(op, cfg, at)
+    return event
+
+
+def load_event(conn: Conn, row: sqlite3.Row) -> Event:
+    """event.laps 加上尚未压缩的操作 (已结束的事件不会有未压缩的操作)"""
+    event = Event(dict(row))
+    if event.status is not model.EventStatus.Stopped:
+        ops = conn.execute(stmt.Get_pending_lap_ops, (event.id,)).fetchall()
+        replay(event, ops)
+    return event
+
+
+def compact_pending(conn: Conn) -> None:
+    """压缩全部未压缩的操作 (直接读取 event 表的统计之前调用)
+
+    只读连接则用一个临时的读写连接压缩 (很短的写事务)。
+    conn.skip_compact 为真时什么也不做，由持有该连接的程序负责压缩。
+    """
+    if getattr(conn, "skip_compact", False):
+        return
+    rows = conn.execute(stmt.Get_pending_event_ids).fetchall()
+    if not rows:
+        return
+    if getattr(conn, "readonly", False):
+        with connect(str(db_file(conn))) as rw_conn:
+            compact_pending(rw_conn)
+        rw_conn.close()
+        return
+    with conn:
+        for (event_id,) in rows:
+            row = conn.execute(stmt.Get_event_by_id, (event_id,)).fetchone()
+            compact_event(conn, load_event(conn, row))
+
+
+def undo_last_op(
+    conn: Conn, event_id: str
+) -> Result[Event | None, MultiText]:
+    """撤销该事件的最后一个操作。
+
+    撤销 start 即删除该事件 (返回 None), 其他情况从最近的 start 或 edit
+    重放其余的操作，返回撤销后的事件。
+    """
+    ops = conn.execute(stmt.Get_lap_ops, (event_id,)).fetchall()
+    if not ops:
+        err = MultiText(
+            cn=f"该事件没有操作记录，不能撤销: {event_id}",
+            en=f"No operation log of this event, cannot undo: {event_id}",
+        )
+        return Err(err)
+
+    last = ops[-1]
+    if last["op"] == "start":
+        delete_event(conn, event_id)
+        return Ok(None)
+
+    ops = ops[:-1]
+    bases = [i for i, op in enumerate(ops) if op["op"] in ("start", "edit")]
+    if not bases:
+        err = MultiText(
+            cn=f"该事件的操作记录不完整，不能撤销: {event_id}",
+            en=f"Incomplete operation log, cannot undo: {event_id}",
+        )
+        return Err(err)
+
+    base = ops[bases[-1]]
+    row = conn.execute(stmt.Get_event_by_id, (event_id,)).fetchone()
+    data = dict(row)
+    if base["op"] == "start":
+        data.update(status="Running", laps=None, work=0)
+    else:
+        status, laps, work = model.unpack(base["snapshot"])
+        data.update(status=status, laps=model.pack(laps), work=work)
+    event = Event(data)
+    replay(event, [tuple(op)[1:6] for op in ops[bases[-1] + 1 :]])
+
+    conn.execute(stmt.Delete_lap_op, (last["id"],))
+    compact_event(conn, event)
+    return Ok(event)
+
+
 def delete_event(conn: Conn, event_id: str) -> None:
     conn_update(conn, stmt.Delete_event, (event_id,)).unwrap()
 
 
-def delete_task(conn: Conn, task_id: str) -> None:
-    conn_update(conn, stmt.Delete_events, (task_id,)).unwrap()
-    conn_update(conn, stmt.Delete_task, (task_id,)).unwrap()
+def merge_events(conn: Conn, merged: list[tuple[Event, list[str]]]) -> None:
+    """在同一个事务中保存全部合并结果。
+
+    merged 中的每一项是 (合并后的事件, 被合并并需要删除的事件ID列表)。
+    """
+    updates = [
+        dict(laps=model.pack(e.laps), work=e.work, notes=e.notes, id=e.id)
+        for e, _ in merged
+    ]
+    deleted = [(e_id,) for _, ids in merged for e_id in ids]
+    with conn:
+        conn_update(conn, stmt.Update_merged_event, updates, many=True).unwrap()
+        conn_update(conn, stmt.Delete_event, deleted, many=True).unwrap()
+        for e, _ in merged:
+            snapshot = model.pack((e.status.name, e.laps, e.work))
+            insert_lap_op(
+                conn, e.id, "edit", model.now(), snapshot=snapshot, compacted=1
+            )
+
+
+def count_task_events(conn: Conn, task_id: str) -> int:
+    """包括归档数据库中的事件"""
+    total = 0
+    for schema in attach_all_archives(conn):
+        query = stmt.Count_task_events_in.format(schema=schema)
+        total += conn.execute(query, (task_id,)).fetchone()[0]
+    return total
+
+
+def delete_task(
+    conn: Conn,
+    task_id: str,
+    batch: int = DeleteBatch,
+    progress: Callable[[int], None] | None = None,
+) -> int:
+    """分批删除该任务类型的全部事件，最后删除任务类型本身。
+
+    归档数据库中该任务类型的事件及任务类型也一并删除，否则 report 等
+    合并归档数据库的查询仍会显示已删除的任务类型。
+    每批事件在一个独立的事务中删除 (lap_op 由 ON DELETE CASCADE 删除),
+    每批之后调用 progress(已删除的事件数量)。返回删除的事件数量。
+    """
+    conn.commit()
+    schemas = attach_all_archives(conn)
+    deleted = 0
+    for schema in schemas:
+        query = stmt.Delete_task_events_batch_in.format(schema=schema)
+        while True:
+            with conn:
+                n = conn.execute(query, (task_id, batch)).rowcount
+            deleted += n
+            if n > 0 and progress is not None:
+                progress(deleted)
+            if n < batch:
+                break
+
+    # 删除期间其他终端新增的事件由 ON DELETE CASCADE 删除。
+    with conn:
+        for schema in schemas[1:]:
+            conn.execute(stmt.Delete_task_in.format(schema=schema), (task_id,))
+        conn_update(conn, stmt.Delete_task, (task_id,)).unwrap()
+    invalidate_tasks(conn)
+    return deleted
+
+
+def db_file(conn: Conn) -> Path:
+    """数据库连接 (main) 所对应的文件。"""
+    for row in conn.execute("PRAGMA database_list;"):
+        if row["name"] == "main":
+            return Path(row["file"])
+    raise UnknownReturn
+
+
+def local_year(t: int) -> int:
+    return arrow.get(t).to("local").year
+
+
+def year_range(year: int) -> tuple[int, int]:
+    """本地时间一整年的范围 [start, end)"""
+    start = arrow.get(year, 1, 1, tzinfo="local")
+    return start.int_timestamp, start.shift(years=1).int_timestamp
+
+
+def archive_path(conn: Conn, year: int) -> Path:
+    return db_file(conn).with_name(ArchiveFilename.format(year=year))
+
+
+def archive_years(conn: Conn) -> list[int]:
+    """已存在的归档数据库的年份"""
+    prefix, suffix = ArchiveFilename.split("{year}")
+    years = []
+    for f in db_file(conn).parent.glob(ArchiveFilename.format(year="*")):
+        year = f.name.removeprefix(prefix).removesuffix(suffix)
+        if year.isdigit():
+            years.append(int(year))
+    return sorted(years)
+
+
+def attach_archive(conn: Conn, year: int) -> str:
+    schema = f"archive_{year}"
+    attached = [row["name"] for row in conn.execute("PRAGMA database_list;")]
+    if schema not in attached:
+        conn.execute(
+            f"ATTACH DATABASE ? AS {schema};", (str(archive_path(conn, year)),)
+        )
+    return schema
+
+
+def attach_archives(conn: Conn, start: int, end: int) -> list[str]:
+    """ATTACH 与 [start, end) 有重叠的归档数据库，返回全部需要查询的 schema.
+
+    返回值的第一项总是 "main".
+    """
+    schemas = ["main"]
+    for year in archive_years(conn):
+        y_start, y_end = year_range(year)
+        if y_start < end and start < y_end:
+            schemas.append(attach_archive(conn, year))
+    return schemas
+
+
+def attach_all_archives(conn: Conn) -> list[str]:
+    """ATTACH 全部归档数据库，返回全部 schema, 第一项总是 "main"."""
+    return ["main"] + [attach_archive(conn, y) for y in archive_years(conn)]
+
+
+def union_query(query: str, schemas: list[str]) -> str:
+    return " UNION ALL ".join(query.format(schema=s) for s in schemas)
+
+
+def get_archived_event(conn: Conn, event_id: str) -> Result[Event, MultiText]:
+    """根据事件ID (时间戳) 在归档数据库中查找事件。"""
+    err = MultiText(
+        cn=f"找不到此事件: {event_id}", en=f"Event Not Found: {event_id}"
+    )
+    try:
+        year = local_year(int(event_id, 36))
+    except (ValueError, OverflowError):
+        return Err(err)
+
+    if year not in archive_years(conn):
+        return Err(err)
+
+    schema = attach_archive(conn, year)
+    row = conn.execute(
+        f"SELECT * FROM {schema}.event WHERE id=?;", (event_id,)
+    ).fetchone()
+    if row is None:
+        return Err(err)
+    return Ok(Event(dict(row)))
+
+
+def incremental_vacuum(conn: Conn) -> None:
+    """归还空闲页。旧数据库需要先转换为 incremental 模式 (只需一次)。"""
+    conn.commit()
+    mode = conn.execute("PRAGMA auto_vacuum;").fetchone()[0]
+    if mode != 2:
+        conn.execute(stmt.Enable_incremental_vacuum)
+        conn.execute("VACUUM;")
+    else:
+        conn.execute("PRAGMA incremental_vacuum;").fetchall()
+
+
+def archive_events(conn: Conn, before: int) -> list[tuple[int, int]]:
+    """把 before 年之前的已结束事件按年份移动到归档数据库。
+
+    返回 [(年份, 事件数量)]
+    """
+    end = year_range(before)[0]
+    years = [row[0] for row in conn.execute(stmt.Get_archive_years, dict(end=end))]
+
+    result = []
+    for year in sorted(years):
+        path = archive_path(conn, year)
+        new_file = not path.exists()
+        with connect(str(path)) as archive_conn:
+            if new_file:
+                create_tables(archive_conn)
+            else:
+                migrate(archive_conn)  # 旧的归档数据库可能没有 lap_op 表
+        archive_conn.close()
+
+        schema = attach_archive(conn, year)
+        y_start, y_end = year_range(year)
+        param = dict(start=y_start, end=min(y_end, end))
+        with conn:
+            conn.execute(stmt.Archive_tasks.format(schema=schema), param)
+            conn.execute(stmt.Archive_events.format(schema=schema), param)
+            conn.execute(stmt.Archive_lap_ops.format(schema=schema), param)
+            n = conn.execute(stmt.Delete_archived_events, param).rowcount
+            # 归档不是删除，不能让其他设备在同步时删除这些事件。
+            conn.execute(
+                stmt.Delete_archived_tombstones.format(schema=schema), param
+            )
+        conn.execute(f"VACUUM {schema};")
+        conn.execute(f"DETACH DATABASE {schema};")
+        result.append((year, n))
+
+    if result:
+        incremental_vacuum(conn)
+    return result
+
+
+def backup(conn: Conn, dest: Path) -> Result[str, MultiText]:
+    """使用 sqlite3 backup API 在线备份数据库到 dest, 并检查备份文件的完整性。
+
+    先写入临时文件，检查通过后再改名为 dest, 因此 dest 要么是完整的备份，要么不存在。
+    """
+    temp = dest.with_name(dest.name + ".tmp")
+    target = sqlite3.connect(temp)
+    try:
+        conn.backup(target, pages=BackupPages)
+        check = target.execute("PRAGMA integrity_check;").fetchone()[0]
+    finally:
+        target.close()
+
+    if check != "ok":
+        temp.unlink()
+        err = MultiText(
+            cn=f"备份文件完整性检查失败: {check}",
+            en=f"Integrity check of the backup failed: {check}",
+        )
+        return Err(err)
+
+    os.replace(temp, dest)
+    return OK
+
+
+def db_files(conn: Conn) -> list[Path]:
+    """数据库文件及同一文件夹中的全部归档数据库"""
+    archives = [archive_path(conn, year) for year in archive_years(conn)]
+    return [db_file(conn)] + archives
+
+
+def copy_db_files(conn: Conn, folder: Path) -> Result[str, MultiText]:
+    """把数据库及全部归档数据库复制到 folder (移动数据库的第一步)。
+
+    先把 WAL 写回数据库文件再复制。任何一个文件失败都会删除已复制的文件，
+    因此要么全部复制成功，要么 folder 中没有新文件。
+    """
+    files = db_files(conn)
+    exists = [f.name for f in files if folder.joinpath(f.name).exists()]
+    if exists:
+        err = MultiText(
+            cn=f"目标文件夹中已存在: {', '.join(exists)}",
+            en=f"Already exists in the folder: {', '.join(exists)}",
+        )
+        return Err(err)
+
+    copied: list[Path] = []
+    for f in files:
+        dest = folder.joinpath(f.name)
+        if f == files[0]:
+            conn.execute(stmt.Checkpoint_wal)
+            r = backup(conn, dest)
+        else:
+            with connect(str(f)) as archive_conn:
+                archive_conn.execute(stmt.Checkpoint_wal)
+                r = backup(archive_conn, dest)
+            archive_conn.close()
+        if r.is_err():
+            for c in copied:
+                c.unlink()
+            return r
+        copied.append(dest)
+    return OK
+
+
+def remove_db_files(files: list[Path]) -> None:
+    """删除数据库文件及其 -wal, -shm 文件 (须先关闭全部连接)"""
+    for f in files:
+        for suffix in ("", "-wal", "-shm"):
+            f.with_name(f.name + suffix).unlink(missing_ok=True)
+
+
+def backup_snapshot(
+    conn: Conn, folder: Path, time: str
+) -> Result[Path, MultiText]:
+    """把数据库及全部归档数据库备份到 folder 中的快照文件夹 (见 BackupFolderName)。
+
+    先写入临时文件夹，全部文件复制并检查通过后再改名，因此快照文件夹要么
+    是完整的备份，要么不存在。
+    """
+    dest = folder.joinpath(BackupFolderName.format(time=time))
+    temp = dest.with_name(dest.name + ".tmp")
+    shutil.rmtree(temp, ignore_errors=True)  # 上一次失败留下的
+    temp.mkdir()
+    r = copy_db_files(conn, temp)
+    if r.is_err():
+        shutil.rmtree(temp)
+        return Err(r.unwrap_err())
+    os.replace(temp, dest)
+    return Ok(dest)
+
+
+def backup_files(folder: Path) -> list[Path]:
+    """文件夹中的全部备份 (快照文件夹及旧版本的备份文件)，从旧到新排列。"""
+    pattern = "[0-9]" * 8 + "-" + "[0-9]" * 6  # BackupTimeFormat
+    files = list(folder.glob(BackupFilename.format(time=pattern)))
+    files += [
+        f
+        for f in folder.glob(BackupFolderName.format(time=pattern))
+        if f.is_dir()
+    ]
+    return sorted(files, key=lambda f: f.name.removesuffix(".db"))
+
+
+def rotate_backups(folder: Path, keep: int) -> list[Path]:
+    """只保留最新的 keep 个备份，返回被删除的备份 (整个快照)。"""
+    files = backup_files(folder)
+    removed = files[:-keep] if keep > 0 else []
+    for f in removed:
+        if f.is_dir():
+            shutil.rmtree(f)
+        else:
+            f.unlink()
+    return removed
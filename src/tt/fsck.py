@@ -0,0 +1,236 @@
+"""数据完整性检查与修复 (tt fsck)
+
+event.work 是工作小节长度的合计 (冗余数据), 另外 laps 的时间、事件状态、
+task_id 之间也存在约束。本模块逐行流式读取全部事件进行检查，只在内存中
+保存有问题的事件，修复时分批提交。
+"""
+
+from dataclasses import dataclass, field
+from typing import Final, Iterable
+
+from . import db, model, stmt
+from .model import EventStatus, Lap, LapName
+
+SplitName: Final = LapName.Split.name
+PauseName: Final = LapName.Pause.name
+
+FixBatch: Final = 1000
+"""修复时每个事务更新的事件数量"""
+
+OrphanTaskName: Final = "lost-{task_id}"
+"""修复孤立的 task_id 时创建的任务类型的名称"""
+
+
+@dataclass
+class Problem:
+    event_id: str
+    kind: str
+    """work, lap, order, status, orphan"""
+    detail: str
+    fixable: bool
+
+
+@dataclass
+class Fix:
+    """一个事件修复后的 status, laps, work"""
+
+    event_id: str
+    status: str
+    laps: tuple[Lap, ...]
+    work: int
+
+
+@dataclass
+class CheckResult:
+    events: int = 0
+    problems: list[Problem] = field(default_factory=list)
+    fixes: list[Fix] = field(default_factory=list)
+    orphans: list[str] = field(default_factory=list)
+    """不存在于 task 表中的 task_id"""
+
+
+ExpectedStatus: Final = {
+    SplitName: EventStatus.Running.name,
+    PauseName: EventStatus.Pausing.name,
+}
+"""最后一个小节未结束时，事件的状态由该小节的类型决定。"""
+
+
+def event_ok(started: int, status: str, laps: tuple[Lap, ...], work: int):
+    """快速检查 (绝大多数事件都没有问题), 不通过再用 check_laps 找出问题。"""
+    prev_end = started
+    total = 0
+    open_lap = None
+    for name, start, end, length in laps:
+        if open_lap is not None or start < prev_end:
+            return False
+        if end:
+            if end - start != length:
+                return False
+            prev_end = end
+        else:
+            open_lap = name
+            prev_end = start
+        if name == SplitName:
+            total += length
+        elif name != PauseName:
+            return False
+    if total != work:
+        return False
+    if open_lap is None:
+        return status == EventStatus.Stopped.name
+    return ExpectedStatus[open_lap] == status
+
+
+def check_laps(
+    event_id: str, started: int, status: str, laps: tuple[Lap, ...]
+) -> tuple[list[Problem], tuple[Lap, ...], str]:
+    """返回 (问题列表, 修复后的 laps, 修复后的 status)"""
+    problems = []
+    fixed: list[Lap] = []
+    prev_end = started
+    for i, (name, start, end, length) in enumerate(laps):
+        last = i == len(laps) - 1
+        if name not in (SplitName, PauseName):
+            problems.append(
+                Problem(event_id, "lap", f"lap {i}: bad name {name!r}", False)
+            )
+        if start < prev_end:
+            problems.append(
+                Problem(
+                    event_id,
+                    "order",
+                    f"lap {i}: starts at {start}, before {prev_end}",
+                    False,
+                )
+            )
+        if end == 0:
+            if not last:
+                problems.append(
+                    Problem(event_id, "lap", f"lap {i}: not closed", False)
+                )
+            prev_end = start
+        elif end < start:
+            problems.append(
+                Problem(event_id, "order", f"lap {i}: ends before start", False)
+            )
+            prev_end = start
+        else:
+            if length != end - start:
+                problems.append(
+                    Problem(
+                        event_id,
+                        "lap",
+                        f"lap {i}: length {length} != {end - start}",
+                        True,
+                    )
+                )
+                length = end - start
+            prev_end = end
+        fixed.append((name, start, end, length))
+
+    if not laps:
+        end = -1  # 没有小节，视为已结束
+    else:
+        name, _, end, _ = laps[-1]
+    if end != 0 and status != EventStatus.Stopped.name:
+        problems.append(
+            Problem(event_id, "status", f"{status}, but no open lap", True)
+        )
+        status = EventStatus.Stopped.name
+    elif end == 0 and status != ExpectedStatus.get(name):
+        problems.append(
+            Problem(
+                event_id, "status", f"{status}, but last lap is {name}", False
+            )
+        )
+    return problems, tuple(fixed), status
+
+
+def check_event(
+    event_id: str, started: int, status: str, laps: tuple[Lap, ...], work: int
+) -> tuple[list[Problem], Fix | None]:
+    problems, laps, status = check_laps(event_id, started, status, laps)
+    lap_work = sum(lap[3] for lap in laps if lap[0] == SplitName)
+    if lap_work != work:
+        problems.append(
+            Problem(event_id, "work", f"work {work} != laps {lap_work}", True)
+        )
+    if not any(p.fixable for p in problems):
+        return problems, None
+    return problems, Fix(event_id, status, laps, lap_work)
+
+
+def check(conn: db.Conn) -> CheckResult:
+    db.compact_pending(conn)
+    result = CheckResult()
+    cursor = conn.cursor()
+    cursor.row_factory = None  # 普通的 tuple 比 sqlite3.Row 快
+    unpack = model.unpack
+    for event_id, started, status, blob, work in cursor.execute(
+        stmt.Get_events_for_check
+    ):
+        result.events += 1
+        laps = unpack(blob)
+        if event_ok(started, status, laps, work):
+            continue
+        problems, fix = check_event(event_id, started, status, laps, work)
+        result.problems.extend(problems)
+        if fix is not None:
+            result.fixes.append(fix)
+
+    for (task_id,) in conn.execute(stmt.Get_orphan_task_ids):
+        fixable = task_id is not None
+        if fixable:
+            result.orphans.append(task_id)
+        result.problems.append(
+            Problem("", "orphan", f"task_id {task_id!r} not found", fixable)
+        )
+    return result
+
+
+def batched(items: list, n: int) -> Iterable[list]:
+    for i in range(0, len(items), n):
+        yield items[i : i + n]
+
+
+def repair(
+    conn: db.Conn, result: CheckResult, batch: int = FixBatch
+) -> int:
+    """分批提交全部可修复的问题，返回修复的事件数量 (不包括孤立的 task_id)"""
+    for fixes in batched(result.fixes, batch):
+        param = [
+            dict(
+                status=f.status,
+                laps=model.pack(f.laps),
+                work=f.work,
+                id=f.event_id,
+            )
+            for f in fixes
+        ]
+        edits = [
+            dict(
+                event_id=f.event_id,
+                op="edit",
+                at=model.now(),
+                split_min=None,
+                pause_min=None,
+                pause_max=None,
+                snapshot=model.pack((f.status, f.laps, f.work)),
+                compacted=1,
+            )
+            for f in fixes
+        ]
+        with conn:
+            conn.executemany(stmt.Update_laps, param)
+            conn.executemany(stmt.Insert_lap_op, edits)
+
+    # 为孤立的 task_id 创建任务类型，使这些事件重新可见。
+    with conn:
+        for task_id in result.orphans:
+            name = OrphanTaskName.format(task_id=task_id)
+            conn.execute(
+                stmt.Insert_task, dict(id=task_id, name=name, alias="")
+            )
+    db.invalidate_tasks(conn)
+    return len(result.fixes)
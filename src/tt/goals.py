@@ -0,0 +1,113 @@
+"""每个任务类型的每日及每周目标 (tt goals)
+
+目标保存在 metadata 表中 (与 meta-config 并列):
+
+    {task_id: {"day": 秒, "week": 秒}}
+
+进度读取 daily_work 表 (由触发器增量更新，见 stmt.Daily_work_schema),
+今天只读一行，本周最多七行，与事件的数量无关。正在计时的事件可能还有
+未压缩的操作，因此另外用重放后的工作时长 (加上正在进行的工作小节) 修正。
+"""
+
+from dataclasses import dataclass
+from typing import Final
+
+import arrow
+
+from . import cache, db, stmt
+from .model import EventStatus, LapName
+
+GoalsName: Final = "meta-goals"
+Periods: Final = ("day", "week")
+
+Goals = dict[str, dict[str, int]]
+"""{task_id: {"day": 秒, "week": 秒}}"""
+
+
+@dataclass
+class Progress:
+    task_id: str
+    period: str
+    """day 或 week"""
+    target: int
+    done: int
+
+    def percent(self) -> int:
+        return self.done * 100 // self.target if self.target else 100
+
+
+def get_goals(conn: db.Conn) -> Goals:
+    return db.get_meta(conn, GoalsName) or {}
+
+
+def set_goal(conn: db.Conn, task_id: str, period: str, target: int) -> None:
+    """target 为 0 表示删除该目标"""
+    goals = get_goals(conn)
+    task_goals = goals.setdefault(task_id, {})
+    if target > 0:
+        task_goals[period] = target
+    else:
+        task_goals.pop(period, None)
+    if not task_goals:
+        del goals[task_id]
+    db.set_meta(conn, GoalsName, goals)
+
+
+def period_range(period: str, now: arrow.Arrow) -> tuple[str, str]:
+    """[start, end) 本地日期 (YYYY-MM-DD)"""
+    start = now.floor(period)  # type: ignore[arg-type]
+    end = start.shift(days=1 if period == "day" else 7)
+    return start.format("YYYY-MM-DD"), end.format("YYYY-MM-DD")
+
+
+def sum_work(conn: db.Conn, start: str, end: str) -> dict[str, int]:
+    def compute() -> dict[str, int]:
+        rows = conn.execute(stmt.Sum_daily_work, dict(start=start, end=end))
+        return dict(rows.fetchall())
+
+    return cache.cached(conn, "daily_work", (start, end), compute)
+
+
+def running_delta(conn: db.Conn, now: arrow.Arrow) -> tuple[str, int, int]:
+    """(task_id, started, 秒): 最新的事件尚未计入 daily_work 的工作时长"""
+    r = db.get_last_event(conn)
+    if r.is_err():
+        return "", 0, 0
+    event = r.unwrap()
+    if event.status is EventStatus.Stopped:
+        return "", 0, 0
+
+    work = event.work
+    name, start, end, _ = event.laps[-1]
+    if name == LapName.Split.name and end == 0:
+        work += max(0, now.int_timestamp - start)
+    row = conn.execute(stmt.Get_event_work, (event.id,)).fetchone()
+    return event.task_id, event.started, work - row[0]
+
+
+def progress(
+    conn: db.Conn,
+    task_id: str | None = None,
+    now: arrow.Arrow | None = None,
+) -> list[Progress]:
+    """全部目标 (或 task_id 的目标) 在今天及本周的进度"""
+    now = arrow.now() if now is None else now
+    goals = get_goals(conn)
+    if task_id is not None:
+        goals = {task_id: goals[task_id]} if task_id in goals else {}
+    if not goals:
+        return []
+
+    running_task, started, delta = running_delta(conn, now)
+    started_day = arrow.get(started).to("local").format("YYYY-MM-DD")
+    result = []
+    for period in Periods:
+        start, end = period_range(period, now)
+        totals = sum_work(conn, start, end)
+        if delta and start <= started_day < end:
+            totals[running_task] = totals.get(running_task, 0) + delta
+        for t_id, task_goals in goals.items():
+            if period in task_goals:
+                done = totals.get(t_id, 0)
+                result.append(Progress(t_id, period, task_goals[period], done))
+    return sorted(result, key=lambda p: (p.task_id, Periods.index(p.period)))
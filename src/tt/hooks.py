@@ -0,0 +1,211 @@
+"""事件状态转换 (start/split/pause/resume/stop) 之后执行的用户钩子
+
+配置文件 tt-focus-hooks.json 与 tt-focus.cfg 在同一个文件夹：
+
+    {
+        "timeout": 10,
+        "stop": ["notify-send 'tt: stopped'", "mypkg.hooks:on_stop"],
+        "*": ["~/bin/tt-log"]
+    }
+
+"*" 表示全部操作。"模块:函数" 形式的钩子是 Python 函数 (参数是一个 dict),
+其他的是命令 (数据以 JSON 从 stdin 传入，另有环境变量 TT_OP 等)。
+
+tt 在提交数据库事务之后，只读取这个小小的配置文件，然后启动一个脱离的
+后台进程 (python -m tt.hooks) 并立即返回，不等待钩子。后台进程用线程池
+并行执行钩子，每个钩子都有超时，执行时间记录在 tt-focus-hooks.log 中
+(可用 tt hooks 查看)。
+"""
+
+import importlib
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from pathlib import Path
+from typing import Final
+
+HooksFilename: Final = "tt-focus-hooks.json"
+HooksLogFilename: Final = "tt-focus-hooks.log"
+AnyOp: Final = "*"
+DefaultTimeout: Final = 10
+"""每个钩子的超时 (秒)"""
+MaxWorkers: Final = 4
+LogKeep: Final = 1000
+"""日志文件超过这么多行时，只保留最新的一半。"""
+
+PythonHook: Final = re.compile(r"^[\w.]+:[\w.]+$")
+
+
+def load_config(path: Path) -> dict:
+    """配置文件不存在或格式错误时返回空字典 (不能影响 tt 本身)"""
+    try:
+        config = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return config if isinstance(config, dict) else {}
+
+
+def hooks_for(config: dict, op: str) -> list[str]:
+    hooks = []
+    for key in (op, AnyOp):
+        value = config.get(key, [])
+        hooks += [value] if isinstance(value, str) else list(value)
+    return hooks
+
+
+def fire(config_dir: Path, op: str, data: dict) -> bool:
+    """启动后台进程执行钩子 (不等待)。没有钩子时返回 False."""
+    config = load_config(config_dir.joinpath(HooksFilename))
+    hooks = hooks_for(config, op)
+    if not hooks:
+        return False
+
+    job = dict(
+        op=op,
+        data=data,
+        hooks=hooks,
+        timeout=config.get("timeout", DefaultTimeout),
+        log=str(config_dir.joinpath(HooksLogFilename)),
+    )
+    kwargs: dict = dict(
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        close_fds=True,
+    )
+    if sys.platform == "win32":
+        kwargs["creationflags"] = (
+            subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+        )
+    else:
+        kwargs["start_new_session"] = True
+    src = str(Path(__file__).parents[1])
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [src, env.get("PYTHONPATH")])
+    )
+    try:
+        subprocess.Popen(
+            [sys.executable, "-m", "tt.hooks", json.dumps(job)],
+            env=env,
+            **kwargs,
+        )
+    except OSError:
+        return False
+    return True
+
+
+def call_python(hook: str, data: dict) -> None:
+    module, _, name = hook.partition(":")
+    func = importlib.import_module(module)
+    for attr in name.split("."):
+        func = getattr(func, attr)
+    func(data)  # type: ignore[operator]
+
+
+def run_command(hook: str, op: str, data: dict, timeout: float) -> str:
+    args = shlex.split(hook)
+    args[0] = os.path.expanduser(args[0])
+    env = dict(os.environ)
+    env.update(
+        TT_OP=op,
+        TT_EVENT_ID=data.get("id", ""),
+        TT_TASK=data.get("task", ""),
+        TT_STATUS=data.get("status", ""),
+    )
+    r = subprocess.run(
+        args,
+        input=json.dumps(data),
+        text=True,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        timeout=timeout,
+    )
+    return "ok" if r.returncode == 0 else f"exit {r.returncode}"
+
+
+def run_hook(hook: str, op: str, data: dict, timeout: float) -> str:
+    try:
+        if PythonHook.match(hook):
+            call_python(hook, data)
+            return "ok"
+        return run_command(hook, op, data, timeout)
+    except subprocess.TimeoutExpired:
+        return "timeout"
+    except Exception as e:
+        return f"error {type(e).__name__}: {e}"
+
+
+def run_all(job: dict) -> list[tuple[str, str, float]]:
+    """并行执行全部钩子，返回 [(钩子, 结果, 毫秒)]"""
+    op, data, timeout = job["op"], job["data"], job["timeout"]
+
+    def timed(hook: str) -> tuple[str, float]:
+        start = time.perf_counter()
+        status = run_hook(hook, op, data, timeout)
+        return status, (time.perf_counter() - start) * 1000
+
+    pool = ThreadPoolExecutor(max_workers=MaxWorkers)
+    futures = [(hook, pool.submit(timed, hook)) for hook in job["hooks"]]
+    deadline = time.monotonic() + timeout * len(futures)
+    results = []
+    for hook, future in futures:
+        try:
+            status, ms = future.result(max(0, deadline - time.monotonic()))
+        except TimeoutError:  # Python 函数无法中止，只能不再等待。
+            status, ms = "timeout", timeout * 1000
+        results.append((hook, status, ms))
+    pool.shutdown(wait=False, cancel_futures=True)
+    return results
+
+
+def write_log(path: Path, op: str, results: list[tuple[str, str, float]]):
+    now = time.strftime("%Y-%m-%d %H:%M:%S")
+    lines = [f"{now}\t{op}\t{ms:.1f}ms\t{s}\t{h}\n" for h, s, ms in results]
+    with path.open("a", encoding="utf-8") as f:
+        f.writelines(lines)
+    old = read_log(path)
+    if len(old) > LogKeep:
+        path.write_text("".join(old[-LogKeep // 2 :]), encoding="utf-8")
+
+
+def read_log(path: Path) -> list[str]:
+    try:
+        return path.read_text(encoding="utf-8").splitlines(keepends=True)
+    except OSError:
+        return []
+
+
+def summarize_log(lines: list[str]) -> list[tuple[str, int, float, float, str]]:
+    """各钩子的 [(钩子, 次数, 平均毫秒, 最大毫秒, 最后一次的结果)]"""
+    summary: dict[str, tuple[int, float, float, str]] = {}
+    for line in lines:
+        parts = line.rstrip("\n").split("\t")
+        if len(parts) != 5:
+            continue
+        _, _, ms_str, status, hook = parts
+        ms = float(ms_str.removesuffix("ms"))
+        n, total, max_ms, _ = summary.get(hook, (0, 0.0, 0.0, ""))
+        summary[hook] = (n + 1, total + ms, max(max_ms, ms), status)
+    return [
+        (hook, n, total / n, max_ms, status)
+        for hook, (n, total, max_ms, status) in summary.items()
+    ]
+
+
+def main() -> None:
+    job = json.loads(sys.argv[1])
+    results = run_all(job)
+    write_log(Path(job["log"]), job["op"], results)
+    sys.stdout.flush()
+    os._exit(0)  # 不等待超时的 Python 钩子线程
+
+
+if __name__ == "__main__":
+    main()
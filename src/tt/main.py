@@ -1,15 +1,17 @@
-import os
 import click
 import sqlite3
 from typing import Final, Callable
 from pathlib import Path
-import shutil
 
+from click.shell_completion import CompletionItem
 from result import Err, Ok
 
 from . import (
+    cache,
+    complete,
     model,
     db,
+    output,
     util,
     __version__,
     __package_name__,
@@ -22,20 +24,76 @@ app_cfg = db.load_app_cfg()
 db_path: Final = app_cfg["db_path"]
 lang: Final = app_cfg["lang"]
 
+# 每个命令都是新的进程，报表等查询结果缓存在磁盘上 (见 cache.py)。
+cache.use_disk(db.app_config_dir.joinpath(cache.CacheFilename))
 
-def connect() -> sqlite3.Connection:
-    return db.connect(db_path)
+
+def connect(readonly: bool = False) -> sqlite3.Connection:
+    """readonly: 只读取数据的命令使用只读连接 (见 db.connect)"""
+    return db.connect(db_path, readonly)
 
 
 def execute(func: Callable, *args):
-    with connect() as conn:
+    """只读"""
+    with connect(readonly=True) as conn:
         return func(conn, *args)
 
 
 config = execute(db.get_cfg).unwrap()
 
+
+def refresh_complete_cache() -> None:
+    """重写补全缓存。修改任务类型或创建、删除事件的命令用 ctx.call_on_close
+    注册，split/pause 等频繁执行的命令不调用 (见 complete.py)。
+    """
+    path = app_cfg["db_path"]  # 可能已被 'tt set -db' 修改
+    try:
+        with db.connect(path, readonly=True) as conn:
+            complete.refresh(conn, path, force=True)
+    except (OSError, sqlite3.Error):
+        pass  # 补全缓存不影响正常使用
+
+
+def completion_items(items: list[tuple[str, str]]) -> list[CompletionItem]:
+    return [CompletionItem(v, help=h or None) for v, h in items]
+
+
+def complete_tasks(ctx, param, incomplete: str) -> list[CompletionItem]:
+    cache = execute(complete.refresh, db_path)
+    return completion_items(complete.task_items(cache, incomplete, False))
+
+
+def complete_aliases(ctx, param, incomplete: str) -> list[CompletionItem]:
+    """任务名称及别名"""
+    cache = execute(complete.refresh, db_path)
+    return completion_items(complete.task_items(cache, incomplete))
+
+
+def complete_events(ctx, param, incomplete: str) -> list[CompletionItem]:
+    cache = execute(complete.refresh, db_path)
+    return completion_items(complete.event_items(cache, incomplete))
+
+
 CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
 
+help_json = MultiText(
+    cn="以 JSON 格式输出 (供脚本使用)", en="Output JSON (for scripts)."
+)
+help_msgpack = MultiText(
+    cn="以 msgpack 格式输出 (供脚本使用)", en="Output msgpack (for scripts)."
+)
+
+
+def output_options(func: Callable) -> Callable:
+    """添加 --json 与 --msgpack 选项 (参数名 fmt)"""
+    func = click.option(
+        "fmt", "--msgpack", flag_value="msgpack", help=help_msgpack.str(lang)
+    )(func)
+    func = click.option(
+        "fmt", "--json", flag_value="json", help=help_json.str(lang)
+    )(func)
+    return func
+
 
 def show_info(ctx, _, value):
     if not value or ctx.resilient_parsing:
@@ -43,7 +101,7 @@ def show_info(ctx, _, value):
     print()
     print(f"  [tt-focus] {__file__}")
     print(f"   [version] {__version__}")
-    with connect() as conn:
+    with connect(readonly=True) as conn:
         util.show_cfg(conn, app_cfg, config)
     ctx.exit()
 
@@ -143,8 +201,15 @@ def move_db_file(new_db_path: Path):
         cn=f"数据库文件已移动到 {new_db_path}",
         en=f"The database file is moved to {new_db_path}",
     )
-    shutil.copyfile(db_path, new_db_path)
-    os.remove(db_path)
+    # 归档数据库与 tt-focus.db 在同一文件夹 (见 db.archive_path), 需要一起移动。
+    with connect() as conn:
+        files = db.db_files(conn)
+        r = db.copy_db_files(conn, new_db_path.parent)
+    conn.close()
+    if r.is_err():
+        print(r.unwrap_err().str(lang))
+        return
+    db.remove_db_files(files)
     update_db_path(new_db_path, success)
 
 
@@ -233,7 +298,13 @@ err_no_task = MultiText(
     type=click.Path(exists=True, file_okay=False),
     help=help_set_db_folder.str(lang),
 )
-@click.option("task_name", "-t", "--task", help=help_task_name.str(lang))
+@click.option(
+    "task_name",
+    "-t",
+    "--task",
+    help=help_task_name.str(lang),
+    shell_complete=complete_tasks,
+)
 @click.option(
     "alias",
     "-alias",
@@ -244,7 +315,13 @@ err_no_task = MultiText(
     "-name",
     help=help_set_task_name.str(lang),
 )
-@click.option("event_id", "-e", "--event", help=help_event_id.str(lang))
+@click.option(
+    "event_id",
+    "-e",
+    "--event",
+    help=help_event_id.str(lang),
+    shell_complete=complete_events,
+)
 @click.option(
     "last_work",
     "--last-work",
@@ -271,6 +348,7 @@ def set_command(
 
     更改 tt-focus 的设置，或更改任务/事件的属性。
     """
+    ctx.call_on_close(refresh_complete_cache)
     if language:
         app_cfg["lang"] = language
         db.write_cfg_file(app_cfg)
@@ -346,6 +424,7 @@ help_add_alias = MultiText(
 @click.pass_context
 def add(ctx: click.Context, name: str, alias: str):
     """Add a new type of task. 新增任务类型。"""
+    ctx.call_on_close(refresh_complete_cache)
     with connect() as conn:
         match model.new_task(dict(name=name, alias=alias)):
             case Err(e):
@@ -371,6 +450,10 @@ help_text = MultiText(
     tt list rc163d  # 列出一个事件的详细内容
 
     tt list -t      # 列出全部任务类型
+
+    tt list --heatmap 2022  # 一整年的日历热力图
+
+    tt list --task coding -month 2022-05  # 只列出一种任务类型的事件
     """,
     en="""List out task or events.
 
@@ -381,6 +464,10 @@ help_text = MultiText(
     tt list rc163d  # Show details about the event
 
     tt list -t      # List out all task types
+
+    tt list --heatmap 2022  # Calendar heatmap of a year
+
+    tt list --task coding -month 2022-05  # Events of one task type only
     """,
 )
 help_list_tasks = MultiText(cn="列出全部任务类型。", en="List out all task types.")
@@ -393,6 +480,16 @@ help_list_month = MultiText(
 help_list_year = MultiText(
     cn="指定年份的每个月的事件数量 (YYYY)", en="Count events per month in a year (YYYY)"
 )
+help_list_task = MultiText(
+    cn="只列出指定任务类型的事件 (可与 -day/-month/-year 一起使用),"
+    " 注意 list 的 -t 是 --tasks",
+    en="Only events of the task (works with -day/-month/-year)."
+    " Note that -t of list is --tasks",
+)
+help_list_heatmap = MultiText(
+    cn="以日历热力图显示一整年每天的工作时长 (YYYY)",
+    en="Calendar heatmap of daily work time in a year (YYYY)",
+)
 help_list_verbose = MultiText(cn="显示更详细的信息。", en="Show more details.")
 
 
@@ -431,7 +528,20 @@ help_list_verbose = MultiText(cn="显示更详细的信息。", en="Show more de
     "-year",
     help=help_list_year.str(lang),
 )
-@click.argument("event_id", required=False)
+@click.option(
+    "heatmap",
+    "-heatmap",
+    "--heatmap",
+    help=help_list_heatmap.str(lang),
+)
+@click.option(
+    "task_name",
+    "--task",
+    help=help_list_task.str(lang),
+    shell_complete=complete_aliases,
+)
+@output_options
+@click.argument("event_id", required=False, shell_complete=complete_events)
 @click.pass_context
 def list_command(
     ctx: click.Context,
@@ -441,26 +551,74 @@ def list_command(
     day: str,
     month: str,
     year: str,
+    heatmap: str,
+    task_name: str | None,
+    fmt: str | None,
 ):
     """List out tasks or events. 任务列表或事件列表。"""
-    with connect() as conn:
-        if t:
+    with connect(readonly=True) as conn:
+        match util.get_task_id(conn, task_name):
+            case Err(err):
+                if fmt:
+                    output.emit_error(err, fmt)
+                else:
+                    print(err.str(lang))
+                ctx.exit()
+            case Ok(task_id):
+                pass
+
+        if fmt:
+            list_output(
+                conn, fmt, t, event_id, day, month, year, heatmap, task_id
+            )
+        elif t:
             tasks = db.get_all_task(conn)
             util.show_tasks(tasks, lang)
         elif event_id:
             util.show_status(conn, lang, event_id)
         elif day:
-            util.show_events_by_date(conn, day, "day", lang, verbose)
+            util.show_events_by_date(conn, day, "day", lang, verbose, task_id)
         elif month:
-            util.show_events_by_date(conn, month, "month", lang, verbose)
+            util.show_events_by_date(
+                conn, month, "month", lang, verbose, task_id
+            )
         elif year:
-            util.show_events_year_count(conn, year, lang)
+            util.show_events_year_count(conn, year, lang, task_id)
+        elif heatmap:
+            util.show_heatmap(conn, heatmap, lang)
         else:
-            util.show_recent_events(conn, lang, verbose)
+            util.show_recent_events(conn, lang, verbose, task_id)
 
     ctx.exit()
 
 
+def list_output(
+    conn: sqlite3.Connection,
+    fmt: str,
+    t: bool,
+    event_id: str | None,
+    day: str,
+    month: str,
+    year: str,
+    heatmap: str,
+    task_id: str | None = None,
+) -> None:
+    if t:
+        output.tasks(conn, fmt)
+    elif event_id:
+        output.status(conn, fmt, event_id)
+    elif day:
+        output.events_by_date(conn, day, "day", fmt, task_id)
+    elif month:
+        output.events_by_date(conn, month, "month", fmt, task_id)
+    elif year:
+        output.year_count(conn, year, fmt, task_id)
+    elif heatmap:
+        output.heatmap(conn, heatmap, fmt)
+    else:
+        output.recent_events(conn, fmt, task_id)
+
+
 short_help = MultiText(
     cn="启动一个事件（开始做任务）。", en="Start an event (to do a task)."
 )
@@ -469,10 +627,11 @@ short_help = MultiText(
 @cli.command(
     context_settings=CONTEXT_SETTINGS, short_help=short_help.str(lang)
 )
-@click.argument("task", required=False)
+@click.argument("task", required=False, shell_complete=complete_aliases)
 @click.pass_context
 def start(ctx: click.Context, task: str | None):
     """List out task or events. 任务列表或事件列表。"""
+    ctx.call_on_close(refresh_complete_cache)
     with connect() as conn:
         info = util.event_start(conn, task)
         print(info.str(lang))
@@ -483,14 +642,28 @@ def start(ctx: click.Context, task: str | None):
 short_help = MultiText(cn="查看正在计时的事件的状态。", en="Status of the current event.")
 
 
+help_status_watch = MultiText(
+    cn="每秒刷新一次状态 (按 Ctrl-C 退出)", en="Refresh every second (Ctrl-C to quit)."
+)
+
+
 @cli.command(
     context_settings=CONTEXT_SETTINGS, short_help=short_help.str(lang)
 )
+@click.option(
+    "watch", "-w", "--watch", is_flag=True, help=help_status_watch.str(lang)
+)
+@output_options
 @click.pass_context
-def status(ctx: click.Context):
+def status(ctx: click.Context, watch: bool, fmt: str | None):
     """Status of the current event. 查看正在计时的事件的状态。"""
-    with connect() as conn:
-        util.show_status(conn, lang)
+    with connect(readonly=True) as conn:
+        if fmt:
+            output.status(conn, fmt)
+        elif watch:
+            util.watch_status(conn, lang)
+        else:
+            util.show_status(conn, lang)
 
     ctx.exit()
 
@@ -551,7 +724,8 @@ def resume(ctx: click.Context):
     """
     with connect() as conn:
         cfg = db.get_cfg(conn).unwrap()
-        util.event_resume(conn, cfg, lang)
+        if util.event_resume(conn, cfg, lang):
+            ctx.call_on_close(refresh_complete_cache)
 
     ctx.exit()
 
@@ -565,6 +739,7 @@ short_help = MultiText(cn="结束当前事件。", en="Stop the current event.")
 @click.pass_context
 def stop(ctx: click.Context):
     """Stop the current event. 结束当前事件。"""
+    ctx.call_on_close(refresh_complete_cache)
     with connect() as conn:
         cfg = db.get_cfg(conn).unwrap()
         util.event_stop(conn, cfg, lang)
@@ -572,14 +747,57 @@ def stop(ctx: click.Context):
     ctx.exit()
 
 
+short_help = MultiText(
+    cn="撤销最新事件的最后一个操作。", en="Undo the last operation."
+)
+
+
+@cli.command(
+    context_settings=CONTEXT_SETTINGS, short_help=short_help.str(lang)
+)
+@click.pass_context
+def undo(ctx: click.Context):
+    """Undo the last operation of the latest event. 撤销最后一个操作。
+
+    Every start/split/pause/resume/stop (and edit) is logged. Undoing a
+    start deletes the event; other operations are undone by replaying the
+    log without the last entry.
+    """
+    ctx.call_on_close(refresh_complete_cache)
+    with connect() as conn:
+        util.undo_last(conn, lang)
+
+    ctx.exit()
+
+
 short_help = MultiText(cn="合并事件。", en="Merge events.")
 help_merge_preview = MultiText(cn="预览合并结果。", en="Preview the result of merge.")
+help_merge_auto = MultiText(
+    cn="自动合并指定日期范围内的全部相邻事件 (需要同时使用 -day 或 -month)",
+    en="Merge all adjacent events in a range (use with -day or -month).",
+)
+help_merge_day = MultiText(
+    cn="自动合并某一天的事件 (YYYY-MM-DD)", en="Merge events on a day (YYYY-MM-DD)"
+)
+help_merge_month = MultiText(
+    cn="自动合并一个月的事件 (YYYY-MM)", en="Merge events on a month (YYYY-MM)"
+)
+help_merge_gap = MultiText(
+    cn="自动合并时，事件间隔的上限 (单位：分钟，默认等于休息时长上限)",
+    en="Max gap(minutes) between events to merge automatically (default: pause max).",
+)
+err_merge_auto = MultiText(
+    cn="使用 '--auto' 时，必须用 '-day' 或 '-month' 指定日期范围。",
+    en="Must use '-day' or '-month' to specify a range with '--auto'.",
+)
 
 
 @cli.command(
     context_settings=CONTEXT_SETTINGS, short_help=short_help.str(lang)
 )
-@click.argument("events", type=str, nargs=-1)
+@click.argument(
+    "events", type=str, nargs=-1, shell_complete=complete_events
+)
 @click.option(
     "preview",
     "-p",
@@ -587,11 +805,35 @@ help_merge_preview = MultiText(cn="预览合并结果。", en="Preview the resul
     is_flag=True,
     help=help_merge_preview.str(lang),
 )
+@click.option("auto", "--auto", is_flag=True, help=help_merge_auto.str(lang))
+@click.option("day", "-day", help=help_merge_day.str(lang))
+@click.option("month", "-month", help=help_merge_month.str(lang))
+@click.option("gap", "--gap", type=int, help=help_merge_gap.str(lang))
 @click.pass_context
-def merge(ctx: click.Context, events: tuple[str, ...], preview: bool):
+def merge(
+    ctx: click.Context,
+    events: tuple[str, ...],
+    preview: bool,
+    auto: bool,
+    day: str,
+    month: str,
+    gap: int | None,
+):
     """Merge events. 合并事件。"""
+    ctx.call_on_close(refresh_complete_cache)
     with connect() as conn:
-        util.merge_events(conn, lang, preview, *events)
+        if auto:
+            if not (day or month):
+                print(err_merge_auto.str(lang))
+                ctx.exit()
+            if gap is None:
+                gap = db.get_cfg(conn).unwrap()["pause_max"]
+            if day:
+                util.auto_merge_events(conn, lang, preview, day, "day", gap)
+            else:
+                util.auto_merge_events(conn, lang, preview, month, "month", gap)
+        else:
+            util.merge_events(conn, lang, preview, *events)
 
     ctx.exit()
 
@@ -623,20 +865,40 @@ def del_task(conn, name: str) -> None:
         case Err(err):
             print(f"{err.str(lang)}: {name}")
         case Ok(task):
-            print(f"\nTask: {task}\n")
+            total = db.count_task_events(conn, task.id)
+            print(f"\nTask: {task} ({total} events)\n")
             click.confirm(info_del_task.str(lang), abort=True)
-            db.delete_task(conn, task.id)
+
+            def progress(n: int) -> None:
+                print(f"\rdeleting events: {n}/{total}", end="", flush=True)
+
+            n = db.delete_task(conn, task.id, progress=progress)
+            if n:
+                print()
             print("OK deleted.")
 
 
 @cli.command(
     context_settings=CONTEXT_SETTINGS, short_help=short_help.str(lang)
 )
-@click.option("event_id", "-e", "--event", help=help_del_event.str(lang))
-@click.option("task_name", "-t", "--task", help=help_del_task.str(lang))
+@click.option(
+    "event_id",
+    "-e",
+    "--event",
+    help=help_del_event.str(lang),
+    shell_complete=complete_events,
+)
+@click.option(
+    "task_name",
+    "-t",
+    "--task",
+    help=help_del_task.str(lang),
+    shell_complete=complete_tasks,
+)
 @click.pass_context
 def delete(ctx: click.Context, event_id: str, task_name: str):
     """Delete an event or a task. 删除事件或任务。"""
+    ctx.call_on_close(refresh_complete_cache)
     with connect() as conn:
         if event_id:
             del_event(conn, event_id)
@@ -646,3 +908,468 @@ def delete(ctx: click.Context, event_id: str, task_name: str):
             print(ctx.get_help())
 
     ctx.exit()
+
+
+short_help = MultiText(
+    cn="把旧事件移动到按年份分开的归档数据库。", en="Move old events into archive databases."
+)
+help_archive_before = MultiText(
+    cn="归档该年份之前 (不含该年份) 的全部已结束事件 (YYYY)",
+    en="Archive all stopped events before the year (YYYY)",
+)
+
+
+@cli.command(
+    context_settings=CONTEXT_SETTINGS, short_help=short_help.str(lang)
+)
+@click.option(
+    "before", "--before", required=True, help=help_archive_before.str(lang)
+)
+@click.pass_context
+def archive(ctx: click.Context, before: str):
+    """Move old events into archive databases.
+
+    把旧事件移动到按年份分开的归档数据库。
+    """
+    ctx.call_on_close(refresh_complete_cache)
+    with connect() as conn:
+        util.archive_events(conn, before, lang)
+
+    ctx.exit()
+
+
+short_help = MultiText(cn="检查 (并修复) 数据完整性。", en="Check (and repair) data integrity.")
+help_fsck_fix = MultiText(
+    cn="修复可修复的问题 (分批提交)", en="Repair fixable problems (in batches)."
+)
+
+
+@cli.command(
+    context_settings=CONTEXT_SETTINGS, short_help=short_help.str(lang)
+)
+@click.option("fix", "--fix", is_flag=True, help=help_fsck_fix.str(lang))
+@click.pass_context
+def fsck(ctx: click.Context, fix: bool):
+    """Check (and repair) data integrity. 检查 (并修复) 数据完整性。
+
+    Checks that every event's work matches its laps, that laps are in order
+    and do not overlap, that the status agrees with the last lap, and that
+    every task_id exists. Problems marked with * can be repaired by --fix.
+    """
+    if fix:
+        ctx.call_on_close(refresh_complete_cache)
+    with connect() as conn:
+        util.check_db(conn, lang, fix)
+
+    ctx.exit()
+
+
+short_help = MultiText(cn="在线备份数据库。", en="Back up the database online.")
+help_backup_keep = MultiText(
+    cn="只保留最新的 N 个备份 (默认: 7)", en="Keep the latest N backups (default: 7)"
+)
+help_backup_every = MultiText(
+    cn="如果最新的备份距今不足 N 分钟，则跳过本次备份。",
+    en="Skip if the latest backup is less than N minutes old.",
+)
+
+
+@cli.command(
+    context_settings=CONTEXT_SETTINGS, short_help=short_help.str(lang)
+)
+@click.argument("dest", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "keep", "--keep", type=int, default=7, help=help_backup_keep.str(lang)
+)
+@click.option(
+    "every", "--every", type=int, default=0, help=help_backup_every.str(lang)
+)
+@click.pass_context
+def backup(ctx: click.Context, dest: str, keep: int, every: int):
+    """Back up the database online. 在线备份数据库。
+
+    Uses the sqlite3 backup API, so it is safe while other tt commands are
+    writing. Each backup is a folder DEST/tt-focus-YYYYMMDD-HHmmss/ with
+    tt-focus.db and every archive database (tt-focus-archive-YYYY.db).
+    """
+    with connect() as conn:
+        util.backup_db(conn, dest, keep, every, lang)
+
+    ctx.exit()
+
+
+short_help = MultiText(
+    cn="通过共享文件夹在多台设备之间同步。", en="Sync between devices via files."
+)
+help_sync_since = MultiText(
+    cn="只导出该水位线之后的修改 (默认: 上一次导出的水位线)",
+    en="Export changes after this watermark (default: the last export).",
+)
+
+
+@cli.group(context_settings=CONTEXT_SETTINGS, short_help=short_help.str(lang))
+def sync():
+    """Sync between devices via files. 在多台设备之间同步。
+
+    'tt sync export FILE' writes the rows changed since the last export;
+    'tt sync apply FILE' on another device merges them, the newer change of
+    each row wins.
+    """
+
+
+@sync.command(name="export", context_settings=CONTEXT_SETTINGS)
+@click.argument("file", type=click.Path(dir_okay=False))
+@click.option("since", "--since", type=int, help=help_sync_since.str(lang))
+@click.pass_context
+def sync_export(ctx: click.Context, file: str, since: int | None):
+    """Export changes to FILE. 导出修改。"""
+    with connect() as conn:
+        util.sync_export(conn, file, since, lang)
+
+    ctx.exit()
+
+
+@sync.command(name="apply", context_settings=CONTEXT_SETTINGS)
+@click.argument("file", type=click.Path(exists=True, dir_okay=False))
+@click.pass_context
+def sync_apply(ctx: click.Context, file: str):
+    """Apply changes from FILE. 应用修改。"""
+    ctx.call_on_close(refresh_complete_cache)
+    with connect() as conn:
+        util.sync_apply(conn, file, lang)
+
+    ctx.exit()
+
+
+short_help = MultiText(
+    cn="输出 Prometheus 格式的指标。", en="Write Prometheus metrics."
+)
+help_metrics_textfile = MultiText(
+    cn="写入该文件 (node_exporter textfile collector), 默认输出到屏幕。",
+    en="Write to this file (node_exporter textfile collector).",
+)
+
+
+@cli.command(
+    context_settings=CONTEXT_SETTINGS, short_help=short_help.str(lang)
+)
+@click.option(
+    "textfile",
+    "--textfile",
+    type=click.Path(dir_okay=False),
+    help=help_metrics_textfile.str(lang),
+)
+@click.pass_context
+def metrics(ctx: click.Context, textfile: str | None):
+    """Write Prometheus metrics. 输出 Prometheus 格式的指标。
+
+    The status of the latest event, the age of the running lap, and the
+    work time of today and this week per task. The file is replaced
+    atomically, so it is safe to run from cron every few seconds.
+    """
+    with connect(readonly=True) as conn:
+        util.write_metrics(conn, textfile)
+
+    ctx.exit()
+
+
+short_help = MultiText(cn="查看钩子及其执行时间。", en="Show hooks and their timings.")
+
+
+@cli.command(
+    context_settings=CONTEXT_SETTINGS, short_help=short_help.str(lang)
+)
+@click.pass_context
+def hooks(ctx: click.Context):
+    """Show hooks and their timings. 查看钩子及其执行时间。
+
+    Hooks are set in tt-focus-hooks.json (next to tt-focus.cfg) and run in
+    the background after start/split/pause/resume/stop, so they never slow
+    down the command. Each run is logged with its time and result.
+    """
+    util.show_hooks(lang)
+    ctx.exit()
+
+
+short_help = MultiText(cn="专注统计。", en="Focus statistics.")
+help_stats_from = MultiText(
+    cn="起始日期 (YYYY-MM-DD), 默认从最早的事件开始。",
+    en="Start date (YYYY-MM-DD), defaults to the earliest event.",
+)
+help_stats_to = MultiText(
+    cn="结束日期 (YYYY-MM-DD, 包括该日)，默认到今天为止。",
+    en="End date (YYYY-MM-DD, inclusive), defaults to today.",
+)
+
+help_jobs = MultiText(
+    cn="按年份及数据库文件分割，使用 N 个进程并行计算 (默认: 1)",
+    en="Split the work by year and DB file over N processes (default: 1)",
+)
+
+
+@cli.command(
+    context_settings=CONTEXT_SETTINGS, short_help=short_help.str(lang)
+)
+@click.option("date_from", "--from", help=help_stats_from.str(lang))
+@click.option("date_to", "--to", help=help_stats_to.str(lang))
+@click.option(
+    "task_name",
+    "-t",
+    "--task",
+    help=help_task_name.str(lang),
+    shell_complete=complete_aliases,
+)
+@click.option("jobs", "-j", "--jobs", default=1, help=help_jobs.str(lang))
+@click.pass_context
+def stats(
+    ctx: click.Context,
+    date_from: str | None,
+    date_to: str | None,
+    task_name: str | None,
+    jobs: int,
+):
+    """Focus statistics. 专注统计。
+
+    Lap length (mean/median/p90), pauses, laps per event, the longest
+    uninterrupted focus block and work by hour of day.
+    """
+    with connect(readonly=True) as conn:
+        util.show_stats(conn, lang, date_from, date_to, task_name, jobs)
+
+    ctx.exit()
+
+
+short_help = MultiText(
+    cn="启动本机 HTTP/JSON 服务。", en="Run a local HTTP/JSON server."
+)
+help_serve_port = MultiText(
+    cn=f"端口 (默认: {model.ServerPort})",
+    en=f"Port (default: {model.ServerPort})",
+)
+help_serve_origin = MultiText(
+    cn="允许该网站 (例如 http://localhost:3000) 的页面访问，可使用多次。",
+    en="Allow pages from this origin (e.g. http://localhost:3000), repeatable.",
+)
+
+
+@cli.command(
+    context_settings=CONTEXT_SETTINGS, short_help=short_help.str(lang)
+)
+@click.option(
+    "port",
+    "--port",
+    type=click.IntRange(0, 65535),
+    default=model.ServerPort,
+    help=help_serve_port.str(lang),
+)
+@click.option(
+    "allow_origin",
+    "--allow-origin",
+    multiple=True,
+    help=help_serve_origin.str(lang),
+)
+@click.pass_context
+def serve(ctx: click.Context, port: int, allow_origin: tuple[str, ...]):
+    """Run a local HTTP/JSON server. 启动本机 HTTP/JSON 服务。
+
+    Listens on 127.0.0.1 only, for web dashboards and browser extensions.
+    The responses have the same structure as '--json'.
+
+    \b
+    GET  /status, /events, /tasks, /report, /goals
+    POST /start, /split, /pause, /resume, /stop, /undo
+
+    POST requires 'Content-Type: application/json', e.g.
+
+    curl -X POST -H 'Content-Type: application/json' \\
+         -d '{"task": "coding"}' http://127.0.0.1:8017/start
+    """
+    from . import server  # asyncio 的导入较慢，只在需要时导入
+
+    cache.use_memory()  # 长期运行，不需要磁盘缓存
+    server.run(db_path, port, allow_origin)
+    ctx.exit()
+
+
+short_help = MultiText(cn="每日及每周目标。", en="Daily and weekly goals.")
+help_goals_day = MultiText(
+    cn="设置每日目标 (单位：分钟，0 表示删除)，需要同时使用 -t",
+    en="Set the daily goal (minutes, 0 to remove), use with -t.",
+)
+help_goals_week = MultiText(
+    cn="设置每周目标 (单位：分钟，0 表示删除)，需要同时使用 -t",
+    en="Set the weekly goal (minutes, 0 to remove), use with -t.",
+)
+err_goals_task = MultiText(
+    cn="设置目标时，必须用 '-t' 指定任务类型。",
+    en="Must use '-t' to specify a task type to set goals.",
+)
+
+
+@cli.command(
+    context_settings=CONTEXT_SETTINGS, short_help=short_help.str(lang)
+)
+@click.option(
+    "task_name",
+    "-t",
+    "--task",
+    help=help_task_name.str(lang),
+    shell_complete=complete_aliases,
+)
+@click.option(
+    "day", "--day", type=click.IntRange(0), help=help_goals_day.str(lang)
+)
+@click.option(
+    "week", "--week", type=click.IntRange(0), help=help_goals_week.str(lang)
+)
+@click.pass_context
+def goals(
+    ctx: click.Context,
+    task_name: str | None,
+    day: int | None,
+    week: int | None,
+):
+    """Daily and weekly goals. 每日及每周目标。
+
+    Shows the progress of today and this week (Monday). The progress of
+    the task is also shown after every 'tt stop'.
+
+    Examples:
+
+    tt goals -t coding --day 240 --week 1200
+
+    tt goals -t coding --day 0  # remove the daily goal
+    """
+    if day is None and week is None:
+        with connect(readonly=True) as conn:
+            if task_name:
+                r = util.get_task_id(conn, task_name)
+                if r.is_err():
+                    print(r.unwrap_err().str(lang))
+                    ctx.exit()
+                found = util.show_goals(conn, lang, r.unwrap())
+            else:
+                found = util.show_goals(conn, lang)
+            if not found:
+                info = MultiText(
+                    cn="未设置目标，例如 'tt goals -t coding --day 240'",
+                    en="No goals. Try 'tt goals -t coding --day 240'",
+                )
+                print(info.str(lang))
+        ctx.exit()
+
+    if not task_name:
+        print(err_goals_task.str(lang))
+        ctx.exit()
+
+    with connect() as conn:
+        util.set_goals(conn, lang, task_name, day, week)
+
+    ctx.exit()
+
+
+short_help = MultiText(cn="最长的工作小节或事件。", en="Longest laps or events.")
+help_top_laps = MultiText(
+    cn="最长的 N 个工作小节 (默认: 10)", en="The N longest laps (default: 10)."
+)
+help_top_events = MultiText(
+    cn="工作时长最长的 N 个事件", en="The N events with the most work."
+)
+
+
+@cli.command(
+    context_settings=CONTEXT_SETTINGS, short_help=short_help.str(lang)
+)
+@click.option(
+    "laps", "--laps", type=click.IntRange(1), help=help_top_laps.str(lang)
+)
+@click.option(
+    "events", "--events", type=click.IntRange(1), help=help_top_events.str(lang)
+)
+@click.option("date_from", "--from", help=help_stats_from.str(lang))
+@click.option("date_to", "--to", help=help_stats_to.str(lang))
+@click.option(
+    "task_name",
+    "-t",
+    "--task",
+    help=help_task_name.str(lang),
+    shell_complete=complete_aliases,
+)
+@click.option("jobs", "-j", "--jobs", default=1, help=help_jobs.str(lang))
+@click.pass_context
+def top(
+    ctx: click.Context,
+    laps: int | None,
+    events: int | None,
+    date_from: str | None,
+    date_to: str | None,
+    task_name: str | None,
+    jobs: int,
+):
+    """Longest laps or events. 最长的工作小节或事件。
+
+    Scans the whole range (including archives) once, keeping only the top
+    N in a fixed-size heap, so memory does not grow with the history.
+
+    Examples:
+
+    tt top --laps 10 --task coding
+
+    tt top --events 5 --from 2022-01-01
+    """
+    if laps is None and events is None:
+        laps = 10
+    with connect(readonly=True) as conn:
+        for kind, n in (("laps", laps), ("events", events)):
+            if n is not None:
+                util.show_top(
+                    conn, lang, kind, n, date_from, date_to, task_name, jobs
+                )
+
+    ctx.exit()
+
+
+short_help = MultiText(
+    cn="各任务类型的工作时长报表。", en="Work time report per task."
+)
+
+
+@cli.command(
+    context_settings=CONTEXT_SETTINGS, short_help=short_help.str(lang)
+)
+@click.option("date_from", "--from", help=help_stats_from.str(lang))
+@click.option("date_to", "--to", help=help_stats_to.str(lang))
+@click.option(
+    "task_name",
+    "-t",
+    "--task",
+    help=help_task_name.str(lang),
+    shell_complete=complete_aliases,
+)
+@click.option("jobs", "-j", "--jobs", default=1, help=help_jobs.str(lang))
+@output_options
+@click.pass_context
+def report(
+    ctx: click.Context,
+    date_from: str | None,
+    date_to: str | None,
+    task_name: str | None,
+    jobs: int,
+    fmt: str | None,
+):
+    """Work time report per task. 各任务类型的工作时长报表。"""
+    with connect(readonly=True) as conn:
+        match util.get_task_id(conn, task_name):
+            case Err(err):
+                if fmt:
+                    output.emit_error(err, fmt)
+                else:
+                    print(err.str(lang))
+            case Ok(task_id) if fmt:
+                output.summary(conn, fmt, date_from, date_to, jobs, task_id)
+            case Ok(task_id):
+                util.show_report(
+                    conn, lang, date_from, date_to, jobs, task_id
+                )
+
+    ctx.exit()
@@ -0,0 +1,105 @@
+"""Prometheus 指标 (node_exporter textfile collector 格式)
+
+    tt metrics --textfile /var/lib/node_exporter/textfile/tt.prom
+
+适合用 cron 频繁执行：只查询最新的事件 (使用索引) 及本周范围内各任务类型的
+工作时长合计 (idx_event_started), 与数据库的大小无关。
+"""
+
+import os
+from pathlib import Path
+from typing import Final
+
+import arrow
+
+from . import cache, db, stmt
+from .model import EventStatus
+
+Prefix: Final = "tt_"
+
+
+def escape(value: str) -> str:
+    """标签值的转义 (反斜杠、双引号、换行)"""
+    return (
+        value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    )
+
+
+def metric(
+    name: str, help_: str, samples: list[tuple[dict[str, str], int]]
+) -> list[str]:
+    lines = [f"# HELP {Prefix}{name} {help_}", f"# TYPE {Prefix}{name} gauge"]
+    for labels, value in samples:
+        label = ",".join(f'{k}="{escape(v)}"' for k, v in labels.items())
+        label = f"{{{label}}}" if label else ""
+        lines.append(f"{Prefix}{name}{label} {value}")
+    return lines
+
+
+def work_by_task(conn: db.Conn, start: int, end: int) -> list[tuple[str, int]]:
+    """[start, end) 范围内各任务类型的工作时长合计 [(任务名称, 秒)]"""
+
+    def compute() -> list[tuple[str, int]]:
+        param = dict(start=start, end=end)
+        rows = conn.execute(stmt.Sum_work_by_task, param)
+        return sorted((name or t_id, work) for t_id, name, _, work in rows)
+
+    args = cache.range_key(start, end)
+    return cache.cached(conn, "work_by_task", args, compute)
+
+
+def collect(conn: db.Conn, now: arrow.Arrow | None = None) -> str:
+    now = arrow.now() if now is None else now
+    db.compact_pending(conn)  # 合计直接读取 event 表
+
+    status, lap_age = None, 0
+    r = db.get_last_event(conn)
+    if r.is_ok():
+        event = r.unwrap()
+        status = event.status
+        if status is not EventStatus.Stopped:
+            lap_start = event.laps[-1][1]
+            lap_age = max(0, now.int_timestamp - lap_start)
+
+    day = now.floor("day")
+    week = now.floor("week")
+    end = day.shift(days=1).int_timestamp
+    today = work_by_task(conn, day.int_timestamp, end)
+    this_week = work_by_task(conn, week.int_timestamp, end)
+
+    lines = metric(
+        "event_status",
+        "Status of the latest event (1 for the current status).",
+        [({"status": s.name}, int(s is status)) for s in EventStatus],
+    )
+    lines += metric(
+        "lap_age_seconds",
+        "Age of the current split or pause (0 when no event is running).",
+        [({}, lap_age)],
+    )
+    lines += metric(
+        "work_today_seconds",
+        "Work time of events started today, per task.",
+        [({"task": name}, work) for name, work in today],
+    )
+    lines += metric(
+        "work_week_seconds",
+        "Work time of events started this week (Monday), per task.",
+        [({"task": name}, work) for name, work in this_week],
+    )
+    lines += metric(
+        "metrics_timestamp_seconds",
+        "When these metrics were collected.",
+        [({}, now.int_timestamp)],
+    )
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: Path, text: str) -> None:
+    """先写入临时文件再改名，collector 不会读到写了一半的文件。
+
+    临时文件不以 .prom 结尾，因此不会被 collector 读取。
+    """
+    temp = path.with_name(path.name + ".tmp")
+    temp.write_text(text, encoding="utf-8")
+    os.replace(temp, path)
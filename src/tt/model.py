@@ -11,6 +11,8 @@ import msgpack
 OK: Final = Ok("OK")
 UnknownReturn: Final = Exception("Unknown-return")
 RecentItemsMax: Final[int] = 9
+ServerPort: Final = 8017
+"""tt serve 的默认端口"""
 
 DateFormat: Final = "YYYY-MM-DD"
 TimeFormat: Final = "HH:mm:ss"
@@ -167,10 +169,9 @@ class Event:
         ratio = self.work / total
         return f"{round(ratio * 100)}%"
 
-    def close_last_lap(self) -> Lap:
+    def close_last_lap(self, end: int) -> Lap:
         """上一个小节结束，填写结束时间与小节长度。"""
         last_lap = self.laps[-1]
-        end = now()
         last_lap = (last_lap[0], last_lap[1], end, end - last_lap[1])
         self.laps = self.laps[:-1] + (last_lap,)
         return last_lap
@@ -181,14 +182,31 @@ class Event:
         last_lap = (last_lap[0], last_lap[1], 0, 0)
         self.laps = self.laps[:-1] + (last_lap,)
 
-    def split(self, cfg: Config) -> None:
+    def apply(self, op: str, cfg: Config, at: int | None = None) -> None:
+        """执行一个状态转换 (split/pause/resume/stop)，at 是执行的时间。
+
+        at 默认是现在，指定 at 可以准确地重放 lap_op 中记录的操作。
+        """
+        match op:
+            case "split":
+                self.split(cfg, at)
+            case "pause":
+                self.pause(cfg, at)
+            case "resume":
+                self.resume(cfg, at)
+            case "stop":
+                self.stop(cfg, at)
+            case _:
+                raise KeyError(f"Unknown operator: {op}")
+
+    def split(self, cfg: Config, at: int | None = None) -> None:
         if self.status is not EventStatus.Running:
             raise RuntimeError(
                 f"Only running event can be split. Current status: {self.status}"
             )
 
         # 上一个小节结束。
-        last_lap = self.close_last_lap()
+        last_lap = self.close_last_lap(now() if at is None else at)
 
         # 如果上个小节的长度小于下限，则本次 split 操作无效。
         if last_lap[-1] <= cfg["split_min"] * 60:
@@ -201,19 +219,20 @@ class Event:
         self.laps += (lap,)
         self.work += last_lap[-1]
 
-    def pause(self, cfg: Config) -> None:
+    def pause(self, cfg: Config, at: int | None = None) -> None:
         if self.status is not EventStatus.Running:
             raise RuntimeError(
                 f"Only running event can be paused. Current status: {self.status}"
             )
 
         # 上一个小节结束。
-        last_lap = self.close_last_lap()
+        at = now() if at is None else at
+        last_lap = self.close_last_lap(at)
 
         # 如果上个小节的长度小于下限，则上个小节被视为无效 (直接删除)。
         if last_lap[-1] <= cfg["split_min"] * 60:
             self.laps = self.laps[:-1]
-            start = now()
+            start = at
         else:
             # 上个小节有效，新小节的开始时间，就是上个小节的结束时间，
             # 并且把上个小节的长度累加到总工作时长中。
@@ -224,14 +243,15 @@ class Event:
         self.laps += (lap,)
         self.status = EventStatus.Pausing
 
-    def resume(self, cfg: Config) -> None:
+    def resume(self, cfg: Config, at: int | None = None) -> None:
         if self.status is not EventStatus.Pausing:
             raise RuntimeError(
                 f"Only pausing event can be resumed. Current status: {self.status}"
             )
 
         # 上一个小节结束。
-        last_lap = self.close_last_lap()
+        at = now() if at is None else at
+        last_lap = self.close_last_lap(at)
 
         # 如果上个小节的长度大于上限，则视为无效，并且事件状态变为 stopped,
         # caller 要检查事件状态，如果变为 stopped 则需要在 caller 启动新的事件。
@@ -243,7 +263,7 @@ class Event:
         # 如果上个小节的长度小于下限，则上个小节被视为无效 (直接删除)。
         if last_lap[-1] <= cfg["pause_min"] * 60:
             self.laps = self.laps[:-1]
-            start = now()
+            start = at
         else:
             # 上个小节有效，新小节的开始时间，就是上个小节的结束时间，
             start = last_lap[2]
@@ -252,12 +272,12 @@ class Event:
         self.laps += (lap,)
         self.status = EventStatus.Running
 
-    def stop(self, cfg: Config) -> None:
+    def stop(self, cfg: Config, at: int | None = None) -> None:
         if self.status is EventStatus.Stopped:
             raise RuntimeError("Cannot operate on a stopped event.")
 
         # 上一个小节结束。
-        last_lap = self.close_last_lap()
+        last_lap = self.close_last_lap(now() if at is None else at)
 
         # 如果上个小节是休息小节，或工作时长小于下限，则上个小节被视为无效 (直接删除)。
         if self.status is EventStatus.Pausing or (
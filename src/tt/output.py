@@ -0,0 +1,192 @@
+"""机器可读的输出 (--json / --msgpack)
+
+直接由数据库中的数据生成，不经过面向人的格式化 (MultiText, arrow)。
+输出的结构由 FormatVersion 标识，修改结构时必须增加版本号。
+"""
+
+import json
+import sys
+from typing import Final
+
+from result import Err, Ok, Result
+
+from . import db, model, report
+from .model import Event, MultiText
+
+FormatVersion: Final = 1
+
+
+def envelope(kind: str, data: dict) -> dict:
+    return {"version": FormatVersion, "kind": kind, **data}
+
+
+def error_data(err: MultiText) -> dict:
+    return {"error": {"cn": err.cn, "en": err.en}}
+
+
+def emit(kind: str, data: dict, fmt: str) -> None:
+    obj = envelope(kind, data)
+    if fmt == "msgpack":
+        sys.stdout.buffer.write(model.pack(obj))
+        sys.stdout.buffer.flush()
+    else:
+        print(json.dumps(obj, ensure_ascii=False, separators=(",", ":")))
+
+
+def emit_error(err: MultiText, fmt: str) -> None:
+    emit("error", error_data(err), fmt)
+
+
+def emit_result(kind: str, r: Result[dict, MultiText], fmt: str) -> None:
+    match r:
+        case Err(err):
+            emit_error(err, fmt)
+        case Ok(data):
+            emit(kind, data, fmt)
+
+
+def task_names(conn: db.Conn) -> dict[str, str]:
+    return {task.id: task.name for task in db.get_all_task(conn)}
+
+
+def event_dict(event: Event, names: dict[str, str]) -> dict:
+    return {
+        "id": event.id,
+        "task_id": event.task_id,
+        "task": names.get(event.task_id, ""),
+        "started": event.started,
+        "status": event.status.name,
+        "laps": [list(lap) for lap in event.laps],
+        "work": event.work,
+        "notes": event.notes,
+    }
+
+
+def status_data(
+    conn: db.Conn, event_id: str | None = None
+) -> Result[dict, MultiText]:
+    if event_id is None:
+        r = db.get_last_event(conn)
+    else:
+        r = db.get_event_by_id(conn, event_id)
+        if r.is_err():
+            r = db.get_archived_event(conn, event_id).or_else(lambda _: r)
+
+    event = r.ok()
+    if event_id is not None and event is None:
+        return Err(r.unwrap_err())
+
+    names = task_names(conn)
+    return Ok(
+        {
+            "now": model.now(),
+            "event": None if event is None else event_dict(event, names),
+        }
+    )
+
+
+def status(conn: db.Conn, fmt: str, event_id: str | None = None) -> None:
+    emit_result("status", status_data(conn, event_id), fmt)
+
+
+def events_data(conn: db.Conn, items: list[Event]) -> dict:
+    names = task_names(conn)
+    return {"events": [event_dict(e, names) for e in items]}
+
+
+def events(conn: db.Conn, items: list[Event], fmt: str) -> None:
+    emit("events", events_data(conn, items), fmt)
+
+
+def recent_events_data(conn: db.Conn, task_id: str | None = None) -> dict:
+    r = db.get_recent_events(conn, model.RecentItemsMax, task_id)
+    return events_data(conn, r.unwrap_or([]))
+
+
+def recent_events(
+    conn: db.Conn, fmt: str, task_id: str | None = None
+) -> None:
+    emit("events", recent_events_data(conn, task_id), fmt)
+
+
+def events_by_date_data(
+    conn: db.Conn, date: str, d_or_m: str, task_id: str | None = None
+) -> Result[dict, MultiText]:
+    r = db.get_events_by_date(conn, date, d_or_m, task_id)
+    return r.map(lambda items: events_data(conn, items))
+
+
+def events_by_date(
+    conn: db.Conn,
+    date: str,
+    d_or_m: str,
+    fmt: str,
+    task_id: str | None = None,
+) -> None:
+    r = events_by_date_data(conn, date, d_or_m, task_id)
+    emit_result("events", r, fmt)
+
+
+def tasks_data(conn: db.Conn) -> dict:
+    items = [
+        {"id": t.id, "name": t.name, "alias": t.alias}
+        for t in db.get_all_task(conn)
+    ]
+    return {"tasks": items}
+
+
+def tasks(conn: db.Conn, fmt: str) -> None:
+    emit("tasks", tasks_data(conn), fmt)
+
+
+def year_count(
+    conn: db.Conn, year: str, fmt: str, task_id: str | None = None
+) -> None:
+    match db.events_year_count(conn, year, task_id):
+        case Err(err):
+            emit_error(err, fmt)
+        case Ok(date_count):
+            months = [{"month": m, "events": n} for m, n in date_count]
+            emit("year-count", {"year": year, "months": months}, fmt)
+
+
+def heatmap(conn: db.Conn, year: str, fmt: str) -> None:
+    r = db.get_dates(year, "year")
+    if r.is_err():
+        emit_error(r.unwrap_err(), fmt)
+        return
+    start, end = db.year_range(int(year))
+    days = db.day_work(conn, start, end)
+    emit("day-work", {"year": year, "days": days}, fmt)
+
+
+def summary_data(
+    conn: db.Conn,
+    date_from: str | None,
+    date_to: str | None,
+    jobs: int = 1,
+    task_id: str | None = None,
+) -> Result[dict, MultiText]:
+    r = db.get_date_range(date_from, date_to)
+    if r.is_err():
+        return Err(r.unwrap_err())
+
+    start, end = r.unwrap()
+    result = report.summarize(conn, start, end, jobs, task_id)
+    items = [
+        {"id": task_id, "name": t.name, "events": t.events, "work": t.work}
+        for task_id, t in result.tasks.items()
+    ]
+    return Ok({"start": start, "end": end, "tasks": items})
+
+
+def summary(
+    conn: db.Conn,
+    fmt: str,
+    date_from: str | None,
+    date_to: str | None,
+    jobs: int = 1,
+    task_id: str | None = None,
+) -> None:
+    r = summary_data(conn, date_from, date_to, jobs, task_id)
+    emit_result("report", r, fmt)
@@ -0,0 +1,210 @@
+"""报表 (tt report) 及多进程并行计算
+
+按数据库文件 (主数据库与归档数据库) 及年份把查询范围分割为多个部分，
+每个部分在独立的进程中打开自己的只读连接，最后合并各部分的结果。
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Callable, Iterable, TypeAlias, TypeVar
+
+from . import cache, db, stats, stmt
+
+Part: TypeAlias = tuple[str, int, int]
+"""(数据库文件, start, end)"""
+
+T = TypeVar("T")
+
+
+@dataclass
+class TaskSummary:
+    name: str
+    events: int = 0
+    work: int = 0
+
+
+@dataclass
+class Summary:
+    """每个任务类型的事件数量与工作时长合计，可用 merge() 合并。"""
+
+    tasks: dict[str, TaskSummary] = field(default_factory=dict)
+
+    def add(self, task_id: str, name: str | None, events: int, work: int):
+        item = self.tasks.setdefault(task_id, TaskSummary(name or task_id))
+        if name:
+            item.name = name
+        item.events += events
+        item.work += work
+
+    def merge(self, other: "Summary") -> "Summary":
+        for task_id, item in other.tasks.items():
+            self.add(task_id, item.name, item.events, item.work)
+        return self
+
+    def events(self) -> int:
+        return sum(item.events for item in self.tasks.values())
+
+    def work(self) -> int:
+        return sum(item.work for item in self.tasks.values())
+
+
+def db_files(conn: db.Conn, start: int, end: int) -> list[str]:
+    """与 [start, end) 有重叠的归档数据库 (按年份排序)，最后是主数据库。"""
+    files = []
+    for year in db.archive_years(conn):
+        y_start, y_end = db.year_range(year)
+        if y_start < end and start < y_end:
+            files.append(str(db.archive_path(conn, year)))
+    files.append(str(db.db_file(conn)))
+    return files
+
+
+def split_parts(conn: db.Conn, start: int, end: int) -> list[Part]:
+    """按数据库文件及年份 (本地时间) 分割 [start, end)"""
+    parts = []
+    for path in db_files(conn, start, end):
+        with db.connect(path, readonly=True) as file_conn:
+            first, last = file_conn.execute(stmt.Get_started_range).fetchone()
+        file_conn.close()
+        if first is None:
+            continue
+
+        p_start, p_end = max(start, first), min(end, last + 1)
+        year = db.local_year(p_start)
+        while p_start < p_end:
+            y_end = min(p_end, db.year_range(year + 1)[0])
+            parts.append((path, p_start, y_end))
+            p_start, year = y_end, year + 1
+    return parts
+
+
+def run(func: Callable[[Part], T], parts: list[Part], jobs: int) -> list[T]:
+    """在 jobs 个进程中计算各部分，结果的顺序与 parts 相同。"""
+    if jobs <= 1 or len(parts) <= 1:
+        return [func(part) for part in parts]
+    with ProcessPoolExecutor(max_workers=min(jobs, len(parts))) as executor:
+        return list(executor.map(func, parts))
+
+
+def summary_part(part: Part, task_id: str | None = None) -> Summary:
+    path, start, end = part
+    query = stmt.Sum_work_by_task if task_id is None else stmt.Sum_task_work
+    param = dict(start=start, end=end, task_id=task_id)
+    result = Summary()
+    with db.connect(path, readonly=True) as conn:
+        rows = conn.execute(query, param)
+        for task_id, name, events, work in rows:
+            result.add(task_id, name, events, work)
+    conn.close()
+    return result
+
+
+def stats_part(part: Part, task_id: str | None = None) -> stats.FocusStats:
+    path, start, end = part
+    query = stmt.Get_laps_in if task_id is None else stmt.Get_task_laps_in
+    param = dict(start=start, end=end, task_id=task_id)
+    with db.connect(path, readonly=True) as conn:
+        rows = conn.execute(query.format(schema="main"), param)
+        result = stats.collect(rows)
+    conn.close()
+    return result
+
+
+def top_laps_part(
+    part: Part, n: int, task_id: str | None = None
+) -> stats.TopK:
+    path, start, end = part
+    query = stmt.Get_work_laps_in
+    if task_id is not None:
+        query = stmt.Get_task_work_laps_in
+    param = dict(start=start, end=end, task_id=task_id)
+    with db.connect(path, readonly=True) as conn:
+        result = stats.top_laps(conn.execute(query, param), n)
+    conn.close()
+    return result
+
+
+def top_events_part(
+    part: Part, n: int, task_id: str | None = None
+) -> stats.TopK:
+    """SQLite 对 ORDER BY ... LIMIT n 只保留 n 行，不会排序全部事件。"""
+    path, start, end = part
+    query = stmt.Get_top_events_in
+    if task_id is not None:
+        query = stmt.Get_top_task_events_in
+    param = dict(start=start, end=end, task_id=task_id, n=n)
+    result = stats.TopK(n)
+    with db.connect(path, readonly=True) as conn:
+        for row in conn.execute(query, param):
+            result.push(tuple(row))
+    conn.close()
+    return result
+
+
+def merge_all(results: Iterable[T], initial: T) -> T:
+    for result in results:
+        initial.merge(result)  # type: ignore[attr-defined]
+    return initial
+
+
+def summarize(
+    conn: db.Conn,
+    start: int,
+    end: int,
+    jobs: int = 1,
+    task_id: str | None = None,
+) -> Summary:
+    db.compact_pending(conn)  # 各部分用独立的连接直接读取 event 表
+
+    def compute() -> Summary:
+        parts = split_parts(conn, start, end)
+        func = partial(summary_part, task_id=task_id)
+        return merge_all(run(func, parts, jobs), Summary())
+
+    args = (*cache.range_key(start, end), task_id)
+    return cache.cached(conn, "summarize", args, compute)
+
+
+def focus_stats(
+    conn: db.Conn,
+    start: int,
+    end: int,
+    task_id: str | None = None,
+    jobs: int = 1,
+) -> stats.FocusStats:
+    db.compact_pending(conn)
+
+    def compute() -> stats.FocusStats:
+        parts = split_parts(conn, start, end)
+        func = partial(stats_part, task_id=task_id)
+        return merge_all(run(func, parts, jobs), stats.FocusStats())
+
+    args = (*cache.range_key(start, end), task_id)
+    return cache.cached(conn, "focus_stats", args, compute)
+
+
+def top(
+    conn: db.Conn,
+    kind: str,
+    n: int,
+    start: int,
+    end: int,
+    task_id: str | None = None,
+    jobs: int = 1,
+) -> list[tuple]:
+    """最长的 n 个工作小节 (kind="laps") 或工作时长最长的 n 个事件 ("events")
+
+    小节: [(length, start, event_id, task_id)]
+    事件: [(work, started, event_id, task_id)]
+    """
+    db.compact_pending(conn)
+
+    def compute() -> list[tuple]:
+        func = top_laps_part if kind == "laps" else top_events_part
+        parts = split_parts(conn, start, end)
+        results = run(partial(func, n=n, task_id=task_id), parts, jobs)
+        return merge_all(results, stats.TopK(n)).sorted()
+
+    args = (kind, n, *cache.range_key(start, end), task_id)
+    return cache.cached(conn, "top", args, compute)
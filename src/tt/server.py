@@ -0,0 +1,424 @@
+"""本机 HTTP/JSON 服务 (tt serve), 供网页仪表板、浏览器扩展等使用。
+
+    tt serve --port 8017
+
+只监听 127.0.0.1. 响应的结构与 --json 输出相同 (见 output.py)。
+
+    GET  /status               最新的事件
+    GET  /events               最近的事件 (?day=YYYY-MM-DD 或 ?month=YYYY-MM,
+                               可加上 &task=NAME)
+    GET  /tasks                全部任务类型
+    GET  /report               每个任务类型的工作时长 (?from=&to=&task=)
+    GET  /goals                今天及本周的目标进度
+    POST /start                {"task": "coding"} (省略则采用上一次的任务类型)
+    POST /split, /pause, /resume, /stop, /undo
+
+asyncio 只负责收发 HTTP, 查询在线程中执行：读取从一个小的只读连接池
+(ReadPool) 中借用连接，WAL 模式下读取互不阻塞；状态转换全部交给唯一的
+写入线程 (一个 api.Session 及其任务队列)，因此按顺序执行，不会互相冲突。
+
+POST 必须是 Content-Type: application/json, 因此其他网站的页面无法直接
+发送 (浏览器会先发送预检请求), 除非用 --allow-origin 允许该网站。
+Host 必须是 127.0.0.1 或 localhost (防止 DNS rebinding)。
+"""
+
+import asyncio
+import json
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Final
+from urllib.parse import parse_qs, urlsplit
+
+from result import Err, Ok, Result
+
+from . import db, goals, output, util
+from .api import Session
+from .model import Event, MultiText, ServerPort, UnknownReturn
+
+Host: Final = "127.0.0.1"
+Readers: Final = 4
+"""只读连接的数量 (也是读取线程的数量)"""
+MaxHeaders: Final = 100
+MaxBody: Final = 64 * 1024
+AllowedHosts: Final = ("127.0.0.1", "localhost")
+
+Reasons: Final = {
+    200: "OK",
+    204: "No Content",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    415: "Unsupported Media Type",
+    500: "Internal Server Error",
+}
+
+Response = tuple[int, dict]
+"""(HTTP 状态码, JSON 对象)"""
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def error(status: int, message: str) -> Response:
+    err = MultiText(cn=message, en=message)
+    return status, output.envelope("error", output.error_data(err))
+
+
+def result_response(kind: str, r: Result[dict, MultiText]) -> Response:
+    match r:
+        case Err(err):
+            return 400, output.envelope("error", output.error_data(err))
+        case Ok(data):
+            return 200, output.envelope(kind, data)
+        case _:
+            raise UnknownReturn
+
+
+class ReadPool:
+    """固定数量的只读连接，每个连接同一时间只借给一个线程。
+
+    这些连接不压缩未压缩的操作 (skip_compact), 读取之前由 Writer 压缩，
+    因此数据库只有 Writer 一个写入者。
+    """
+
+    def __init__(self, db_path: str, size: int = Readers):
+        self.conns: queue.Queue[db.Conn] = queue.Queue()
+        for _ in range(size):
+            conn = db.connect(db_path, readonly=True, check_same_thread=False)
+            conn.skip_compact = True  # type: ignore[attr-defined]
+            self.conns.put(conn)
+        self.size = size
+
+    def run(self, func: Callable[..., Any], *args) -> Any:
+        conn = self.conns.get()
+        try:
+            return func(conn, *args)
+        finally:
+            self.conns.put(conn)
+
+    def close(self) -> None:
+        for _ in range(self.size):
+            self.conns.get().close()
+
+
+def param(query: dict[str, list[str]], name: str) -> str | None:
+    values = query.get(name)
+    return values[-1] if values else None
+
+
+def task_id_or_err(
+    conn: db.Conn, query: dict
+) -> Result[str | None, MultiText]:
+    return util.get_task_id(conn, param(query, "task"))
+
+
+def get_status(conn: db.Conn, query: dict) -> Response:
+    return result_response("status", output.status_data(conn))
+
+
+def get_events(conn: db.Conn, query: dict) -> Response:
+    match task_id_or_err(conn, query):
+        case Err(err):
+            return result_response("events", Err(err))
+        case Ok(task_id):
+            pass
+        case _:
+            raise UnknownReturn
+    for d_or_m in ("day", "month"):
+        date = param(query, d_or_m)
+        if date:
+            r = output.events_by_date_data(conn, date, d_or_m, task_id)
+            return result_response("events", r)
+    events = output.recent_events_data(conn, task_id)
+    return 200, output.envelope("events", events)
+
+
+def get_tasks(conn: db.Conn, query: dict) -> Response:
+    return 200, output.envelope("tasks", output.tasks_data(conn))
+
+
+def get_report(conn: db.Conn, query: dict) -> Response:
+    r = task_id_or_err(conn, query)
+    if r.is_err():
+        return result_response("report", Err(r.unwrap_err()))
+    data = output.summary_data(
+        conn, param(query, "from"), param(query, "to"), 1, r.unwrap()
+    )
+    return result_response("report", data)
+
+
+def get_goals(conn: db.Conn, query: dict) -> Response:
+    names = output.task_names(conn)
+    items = [
+        {
+            "task_id": p.task_id,
+            "task": names.get(p.task_id, ""),
+            "period": p.period,
+            "target": p.target,
+            "done": p.done,
+        }
+        for p in goals.progress(conn)
+    ]
+    return 200, output.envelope("goals", {"goals": items})
+
+
+ReadRoutes: Final[dict[str, Callable[[db.Conn, dict], Response]]] = {
+    "/status": get_status,
+    "/events": get_events,
+    "/tasks": get_tasks,
+    "/report": get_report,
+    "/goals": get_goals,
+}
+
+WriteOps: Final = ("start", "split", "pause", "resume", "stop", "undo")
+
+
+class Writer:
+    """唯一的写入线程。Session 在该线程中创建，也只在该线程中使用。"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.session: Session | None = None
+        self.executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="tt-writer",
+            initializer=self.open,
+        )
+
+    def open(self) -> None:
+        self.session = Session(self.db_path)
+
+    def operate(self, op: str, body: dict) -> Response:
+        s = self.session
+        assert s is not None
+        r: Result[Event | None, MultiText]
+        if op == "start":
+            r = s.start(body.get("task"))
+        elif op == "undo":
+            r = s.undo()
+        else:
+            r = s.operate(op)
+
+        match r:
+            case Err(err):
+                return 400, output.envelope("error", output.error_data(err))
+            case Ok(event):
+                names = output.task_names(s.conn)
+                data = (
+                    None if event is None else output.event_dict(event, names)
+                )
+                return 200, output.envelope("status", {"event": data})
+            case _:
+                raise UnknownReturn
+
+    def compact(self) -> None:
+        """压缩未压缩的操作 (包括其他终端的命令追加的操作)"""
+        assert self.session is not None
+        db.compact_pending(self.session.conn)
+
+    def close(self) -> None:
+        def close_session() -> None:
+            if self.session is not None:
+                self.session.close()
+
+        self.executor.submit(close_session).result()
+        self.executor.shutdown()
+
+
+class Server:
+    def __init__(
+        self,
+        db_path: str,
+        allow_origin: tuple[str, ...] = (),
+        readers: int = Readers,
+    ):
+        self.pool = ReadPool(db_path, readers)
+        self.readers = ThreadPoolExecutor(
+            max_workers=readers, thread_name_prefix="tt-reader"
+        )
+        self.writer = Writer(db_path)
+        self.allow_origin = allow_origin
+
+    async def dispatch(
+        self, method: str, target: str, headers: dict[str, str], body: bytes
+    ) -> Response:
+        url = urlsplit(target)
+        loop = asyncio.get_running_loop()
+
+        if url.path in ReadRoutes:
+            if method != "GET":
+                return error(405, "use GET")
+            query = parse_qs(url.query)
+            func = ReadRoutes[url.path]
+            await loop.run_in_executor(
+                self.writer.executor, self.writer.compact
+            )
+            return await loop.run_in_executor(
+                self.readers, self.pool.run, func, query
+            )
+
+        op = url.path.strip("/")
+        if op not in WriteOps:
+            return error(404, f"not found: {url.path}")
+        if method != "POST":
+            return error(405, "use POST")
+        content_type = headers.get("content-type", "").split(";")[0]
+        if content_type.strip() != "application/json":
+            return error(415, "Content-Type must be application/json")
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            return error(400, "invalid JSON")
+        if not isinstance(data, dict):
+            return error(400, "the body must be a JSON object")
+        return await loop.run_in_executor(
+            self.writer.executor, self.writer.operate, op, data
+        )
+
+    def cors_headers(self, headers: dict[str, str]) -> list[str]:
+        origin = headers.get("origin")
+        if origin is None or origin not in self.allow_origin:
+            return []
+        return [
+            f"Access-Control-Allow-Origin: {origin}",
+            "Access-Control-Allow-Methods: GET, POST",
+            "Access-Control-Allow-Headers: Content-Type",
+            "Vary: Origin",
+        ]
+
+    async def respond(
+        self, method: str, target: str, headers: dict[str, str], body: bytes
+    ) -> tuple[int, bytes, list[str]]:
+        host = headers.get("host", "").rsplit(":", 1)[0]
+        if host not in AllowedHosts:
+            status, obj = error(403, f"host not allowed: {host}")
+        elif method == "OPTIONS":
+            return 204, b"", self.cors_headers(headers)
+        else:
+            try:
+                status, obj = await self.dispatch(
+                    method, target, headers, body
+                )
+            except Exception as e:
+                status, obj = error(500, f"{type(e).__name__}: {e}")
+        content = json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+        extra = ["Content-Type: application/json; charset=utf-8"]
+        return status, content.encode(), extra + self.cors_headers(headers)
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """一个连接可以发送多个请求 (HTTP/1.1 keep-alive)"""
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HTTPError as e:
+                    status, obj = error(e.status, str(e))
+                    content = json.dumps(obj).encode()
+                    write_response(writer, status, content, [], False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, target, version, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                if version == "HTTP/1.0":
+                    keep_alive = (
+                        headers.get("connection", "").lower() == "keep-alive"
+                    )
+                status, content, extra = await self.respond(
+                    method, target, headers, body
+                )
+                write_response(writer, status, content, extra, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self) -> None:
+        self.readers.shutdown()
+        self.pool.close()
+        self.writer.close()
+
+
+async def read_request(
+    reader: asyncio.StreamReader,
+) -> tuple[str, str, str, dict[str, str], bytes] | None:
+    """(method, target, version, headers, body), 连接已关闭时返回 None."""
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(400, "bad request line")
+
+    headers: dict[str, str] = {}
+    for _ in range(MaxHeaders):
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise HTTPError(400, "too many headers")
+
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise HTTPError(400, "bad Content-Length")
+    if length > MaxBody:
+        raise HTTPError(413, "body too large")
+    body = await reader.readexactly(length) if length > 0 else b""
+    return method, target, version, headers, body
+
+
+def write_response(
+    writer: asyncio.StreamWriter,
+    status: int,
+    content: bytes,
+    extra: list[str],
+    keep_alive: bool,
+) -> None:
+    lines = [f"HTTP/1.1 {status} {Reasons.get(status, '')}"]
+    lines += extra
+    lines.append(f"Content-Length: {len(content)}")
+    lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+    head = "\r\n".join(lines) + "\r\n\r\n"
+    writer.write(head.encode("latin-1") + content)
+
+
+async def serve_forever(
+    server: Server, port: int, started: Callable[[int], None] | None = None
+) -> None:
+    """started(port) 在开始监听后调用 (port 为 0 时由系统分配)"""
+    s = await asyncio.start_server(server.handle, Host, port)
+    if started is not None:
+        started(s.sockets[0].getsockname()[1])
+    async with s:
+        await s.serve_forever()
+
+
+def run(
+    db_path: str, port: int = ServerPort, allow_origin: tuple[str, ...] = ()
+) -> None:
+    server = Server(db_path, allow_origin)
+
+    def started(port: int) -> None:
+        print(f"Listening on http://{Host}:{port}/ (Ctrl-C to quit)")
+
+    try:
+        asyncio.run(serve_forever(server, port, started))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
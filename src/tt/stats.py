@@ -0,0 +1,317 @@
+"""专注统计 (tt stats)
+
+只遍历一次 event.laps, 全部统计量都保存在可合并的累加器中，
+内存占用与小节的数量无关 (只与不同的小节长度的数量有关)。
+"""
+
+import heapq
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import chain, islice
+from typing import Final, Iterable
+
+from . import model
+from .model import Lap, LapName
+
+try:
+    import numpy as np
+
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+PauseName: Final = LapName.Pause.name
+SplitName: Final = LapName.Split.name
+
+ChunkSize: Final = 65536
+"""使用 NumPy 时，每次解码的事件数量 (限制内存占用)"""
+
+PauseBuckets: Final = (5, 10, 15, 30, 60)
+"""休息时长分布的分界 (单位：分钟)"""
+
+
+@lru_cache(maxsize=4096)
+def utc_offset(hour: int) -> int:
+    """本地时间与 UTC 的差 (秒)，hour 是 timestamp // 3600"""
+    return time.localtime(hour * 3600).tm_gmtoff
+
+
+def percentile(counter: Counter[int], p: int) -> int:
+    """nearest-rank 百分位数。counter 是 {数值: 次数}"""
+    n = sum(counter.values())
+    if n == 0:
+        return 0
+    rank = max(1, -(-p * n // 100))  # ceil(p * n / 100)
+    seen = 0
+    for value in sorted(counter):
+        seen += counter[value]
+        if seen >= rank:
+            return value
+    raise ValueError("unreachable")
+
+
+@dataclass
+class FocusStats:
+    """专注统计累加器，可用 merge() 合并分别计算的部分结果。"""
+
+    events: int = 0
+    laps: Counter[int] = field(default_factory=Counter)
+    """工作小节长度 (秒) -> 次数"""
+    pauses: Counter[int] = field(default_factory=Counter)
+    """休息小节长度 (秒) -> 次数"""
+    splits: Counter[int] = field(default_factory=Counter)
+    """每个事件的工作小节数 -> 事件数"""
+    longest: int = 0
+    """最长的连续专注 (相邻的工作小节之间没有休息或间断)，单位：秒"""
+    longest_event: str = ""
+    hours: list[int] = field(default_factory=lambda: [0] * 24)
+    """每个钟点 (本地时间 0-23 点) 的工作时长合计，单位：秒"""
+
+    def add_event(self, event_id: str, laps: Iterable[Lap]) -> None:
+        self.events += 1
+        n_splits = 0
+        block = 0
+        block_end = -1
+        for name, start, end, length in laps:
+            if end == 0:
+                continue  # 未结束的小节
+            if name == PauseName:
+                self.pauses[length] += 1
+                block_end = -1
+                continue
+
+            n_splits += 1
+            self.laps[length] += 1
+            block = block + length if start == block_end else length
+            block_end = end
+            if block > self.longest:
+                self.longest = block
+                self.longest_event = event_id
+            self.add_hours(start, length)
+
+        self.splits[n_splits] += 1
+
+    def add_hours(self, start: int, length: int) -> None:
+        """把一个工作小节的时长分配到本地时间的各个钟点。
+
+        整个小节统一使用小节开始时的 UTC 偏移。
+        """
+        local = start + utc_offset(start // 3600)
+        while length > 0:
+            n = min(length, 3600 - local % 3600)
+            self.hours[local // 3600 % 24] += n
+            local += n
+            length -= n
+
+    def merge(self, other: "FocusStats") -> "FocusStats":
+        self.events += other.events
+        self.laps.update(other.laps)
+        self.pauses.update(other.pauses)
+        self.splits.update(other.splits)
+        if other.longest > self.longest:
+            self.longest = other.longest
+            self.longest_event = other.longest_event
+        self.hours = [a + b for a, b in zip(self.hours, other.hours)]
+        return self
+
+    def lap_count(self) -> int:
+        return sum(self.laps.values())
+
+    def work(self) -> int:
+        return sum(k * v for k, v in self.laps.items())
+
+    def mean(self) -> int:
+        n = self.lap_count()
+        return self.work() // n if n else 0
+
+    def pause_distribution(self) -> list[tuple[str, int]]:
+        """[(区间, 次数)], 区间的单位是分钟"""
+        bounds = [b * 60 for b in PauseBuckets]
+        counts = [0] * (len(bounds) + 1)
+        for length, n in self.pauses.items():
+            i = next((i for i, b in enumerate(bounds) if length < b), -1)
+            counts[i] += n
+        labels = [f"< {PauseBuckets[0]}m"]
+        labels += [
+            f"{a}-{b}m" for a, b in zip(PauseBuckets, PauseBuckets[1:])
+        ]
+        labels.append(f">= {PauseBuckets[-1]}m")
+        return list(zip(labels, counts))
+
+
+@dataclass
+class TopK:
+    """最大的 n 项 (大小固定的最小堆)，可用 merge() 合并。
+
+    项目是元组，按元组的顺序比较 (第一项是长度)。
+    """
+
+    n: int
+    items: list[tuple] = field(default_factory=list)
+
+    def full(self) -> bool:
+        return len(self.items) >= self.n
+
+    def min(self) -> int:
+        """堆满时最小的长度，未满时返回 -1"""
+        return self.items[0][0] if self.full() else -1
+
+    def push(self, item: tuple) -> None:
+        if not self.full():
+            heapq.heappush(self.items, item)
+        elif item > self.items[0]:
+            heapq.heapreplace(self.items, item)
+
+    def merge(self, other: "TopK") -> "TopK":
+        for item in other.items:
+            self.push(item)
+        return self
+
+    def sorted(self) -> list[tuple]:
+        return sorted(self.items, reverse=True)
+
+
+def top_laps(rows: Iterable[tuple[str, str, int, bytes]], n: int) -> TopK:
+    """rows 是 (event_id, task_id, work, laps blob) 的迭代器。
+
+    逐行解包，只保留最长的 n 个工作小节 (length, start, event_id, task_id),
+    内存占用与事件数量无关。每个小节都不会超过事件的总工作时长，因此
+    work 小于堆中最短的小节的事件不必解包。
+    """
+    result = TopK(n)
+    for event_id, task_id, work, laps in rows:
+        if work < result.min():
+            continue
+        for name, start, end, length in model.unpack(laps):
+            if name == SplitName and end != 0:
+                result.push((length, start, event_id, task_id))
+    return result
+
+
+def collect(
+    rows: Iterable[tuple[str, bytes]], use_numpy: bool | None = None
+) -> FocusStats:
+    """rows 是 (event_id, laps blob) 的迭代器，逐行解包并累加。
+
+    如果已安装 NumPy (并且 use_numpy 不是 False), 则分块解码为 int64 数组
+    并向量化计算，结果与纯 Python 版本完全相同。
+    """
+    if use_numpy is None:
+        use_numpy = HAS_NUMPY
+    if use_numpy:
+        return collect_numpy(rows)
+
+    result = FocusStats()
+    for event_id, laps in rows:
+        result.add_event(event_id, model.unpack(laps))
+    return result
+
+
+def laps_array(rows: list[tuple[str, bytes]]):
+    """把 laps blob 解码为 int64 数组，每行是 (event, kind, start, end, length)
+
+    其中 event 是 rows 中的序号，kind 为 0 表示工作小节，1 表示休息小节。
+    """
+    # 把多个 msgpack 对象拼接为一个 msgpack 数组，只需解包一次。
+    header = b"\xdd" + len(rows).to_bytes(4, "big")
+    laps = model.unpack(header + b"".join(blob for _, blob in rows))
+    flat = list(chain.from_iterable(laps))
+    if not flat:
+        return np.empty((0, 5), dtype=np.int64)
+
+    lap_dtype = [("name", "U8"), ("start", "i8"), ("end", "i8"), ("length", "i8")]
+    a = np.array(flat, dtype=lap_dtype)
+    n_laps = np.fromiter(map(len, laps), dtype=np.int64, count=len(laps))
+    return np.column_stack(
+        (
+            np.repeat(np.arange(len(laps), dtype=np.int64), n_laps),
+            (a["name"] == PauseName).astype(np.int64),
+            a["start"],
+            a["end"],
+            a["length"],
+        )
+    )
+
+
+def counter_from(values) -> Counter[int]:
+    keys, counts = np.unique(values, return_counts=True)
+    return Counter(dict(zip(keys.tolist(), counts.tolist())))
+
+
+def collect_numpy(rows: Iterable[tuple[str, bytes]]) -> FocusStats:
+    result = FocusStats()
+    rows = iter(rows)
+    while chunk := list(islice(rows, ChunkSize)):
+        result.merge(stats_from_array(chunk, laps_array(chunk)))
+    return result
+
+
+def stats_from_array(rows: list[tuple[str, bytes]], a) -> FocusStats:
+    result = FocusStats(events=len(rows))
+    a = a[a[:, 3] != 0]  # 忽略未结束的小节
+    event, kind, start, end, length = a.T
+    is_split = kind == 0
+
+    result.laps = counter_from(length[is_split])
+    result.pauses = counter_from(length[~is_split])
+    n_splits = np.bincount(event[is_split], minlength=len(rows))
+    result.splits = counter_from(n_splits)
+
+    # 连续专注: 与同一事件中的上一个工作小节首尾相连的工作小节。
+    linked = np.zeros(len(a), dtype=bool)
+    linked[1:] = (
+        is_split[1:]
+        & is_split[:-1]
+        & (event[1:] == event[:-1])
+        & (start[1:] == end[:-1])
+    )
+    splits = np.flatnonzero(is_split)
+    if len(splits):
+        heads = splits[~linked[splits]]
+        blocks = np.add.reduceat(length, heads)
+        # reduceat 会把两个 head 之间的休息小节也加进来，需要减去。
+        blocks -= np.add.reduceat(np.where(is_split, 0, length), heads)
+        i = int(np.argmax(blocks))
+        if blocks[i] > 0:
+            result.longest = int(blocks[i])
+            result.longest_event = rows[int(event[heads[i]])][0]
+
+    result.hours = hours_from_array(start[is_split], length[is_split])
+    return result
+
+
+def utc_offsets(hours):
+    """向量化版本的 utc_offset
+
+    先按天计算，只有一天的首尾偏移不同 (夏令时切换) 时才逐个钟点计算。
+    """
+    days, inverse = np.unique(hours // 24, return_inverse=True)
+    first = np.array([utc_offset(d * 24) for d in days.tolist()], dtype=np.int64)
+    last = np.array(
+        [utc_offset(d * 24 + 23) for d in days.tolist()], dtype=np.int64
+    )
+    offsets = first[inverse]
+    changed = np.flatnonzero((first != last)[inverse])
+    offsets[changed] = [utc_offset(h) for h in hours[changed].tolist()]
+    return offsets
+
+
+def hours_from_array(start, length) -> list[int]:
+    """向量化版本的 FocusStats.add_hours"""
+    keep = length > 0
+    start, length = start[keep], length[keep]
+    local = start + utc_offsets(start // 3600)
+    first = local // 3600
+    last = (local + length - 1) // 3600
+
+    # 每个小节按钟点展开为多行。
+    n = last - first + 1
+    lap = np.repeat(np.arange(len(local)), n)
+    hour = first[lap] + np.arange(len(lap)) - np.repeat(np.cumsum(n) - n, n)
+    lo = np.maximum(local[lap], hour * 3600)
+    hi = np.minimum(local[lap] + length[lap], (hour + 1) * 3600)
+    hours = np.zeros(24, dtype=np.int64)
+    np.add.at(hours, hour % 24, hi - lo)
+    return hours.tolist()
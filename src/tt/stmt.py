@@ -2,8 +2,158 @@ from typing import Final
 
 Enable_foreign_keys: Final = "PRAGMA foreign_keys = 1;"
 
+Enable_incremental_vacuum: Final = "PRAGMA auto_vacuum = INCREMENTAL;"
+
+Enable_wal: Final = "PRAGMA journal_mode = WAL;"
+Checkpoint_wal: Final = "PRAGMA wal_checkpoint(TRUNCATE);"
+
+Now_ms: Final = "CAST((julianday('now') - 2440587.5) * 86400000 AS int)"
+"""SQLite 表达式：现在的 Unix 时间 (毫秒)"""
+
+Sync_schema: Final = f"""
+CREATE INDEX IF NOT EXISTS idx_task_updated ON task(updated_at);
+CREATE INDEX IF NOT EXISTS idx_event_updated ON event(updated_at);
+
+CREATE TABLE IF NOT EXISTS tombstone
+(
+    kind        text   NOT NULL,
+    id          text   NOT NULL COLLATE NOCASE,
+    deleted_at  int    NOT NULL,
+    PRIMARY KEY (kind, id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_tombstone_deleted ON tombstone(deleted_at);
+
+CREATE TRIGGER IF NOT EXISTS task_inserted AFTER INSERT ON task
+BEGIN
+    UPDATE task SET updated_at = {Now_ms}
+        WHERE id = NEW.id AND NEW.updated_at = 0;
+    DELETE FROM tombstone WHERE kind = 'task' AND id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS task_updated AFTER UPDATE ON task
+WHEN NEW.updated_at = OLD.updated_at
+BEGIN
+    UPDATE task SET updated_at = max({Now_ms}, OLD.updated_at + 1)
+        WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS task_deleted AFTER DELETE ON task
+BEGIN
+    INSERT OR REPLACE INTO tombstone (kind, id, deleted_at)
+        VALUES ('task', OLD.id, {Now_ms});
+END;
+
+CREATE TRIGGER IF NOT EXISTS event_inserted AFTER INSERT ON event
+BEGIN
+    UPDATE event SET updated_at = {Now_ms}
+        WHERE id = NEW.id AND NEW.updated_at = 0;
+    DELETE FROM tombstone WHERE kind = 'event' AND id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS event_updated AFTER UPDATE ON event
+WHEN NEW.updated_at = OLD.updated_at
+BEGIN
+    UPDATE event SET updated_at = max({Now_ms}, OLD.updated_at + 1)
+        WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS event_deleted AFTER DELETE ON event
+BEGIN
+    INSERT OR REPLACE INTO tombstone (kind, id, deleted_at)
+        VALUES ('event', OLD.id, {Now_ms});
+END;
+"""
+"""同步 (tt sync) 所需的索引、墓碑表与触发器。
+
+每次插入或修改 task/event 时，触发器把 updated_at 设为现在 (毫秒, 同一行
+单调递增), 除非该语句明确地修改了 updated_at (应用其他设备的修改时保留原值)。
+删除时在 tombstone 表中留下记录。
+"""
+
+Local_day: Final = "date({}.started, 'unixepoch', 'localtime')"
+"""SQLite 表达式：事件开始于本地时间的哪一天 (YYYY-MM-DD)"""
+New_day: Final = Local_day.format("NEW")
+Old_day: Final = Local_day.format("OLD")
+
+Daily_work_schema: Final = f"""
+CREATE TABLE IF NOT EXISTS daily_work
+(
+    day       text   NOT NULL,
+    task_id   text   NOT NULL COLLATE NOCASE,
+    work      int    NOT NULL,
+    PRIMARY KEY (day, task_id)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS daily_work_inserted AFTER INSERT ON event
+BEGIN
+    INSERT INTO daily_work (day, task_id, work)
+        VALUES ({New_day}, coalesce(NEW.task_id, ''), NEW.work)
+        ON CONFLICT (day, task_id) DO UPDATE SET work = work + excluded.work;
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_work_updated
+AFTER UPDATE OF task_id, started, work ON event
+WHEN NEW.task_id IS NOT OLD.task_id OR NEW.started != OLD.started
+    OR NEW.work != OLD.work
+BEGIN
+    UPDATE daily_work SET work = work - OLD.work
+        WHERE day = {Old_day} AND task_id = coalesce(OLD.task_id, '');
+    INSERT INTO daily_work (day, task_id, work)
+        VALUES ({New_day}, coalesce(NEW.task_id, ''), NEW.work)
+        ON CONFLICT (day, task_id) DO UPDATE SET work = work + excluded.work;
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_work_deleted AFTER DELETE ON event
+BEGIN
+    UPDATE daily_work SET work = work - OLD.work
+        WHERE day = {Old_day} AND task_id = coalesce(OLD.task_id, '');
+END;
+"""
+"""每天 (本地时间) 每个任务类型的工作时长合计 (tt goals)
+
+由触发器随 event 表增量更新 (包括 stop 时压缩写回的 laps/work, 以及修改、
+合并、删除、同步等), 查询今天或本周的合计只需读取几行，不必扫描事件。
+未压缩的操作 (正在计时的事件) 尚未计入，见 goals.progress.
+"""
+
+Rebuild_daily_work: Final = f"""
+DELETE FROM daily_work;
+INSERT INTO daily_work (day, task_id, work)
+    SELECT {Local_day.format("event")}, coalesce(task_id, ''), sum(work)
+    FROM event GROUP BY 1, 2;
+"""
+
+ChangeCounterName: Final = "change-counter"
+
+Change_counter_schema: Final = (
+    f"""
+INSERT OR IGNORE INTO metadata (name, value) VALUES ('{ChangeCounterName}', 0);
+"""
+    + "".join(
+        f"""
+CREATE TRIGGER IF NOT EXISTS {table}_{op.lower()}_counted
+AFTER {op} ON {table}
+BEGIN
+    UPDATE metadata SET value = max(value + 1, {Now_ms})
+        WHERE name = '{ChangeCounterName}';
+END;
+"""
+        for table in ("task", "event", "lap_op")
+        for op in ("INSERT", "UPDATE", "DELETE")
+    )
+)
+"""metadata 中的修改计数 (整数，不是 msgpack), 任何 task/event/lap_op 的修改都会
+使它变大，用作查询结果缓存 (cache.py) 的键。
+
+取 max(value + 1, 现在的毫秒数), 即使恢复了旧的备份，之后的计数也不会与
+备份之后曾经出现过的计数重复。
+"""
+
 Create_tables: Final = """
 
+PRAGMA auto_vacuum = INCREMENTAL;
+
 CREATE TABLE IF NOT EXISTS metadata
 (
     name    text   NOT NULL UNIQUE,
@@ -12,9 +162,10 @@ CREATE TABLE IF NOT EXISTS metadata
 
 CREATE TABLE IF NOT EXISTS task
 (
-    id      text   PRIMARY KEY COLLATE NOCASE,
-    name    text   NOT NULL UNIQUE COLLATE NOCASE,
-    alias   text   NOT NULL COLLATE NOCASE
+    id          text   PRIMARY KEY COLLATE NOCASE,
+    name        text   NOT NULL UNIQUE COLLATE NOCASE,
+    alias       text   NOT NULL COLLATE NOCASE,
+    updated_at  int    NOT NULL DEFAULT 0
 );
 
 CREATE INDEX IF NOT EXISTS idx_task_alias ON task(alias);
@@ -22,30 +173,111 @@ CREATE INDEX IF NOT EXISTS idx_task_alias ON task(alias);
 CREATE TABLE IF NOT EXISTS event
 (
     id        text   PRIMARY KEY COLLATE NOCASE,
-    task_id   text   REFERENCES task(id) COLLATE NOCASE,
+    task_id   text   REFERENCES task(id) ON DELETE CASCADE COLLATE NOCASE,
     started   int    NOT NULL,
     status    text   NOT NULL COLLATE NOCASE,
     laps      blob   NOT NULL,
     work      int    NOT NULL,
-    notes     text   NOT NULL
+    notes     text   NOT NULL,
+    updated_at int   NOT NULL DEFAULT 0
 );
 
-CREATE INDEX IF NOT EXISTS idx_event_task_id ON event(task_id);
+CREATE INDEX IF NOT EXISTS idx_event_task_started
+    ON event(task_id, started, work);
 CREATE INDEX IF NOT EXISTS idx_event_started ON event(started);
+
+CREATE TABLE IF NOT EXISTS lap_op
+(
+    id          integer   PRIMARY KEY,
+    event_id    text      NOT NULL COLLATE NOCASE
+                          REFERENCES event(id) ON DELETE CASCADE,
+    op          text      NOT NULL,
+    at          int       NOT NULL,
+    split_min   int,
+    pause_min   int,
+    pause_max   int,
+    snapshot    blob,
+    compacted   int       NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_lap_op_event ON lap_op(event_id, id);
+CREATE INDEX IF NOT EXISTS idx_lap_op_pending
+    ON lap_op(event_id) WHERE compacted = 0;
+""" + Sync_schema + Daily_work_schema + Change_counter_schema
+
+Migrations: Final = (
+    # 1: (task_id, started, work) 复合索引，同时也是按任务类型统计的覆盖索引。
+    """
+    DROP INDEX IF EXISTS idx_event_task_id;
+    CREATE INDEX IF NOT EXISTS idx_event_task_started
+        ON event(task_id, started, work);
+    """,
+    # 2: lap_op 操作日志 (旧事件没有日志，只能读取 event.laps)。
+    """
+    CREATE TABLE IF NOT EXISTS lap_op
+    (
+        id          integer   PRIMARY KEY,
+        event_id    text      NOT NULL COLLATE NOCASE
+                              REFERENCES event(id) ON DELETE CASCADE,
+        op          text      NOT NULL,
+        at          int       NOT NULL,
+        split_min   int,
+        pause_min   int,
+        pause_max   int,
+        snapshot    blob,
+        compacted   int       NOT NULL DEFAULT 0
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_lap_op_event ON lap_op(event_id, id);
+    CREATE INDEX IF NOT EXISTS idx_lap_op_pending
+        ON lap_op(event_id) WHERE compacted = 0;
+    """,
+    # 3: event.task_id 加上 ON DELETE CASCADE (SQLite 只能重建表)。
+    """
+    CREATE TABLE event_new
+    (
+        id        text   PRIMARY KEY COLLATE NOCASE,
+        task_id   text   REFERENCES task(id) ON DELETE CASCADE COLLATE NOCASE,
+        started   int    NOT NULL,
+        status    text   NOT NULL COLLATE NOCASE,
+        laps      blob   NOT NULL,
+        work      int    NOT NULL,
+        notes     text   NOT NULL
+    );
+    INSERT INTO event_new (id, task_id, started, status, laps, work, notes)
+        SELECT id, task_id, started, status, laps, work, notes FROM event;
+    DROP TABLE event;
+    ALTER TABLE event_new RENAME TO event;
+    CREATE INDEX idx_event_task_started ON event(task_id, started, work);
+    CREATE INDEX idx_event_started ON event(started);
+    """,
+    # 4: 同步所需的 updated_at, 墓碑表与触发器。
+    """
+    ALTER TABLE task ADD COLUMN updated_at int NOT NULL DEFAULT 0;
+    ALTER TABLE event ADD COLUMN updated_at int NOT NULL DEFAULT 0;
+    """
+    + Sync_schema,
+    # 5: 每天的工作时长合计 (tt goals), 并从现有的事件计算初始值。
+    Daily_work_schema + Rebuild_daily_work,
+    # 6: 修改计数 (查询结果缓存的键)。
+    Change_counter_schema,
+)
+"""数据库结构的修改，按顺序执行。PRAGMA user_version 是已执行的数量。
+Create_tables 总是最新的结构，新数据库不需要执行 Migrations.
+执行时外键约束是关闭的 (重建表时不能触发 ON DELETE CASCADE)。
 """
 
 Insert_metadata: Final = """
     INSERT INTO metadata (name, value) VALUES (:name, :value);
 """
 Get_metadata: Final = "SELECT value FROM metadata WHERE name=?;"
+Get_change_counter: Final = (
+    f"SELECT value FROM metadata WHERE name='{ChangeCounterName}';"
+)
 Update_metadata: Final = "UPDATE metadata SET value=:value WHERE name=:name;"
-
-Get_task_by_id: Final = """
-    SELECT * FROM task WHERE id=?;
-"""
-
-Get_task_by_name: Final = """
-    SELECT * FROM task WHERE name=?;
+Upsert_metadata: Final = """
+    INSERT INTO metadata (name, value) VALUES (:name, :value)
+    ON CONFLICT(name) DO UPDATE SET value=excluded.value;
 """
 
 Insert_task: Final = """
@@ -77,10 +309,24 @@ Get_event_by_id: Final = """
     SELECT * FROM event WHERE id=?;
 """
 
+Get_events_by_ids: Final = """
+    SELECT * FROM event WHERE id IN ({}) ORDER BY started;
+"""
+
 Get_recent_events: Final = """
     SELECT * FROM event ORDER BY started DESC LIMIT ?;
 """
 
+Get_recent_task_events: Final = """
+    SELECT * FROM event WHERE task_id = ? ORDER BY started DESC LIMIT ?;
+"""
+
+Get_recent_event_ids: Final = """
+    SELECT event.id, task.name, event.started
+    FROM event LEFT JOIN task ON task.id = event.task_id
+    ORDER BY event.started DESC LIMIT ?;
+"""
+
 Count_events_range: Final = """
     SELECT count(*) FROM event WHERE started>=:start and started<=:end;
 """
@@ -90,6 +336,11 @@ Get_events_by_date: Final = """
     ORDER BY started DESC;
 """
 
+Get_events_by_date_asc: Final = """
+    SELECT * FROM event WHERE started >= :start and started < :end
+    ORDER BY started;
+"""
+
 Count_events_by_date: Final = """
     SELECT count(*) FROM event WHERE started >= :start and started < :end
     ORDER BY started DESC;
@@ -99,14 +350,250 @@ Update_laps: Final = """
     UPDATE event SET status=:status, laps=:laps, work=:work WHERE id=:id;
 """
 
+Update_merged_event: Final = """
+    UPDATE event SET laps=:laps, work=:work, notes=:notes WHERE id=:id;
+"""
+
 Delete_event: Final = """
     DELETE FROM event WHERE id=?;
 """
 
-Delete_events: Final = """
-    DELETE FROM event WHERE task_id=?;
+Delete_task_events_batch_in: Final = """
+    DELETE FROM {schema}.event WHERE id IN (
+        SELECT id FROM {schema}.event WHERE task_id=? LIMIT ?
+    );
+"""
+
+Count_task_events_in: Final = """
+    SELECT count(*) FROM {schema}.event WHERE task_id=?;
 """
 
 Delete_task: Final = """
     DELETE FROM task WHERE id=?;
 """
+
+Delete_task_in: Final = "DELETE FROM {schema}.task WHERE id=?;"
+
+Get_events_by_date_in: Final = """
+    SELECT id, task_id, started, status, laps, work, notes FROM {schema}.event
+    WHERE started >= :start and started < :end
+"""
+
+Count_events_by_date_in: Final = """
+    SELECT count(*) FROM {schema}.event
+    WHERE started >= :start and started < :end
+"""
+
+Get_task_events_by_date_in: Final = """
+    SELECT id, task_id, started, status, laps, work, notes FROM {schema}.event
+    WHERE task_id = :task_id and started >= :start and started < :end
+"""
+
+Count_task_events_by_date_in: Final = """
+    SELECT count(*) FROM {schema}.event
+    WHERE task_id = :task_id and started >= :start and started < :end
+"""
+
+Get_archive_years: Final = """
+    SELECT DISTINCT CAST(strftime('%Y', started, 'unixepoch', 'localtime') AS int)
+    FROM event WHERE started < :end AND status = 'Stopped';
+"""
+
+Archive_tasks: Final = """
+    INSERT INTO {schema}.task (id, name, alias)
+    SELECT id, name, alias FROM main.task WHERE id IN (
+        SELECT task_id FROM main.event
+        WHERE started >= :start and started < :end AND status = 'Stopped'
+    ) ON CONFLICT(id) DO UPDATE SET name=excluded.name, alias=excluded.alias;
+"""
+
+Archive_events: Final = """
+    INSERT OR REPLACE INTO {schema}.event
+        (id, task_id, started, status, laps, work, notes, updated_at)
+    SELECT id, task_id, started, status, laps, work, notes, updated_at
+    FROM main.event
+    WHERE started >= :start and started < :end AND status = 'Stopped';
+"""
+
+Archive_lap_ops: Final = """
+    INSERT INTO {schema}.lap_op
+        (event_id, op, at, split_min, pause_min, pause_max, snapshot,
+         compacted)
+    SELECT event_id, op, at, split_min, pause_min, pause_max, snapshot,
+           compacted
+    FROM main.lap_op WHERE event_id IN (
+        SELECT id FROM main.event
+        WHERE started >= :start and started < :end AND status = 'Stopped'
+    ) ORDER BY id;
+"""
+
+Delete_archived_tombstones: Final = """
+    DELETE FROM main.tombstone WHERE kind = 'event' AND id IN (
+        SELECT id FROM {schema}.event
+        WHERE started >= :start and started < :end
+    );
+"""
+
+Delete_archived_events: Final = """
+    DELETE FROM main.event
+    WHERE started >= :start and started < :end AND status = 'Stopped';
+"""
+
+Sum_daily_work: Final = """
+    SELECT task_id, sum(work) FROM daily_work
+    WHERE day >= :start and day < :end GROUP BY task_id;
+"""
+
+Get_event_work: Final = "SELECT work FROM event WHERE id = ?;"
+
+Get_day_work_in: Final = """
+    SELECT date(started, 'unixepoch', 'localtime') AS day, sum(work) AS work
+    FROM {schema}.event WHERE started >= :start and started < :end
+    GROUP BY day
+"""
+
+Get_laps_in: Final = """
+    SELECT id, laps FROM {schema}.event
+    WHERE started >= :start and started < :end ORDER BY started;
+"""
+
+Get_task_laps_in: Final = """
+    SELECT id, laps FROM {schema}.event
+    WHERE task_id = :task_id and started >= :start and started < :end
+    ORDER BY started;
+"""
+
+Get_work_laps_in: Final = """
+    SELECT id, task_id, work, laps FROM event
+    WHERE started >= :start and started < :end;
+"""
+
+Get_task_work_laps_in: Final = """
+    SELECT id, task_id, work, laps FROM event
+    WHERE task_id = :task_id and started >= :start and started < :end;
+"""
+
+Get_top_events_in: Final = """
+    SELECT work, started, id, task_id FROM event
+    WHERE started >= :start and started < :end
+    ORDER BY work DESC, started DESC LIMIT :n;
+"""
+
+Get_top_task_events_in: Final = """
+    SELECT work, started, id, task_id FROM event
+    WHERE task_id = :task_id and started >= :start and started < :end
+    ORDER BY work DESC, started DESC LIMIT :n;
+"""
+
+Get_started_range: Final = "SELECT min(started), max(started) FROM event;"
+
+Sum_work_by_task: Final = """
+    SELECT event.task_id, task.name, count(*) AS events, sum(work) AS work
+    FROM event LEFT JOIN task ON task.id = event.task_id
+    WHERE started >= :start and started < :end
+    GROUP BY event.task_id;
+"""
+
+Sum_task_work: Final = """
+    SELECT event.task_id, task.name, count(*) AS events, sum(work) AS work
+    FROM event LEFT JOIN task ON task.id = event.task_id
+    WHERE event.task_id = :task_id and started >= :start and started < :end
+    GROUP BY event.task_id;
+"""
+
+Get_events_for_check: Final = """
+    SELECT id, started, status, laps, work FROM event;
+"""
+
+Get_orphan_task_ids: Final = """
+    SELECT DISTINCT task_id FROM event
+    WHERE task_id IS NULL OR task_id NOT IN (SELECT id FROM task);
+"""
+
+Insert_lap_op: Final = """
+    INSERT INTO lap_op
+        (event_id, op, at, split_min, pause_min, pause_max, snapshot,
+         compacted)
+    VALUES (:event_id, :op, :at, :split_min, :pause_min, :pause_max,
+            :snapshot, :compacted);
+"""
+
+Get_pending_lap_ops: Final = """
+    SELECT op, at, split_min, pause_min, pause_max FROM lap_op
+    WHERE event_id=? AND compacted=0 ORDER BY id;
+"""
+
+Get_lap_ops: Final = """
+    SELECT id, op, at, split_min, pause_min, pause_max, snapshot FROM lap_op
+    WHERE event_id=? ORDER BY id;
+"""
+
+Get_pending_event_ids: Final = """
+    SELECT DISTINCT event_id FROM lap_op WHERE compacted=0;
+"""
+
+Compact_lap_ops: Final = """
+    UPDATE lap_op SET compacted=1 WHERE event_id=? AND compacted=0;
+"""
+
+Delete_lap_op: Final = "DELETE FROM lap_op WHERE id=?;"
+
+Count_pending_lap_ops: Final = """
+    SELECT count(*) FROM lap_op WHERE event_id=? AND compacted=0;
+"""
+
+Get_changed_tasks: Final = """
+    SELECT id, name, alias, updated_at FROM task WHERE updated_at >= ?;
+"""
+
+Get_changed_events: Final = """
+    SELECT id, task_id, started, status, laps, work, notes, updated_at
+    FROM event WHERE updated_at >= ?;
+"""
+
+Get_tombstones_since: Final = """
+    SELECT kind, id, deleted_at FROM tombstone WHERE deleted_at >= ?;
+"""
+
+Get_now_ms: Final = f"SELECT {Now_ms};"
+
+Delete_task_events_before: Final = """
+    DELETE FROM event WHERE task_id=? AND updated_at <= ?;
+"""
+
+Count_task_events: Final = Count_task_events_in.format(schema="main")
+
+Revive_task: Final = f"""
+    UPDATE task SET updated_at = max(:deleted_at + 1, {Now_ms})
+    WHERE id=:id;
+"""
+"""墓碑不能删除的任务类型改为晚于墓碑的时间，同步到删除它的设备上时复活。"""
+
+Get_task_updated_at: Final = "SELECT updated_at FROM task WHERE id=?;"
+Get_event_updated_at: Final = "SELECT updated_at FROM event WHERE id=?;"
+Get_tombstone: Final = """
+    SELECT deleted_at FROM tombstone WHERE kind=? AND id=?;
+"""
+
+Upsert_task: Final = """
+    INSERT INTO task (id, name, alias, updated_at)
+    VALUES (:id, :name, :alias, :updated_at)
+    ON CONFLICT(id) DO UPDATE SET
+        name=excluded.name, alias=excluded.alias,
+        updated_at=excluded.updated_at;
+"""
+
+Upsert_event: Final = """
+    INSERT INTO event
+        (id, task_id, started, status, laps, work, notes, updated_at)
+    VALUES (:id, :task_id, :started, :status, :laps, :work, :notes,
+            :updated_at)
+    ON CONFLICT(id) DO UPDATE SET
+        task_id=excluded.task_id, started=excluded.started,
+        status=excluded.status, laps=excluded.laps, work=excluded.work,
+        notes=excluded.notes, updated_at=excluded.updated_at;
+"""
+
+Put_tombstone: Final = """
+    INSERT OR REPLACE INTO tombstone (kind, id, deleted_at) VALUES (?, ?, ?);
+"""
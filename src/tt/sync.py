@@ -0,0 +1,206 @@
+"""在多台设备之间同步数据 (tt sync)
+
+task 与 event 的每一行都有 updated_at (毫秒), 删除的行记录在 tombstone 表中
+(由触发器维护，见 stmt.Sync_schema)。导出时只打包 updated_at 不小于水位线
+(watermark) 的行及墓碑 (与水位线同一毫秒的行会重复导出，应用时会被忽略),
+应用时逐行比较时间，较新的一方获胜 (last-writer-wins)。
+
+从其他设备导入的行保留对方的时间，对方的时钟可能比本机快，因此水位线
+只取不晚于本机现在的时间，否则本机之后的修改会早于水位线而不被导出。
+"""
+
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Final
+
+from result import Err, Ok, Result
+
+from . import db, model, stmt
+from .model import MultiText
+
+SyncVersion: Final = 1
+"""变更集的格式版本"""
+
+WatermarkName: Final = "sync-watermark"
+"""metadata 中保存的上一次导出的水位线"""
+
+UpdatedAt: Final = {
+    "task": stmt.Get_task_updated_at,
+    "event": stmt.Get_event_updated_at,
+}
+DeleteRow: Final = {"task": stmt.Delete_task, "event": stmt.Delete_event}
+
+
+@dataclass
+class Changes:
+    since: int
+    watermark: int
+    tasks: list[tuple] = field(default_factory=list)
+    events: list[tuple] = field(default_factory=list)
+    tombstones: list[tuple] = field(default_factory=list)
+
+    def pack(self) -> bytes:
+        return model.pack(
+            dict(
+                version=SyncVersion,
+                since=self.since,
+                watermark=self.watermark,
+                tasks=self.tasks,
+                events=self.events,
+                tombstones=self.tombstones,
+            )
+        )
+
+
+@dataclass
+class ApplyResult:
+    tasks: int = 0
+    events: int = 0
+    deleted: int = 0
+    skipped: int = 0
+    """本地较新而被忽略的行"""
+    conflicts: list[str] = field(default_factory=list)
+    """违反约束 (例如任务名称重复) 而无法应用的行"""
+
+
+def get_watermark(conn: db.Conn) -> int:
+    return db.get_meta(conn, WatermarkName) or 0
+
+
+def export_changes(conn: db.Conn, since: int) -> Changes:
+    """updated_at (或 deleted_at) 不小于 since 的全部行
+
+    水位线是其中不晚于本机现在的最大时间 (见本模块的说明)。
+    """
+    db.compact_pending(conn)  # 未压缩的操作尚未写入 event 表
+    now = conn.execute(stmt.Get_now_ms).fetchone()[0]
+    changes = Changes(since, since)
+    for table, query in (
+        (changes.tasks, stmt.Get_changed_tasks),
+        (changes.events, stmt.Get_changed_events),
+        (changes.tombstones, stmt.Get_tombstones_since),
+    ):
+        for row in conn.execute(query, (since,)):
+            table.append(tuple(row))
+            if row[-1] <= now:
+                changes.watermark = max(changes.watermark, row[-1])
+    return changes
+
+
+def load_changes(data: bytes) -> Result[Changes, MultiText]:
+    err = MultiText(cn="无法识别的同步文件", en="Not a sync file")
+    try:
+        d = model.unpack(data)
+    except ValueError:
+        return Err(err)
+    if not isinstance(d, dict) or d.get("version") != SyncVersion:
+        return Err(err)
+    keys = ("since", "watermark", "tasks", "events", "tombstones")
+    return Ok(Changes(*(d[k] for k in keys)))
+
+
+def local_time(conn: db.Conn, kind: str, row_id: str) -> int | None:
+    """本地该行的 updated_at 或 deleted_at (取较大者), 不存在时返回 None."""
+    times = []
+    row = conn.execute(UpdatedAt[kind], (row_id,)).fetchone()
+    if row is not None:
+        times.append(row[0])
+    row = conn.execute(stmt.Get_tombstone, (kind, row_id)).fetchone()
+    if row is not None:
+        times.append(row[0])
+    return max(times) if times else None
+
+
+def apply_row(
+    conn: db.Conn, kind: str, query: str, param: dict, result: ApplyResult
+) -> bool:
+    local = local_time(conn, kind, param["id"])
+    if local is not None and local >= param["updated_at"]:
+        result.skipped += 1
+        return False
+    try:
+        conn.execute(query, param)
+    except sqlite3.IntegrityError as e:
+        result.conflicts.append(f"{kind} {param['id']}: {e}")
+        return False
+    return True
+
+
+def delete_task_events(
+    conn: db.Conn, task_id: str, deleted_at: int, result: ApplyResult
+) -> bool:
+    """删除该任务类型在 deleted_at 之前修改的事件 (而不是级联删除全部事件)。
+
+    还有较新的事件时保留该任务类型并返回 False.
+    """
+    cursor = conn.execute(
+        stmt.Delete_task_events_before, (task_id, deleted_at)
+    )
+    result.deleted += cursor.rowcount
+    if conn.execute(stmt.Count_task_events, (task_id,)).fetchone()[0] == 0:
+        return True
+    conn.execute(stmt.Revive_task, dict(id=task_id, deleted_at=deleted_at))
+    result.skipped += 1
+    return False
+
+
+def apply_tombstone(
+    conn: db.Conn,
+    kind: str,
+    row_id: str,
+    deleted_at: int,
+    result: ApplyResult,
+) -> None:
+    row = conn.execute(UpdatedAt[kind], (row_id,)).fetchone()
+    if row is not None:
+        if row[0] > deleted_at:
+            result.skipped += 1  # 本地在删除之后修改过
+            return
+        if kind == "task" and not delete_task_events(
+            conn, row_id, deleted_at, result
+        ):
+            return
+        conn.execute(DeleteRow[kind], (row_id,))
+        result.deleted += 1
+    else:
+        old = conn.execute(stmt.Get_tombstone, (kind, row_id)).fetchone()
+        if old is not None and old[0] >= deleted_at:
+            return
+    conn.execute(stmt.Put_tombstone, (kind, row_id, deleted_at))
+
+
+def apply_changes(conn: db.Conn, changes: Changes) -> ApplyResult:
+    """在一个事务中应用全部修改 (先 task 后 event, 最后是墓碑)"""
+    result = ApplyResult()
+    with conn:
+        for t_id, name, alias, updated_at in changes.tasks:
+            param = dict(
+                id=t_id, name=name, alias=alias, updated_at=updated_at
+            )
+            if apply_row(conn, "task", stmt.Upsert_task, param, result):
+                result.tasks += 1
+
+        for row in changes.events:
+            e_id, task_id, started, status, laps, work, notes, updated_at = row
+            param = dict(
+                id=e_id,
+                task_id=task_id,
+                started=started,
+                status=status,
+                laps=laps,
+                work=work,
+                notes=notes,
+                updated_at=updated_at,
+            )
+            if apply_row(conn, "event", stmt.Upsert_event, param, result):
+                # 本地尚未压缩的操作已被覆盖
+                conn.execute(stmt.Compact_lap_ops, (e_id,))
+                result.events += 1
+
+        # 先删除事件，再删除任务类型 (删除任务类型会级联删除其事件)。
+        for kind, row_id, deleted_at in sorted(
+            changes.tombstones, key=lambda t: t[0] == "task"
+        ):
+            apply_tombstone(conn, kind, row_id, deleted_at, result)
+    db.invalidate_tasks(conn)
+    return result
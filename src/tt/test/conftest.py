@@ -0,0 +1,20 @@
+import pytest
+from .. import complete, db
+
+
+@pytest.fixture(autouse=True)
+def complete_cache_path(tmp_path, monkeypatch):
+    """Session 等会重写补全缓存，不能写入真实的配置文件夹。"""
+    path = tmp_path.joinpath(complete.CacheFilename)
+    monkeypatch.setattr(complete, "cache_path", path)
+    return path
+
+
+@pytest.fixture
+def temp_db_conn(tmp_path):
+    temp_db_path = tmp_path.joinpath(db.DB_Filename)
+    print(temp_db_path)
+    with db.connect(str(temp_db_path)) as conn:
+        db.create_tables(conn)
+        db.init_cfg(conn)
+        yield conn
@@ -0,0 +1,92 @@
+import pytest
+from .. import complete, db, hooks, model
+from ..api import Session
+from ..model import EventStatus
+from .test_db import insert_stopped_event
+
+
+@pytest.fixture
+def session(tmp_path):
+    db_path = str(tmp_path.joinpath(db.DB_Filename))
+    with db.connect(db_path) as conn:
+        db.create_tables(conn)
+        db.init_cfg(conn)
+        db.insert_task(conn, model.new_task({"name": "coding"}).unwrap())
+    conn.close()
+    with Session(db_path) as s:
+        yield s
+
+
+def test_session_flow(session, capsys):
+    assert session.status().is_err()
+    assert session.task("Coding").is_ok()
+    assert session.task("reading").is_err()
+
+    event = session.start("coding").unwrap()
+    assert session.status().unwrap().id == event.id
+    assert session.start("coding").is_err()  # 上一个事件未结束
+    assert session.resume().is_err()
+
+    assert session.pause().unwrap().status is EventStatus.Pausing
+    assert session.split().is_err()
+    assert session.resume().unwrap().status is EventStatus.Running
+    assert session.stop().unwrap().status is EventStatus.Stopped
+
+    # 工作时长小于下限，事件已被自动删除。
+    assert session.list() == []
+    assert session.pause().is_err()
+    assert capsys.readouterr().out == ""
+
+
+def test_session_sees_other_connections(session):
+    session.start("coding").unwrap()
+    other = db.connect(db.db_file(session.conn))
+    with other:
+        event = db.get_last_event(other).unwrap()
+        event.pause(session.cfg)
+        db.update_laps(other, event)
+    other.close()
+    assert session.status().unwrap().status is EventStatus.Pausing
+
+
+def test_session_fires_hooks(session, monkeypatch):
+    fired = []
+    monkeypatch.setattr(
+        hooks, "fire", lambda _, op, data: fired.append((op, data["deleted"]))
+    )
+    session.start("coding").unwrap()
+    session.pause().unwrap()
+    session.stop().unwrap()  # 时长不足，自动删除
+    assert fired == [("start", False), ("pause", False), ("stop", True)]
+
+
+def test_session_refreshes_complete_cache(session):
+    event = session.start("coding").unwrap()
+    cache = complete.load_cache()
+    assert cache["tasks"] == [["coding", ""]]
+    assert [e[0] for e in cache["events"]] == [event.id]
+
+    # split/pause 不改变补全的内容，不重写缓存。
+    complete.cache_path.unlink()
+    session.pause().unwrap()
+    assert complete.load_cache() is None
+
+    session.undo().unwrap()
+    session.undo().unwrap()  # 撤销 start, 删除该事件
+    assert complete.load_cache()["events"] == []
+
+
+def test_session_report_task(session):
+    conn = session.conn
+    coding = session.task("coding").unwrap()
+    reading = model.new_task({"name": "reading", "alias": "rd"}).unwrap()
+    db.insert_task(conn, reading)
+    insert_stopped_event(conn, coding, 1652700000, 600)
+    insert_stopped_event(conn, reading, 1652710000, 700)
+    conn.commit()
+
+    assert len(session.report().unwrap().tasks) == 2
+    summary = session.report(task="rd").unwrap()
+    assert list(summary.tasks) == [reading.id]
+    assert summary.tasks[reading.id].work == 700
+    assert session.report(task="nope").is_err()
@@ -0,0 +1,78 @@
+import pytest
+from .. import cache, db, model, report
+from .test_db import insert_stopped_event
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = cache.MemoryCache()
+    monkeypatch.setattr(cache, "store", store)
+    return store
+
+
+def test_change_counter(temp_db_conn):
+    conn = temp_db_conn
+    c0 = cache.change_counter(conn)
+    task = model.new_task({"name": "coding"}).unwrap()
+    db.insert_task(conn, task)
+    c1 = cache.change_counter(conn)
+    event = insert_stopped_event(conn, task, 1652700000, 600)
+    c2 = cache.change_counter(conn)
+    db.set_event_notes(conn, "notes", event.id)
+    c3 = cache.change_counter(conn)
+    db.delete_event(conn, event.id)
+    assert c0 < c1 < c2 < c3 < cache.change_counter(conn)
+
+
+def test_cached(temp_db_conn, store):
+    conn = temp_db_conn
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"n": len(calls)}
+
+    assert cache.cached(conn, "q", (1,), compute) == {"n": 1}
+    value = cache.cached(conn, "q", (1,), compute)
+    assert value == {"n": 1} and len(calls) == 1
+    value["n"] = 100  # 取出的是副本
+    assert cache.cached(conn, "q", (1,), compute) == {"n": 1}
+    assert cache.cached(conn, "q", (2,), compute) == {"n": 2}
+
+    db.insert_task(conn, model.new_task({"name": "coding"}).unwrap())
+    assert cache.cached(conn, "q", (1,), compute) == {"n": 3}
+    assert len(store.items) == 1  # 修改计数较小的旧项目已删除
+
+
+def test_summarize_cached(temp_db_conn, store):
+    conn = temp_db_conn
+    task = model.new_task({"name": "coding"}).unwrap()
+    db.insert_task(conn, task)
+    insert_stopped_event(conn, task, 1652700000, 600)
+    conn.commit()
+
+    end = model.now() + 1
+    first = report.summarize(conn, 0, end)
+    assert report.summarize(conn, 0, end + 60) == first  # 都到现在为止
+    assert store.hits == 1
+    assert report.summarize(conn, 0, 1652800000) == first
+    assert store.hits == 1
+
+    insert_stopped_event(conn, task, 1652710000, 700)
+    conn.commit()
+    assert report.summarize(conn, 0, end).work() == 1300
+
+
+def test_disk_cache(tmp_path):
+    path = tmp_path.joinpath(cache.CacheFilename)
+    a = cache.DiskCache(path, maxsize=2)
+    for key in ("x", "y", "z"):
+        a.put(key, key.upper(), lambda k: False)
+    assert list(a.items) == ["y", "z"]  # LRU
+
+    b = cache.DiskCache(path)
+    assert b.get("z") == (True, "Z")
+    assert b.get("x") == (False, None)
+
+    path.write_bytes(b"broken")
+    assert cache.DiskCache(path).get("z") == (False, None)
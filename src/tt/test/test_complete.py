@@ -0,0 +1,70 @@
+import subprocess
+import sys
+from pathlib import Path
+
+from .. import complete, db, model
+from .test_db import insert_stopped_event
+
+
+def test_no_heavy_imports():
+    code = (
+        "import sys, tt.complete; "
+        "print('arrow' in sys.modules, 'sqlite3' in sys.modules)"
+    )
+    src = Path(__file__).parents[2]
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=src,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert out.stdout.split() == ["False", "False"]
+    assert complete.app_config_dir == db.app_config_dir
+
+
+def test_what_to_complete():
+    cases = [
+        ([], "st", None),
+        (["start"], "", "alias"),
+        (["start"], "-", None),
+        (["list"], "", "event"),
+        (["list", "-v"], "", "event"),
+        (["list", "-day"], "", None),
+        (["delete", "-e"], "", "event"),
+        (["delete", "-t"], "", "task"),
+        (["stats", "--from", "2022-01-01", "-t"], "", "alias"),
+        (["top", "--laps", "10", "-t"], "", "alias"),
+        (["goals", "--task"], "", "alias"),
+        (["merge", "rc8j1f"], "", "event"),
+        (["merge", "--auto", "-day"], "", None),
+    ]
+    for args, incomplete, kind in cases:
+        assert complete.what_to_complete(args, incomplete) == kind, args
+
+
+def test_cache(temp_db_conn, tmp_path, monkeypatch):
+    monkeypatch.setattr(complete, "cache_path", tmp_path / "complete.json")
+    conn = temp_db_conn
+    db_path = str(db.db_file(conn))
+    assert complete.is_stale(complete.load_cache(), db_path)
+
+    task = model.new_task({"name": "reading", "alias": "读书"}).unwrap()
+    db.insert_task(conn, task)
+    event = insert_stopped_event(conn, task, 1652704503, 600)
+    conn.commit()
+    cache = complete.refresh(conn, db_path)
+    assert not complete.is_stale(complete.load_cache(), db_path)
+    assert complete.is_stale(complete.load_cache(), "other.db")
+
+    # 只有 force 时才重写 (由修改任务类型、事件的命令调用)
+    db.insert_task(conn, model.new_task({"name": "writing"}).unwrap())
+    conn.commit()
+    assert len(complete.refresh(conn, db_path)["tasks"]) == 1
+    assert len(complete.refresh(conn, db_path, force=True)["tasks"]) == 2
+
+    assert complete.task_items(cache, "读") == [("读书", "reading")]
+    assert complete.task_items(cache, "", False) == [("reading", "读书")]
+    assert complete.event_items(cache, event.id[:2].upper())[0][0] == event.id
+    assert complete.format_item("zsh", "a:b", "") == "plain\na:b\n_"
+    assert complete.format_item("zsh", "a:b", "x") == "plain\na\\:b\nx"
@@ -1,6 +1,8 @@
+import sqlite3
 from typing import Final
+
 import pytest
-from .. import stmt, model, db
+from .. import model, db, stmt
 
 
 cfg_keys = ("split_min", "pause_min", "pause_max")
@@ -16,16 +18,6 @@ def assert_equal_cfg(a, b):
         assert a[key] == b[key]
 
 
-@pytest.fixture
-def temp_db_conn(tmp_path):
-    temp_db_path = tmp_path.joinpath(db.DB_Filename)
-    print(temp_db_path)
-    with db.connect(str(temp_db_path)) as conn:
-        conn.executescript(stmt.Create_tables)
-        db.init_cfg(conn)
-        yield conn
-
-
 class TestDB:
     def test_update_cfg(self, temp_db_conn):
         cfg = model.Config(split_min=1, pause_min=2, pause_max=3)
@@ -56,3 +48,423 @@ class TestDB:
         assert (
             f.id == d["id"] and f.name == d["name"] and f.alias == d["alias"]
         )
+
+    def test_task_cache(self, temp_db_conn):
+        conn = temp_db_conn
+        a = model.new_task({"name": "reading", "alias": "读书"}).unwrap()
+        db.insert_task(conn, a).unwrap()
+        assert db.get_task_by_name(conn, "READING").unwrap().id == a.id
+        assert db.get_task_by_id(conn, a.id.upper()).unwrap().id == a.id
+        assert db.get_task_by_name(conn, "读书").is_err()
+        assert db.get_task_by_name_or_alias(conn, "读书").unwrap().id == a.id
+
+        # 本连接的修改 (write-through)
+        db.set_task_name(conn, "books", "reading")
+        assert db.get_task_by_name(conn, "reading").is_err()
+        assert db.get_task_by_name(conn, "books").unwrap().id == a.id
+        conn.commit()
+
+        # 其他连接的修改 (PRAGMA data_version)
+        other = db.connect(db.db_file(conn))
+        with other:
+            db.set_task_alias(other, "书", "books")
+        other.close()
+        assert db.get_task_by_name_or_alias(conn, "书").unwrap().id == a.id
+        assert db.get_task_by_name_or_alias(conn, "读书").is_err()
+
+        b = model.new_task({"name": "novel", "alias": "书"}).unwrap()
+        db.insert_task(conn, b).unwrap()
+        err = db.get_task_by_name_or_alias(conn, "书").unwrap_err()
+        assert err is not db.NoResultError
+        assert [t.name for t in db.get_all_task(conn)] == ["books", "novel"]
+
+
+def insert_stopped_event(conn, task, started, work):
+    laps = ((model.LapName.Split.name, started, started + work, work),)
+    d = dict(
+        task_id=task.id,
+        started=started,
+        status="Stopped",
+        laps=model.pack(laps),
+        work=work,
+    )
+    d["id"] = model.base_repr(started, 36)
+    event = model.Event(d)
+    db.insert_event(conn, event)
+    return event
+
+
+class TestMerge:
+    def test_get_events_by_ids(self, temp_db_conn):
+        task = model.new_task({"name": "coding"}).unwrap()
+        db.insert_task(temp_db_conn, task)
+        a = insert_stopped_event(temp_db_conn, task, 1652704503, 600)
+        b = insert_stopped_event(temp_db_conn, task, 1652705503, 600)
+        events = db.get_events_by_ids(temp_db_conn, [b.id, a.id, "none"])
+        assert [e.id for e in events] == [a.id, b.id]
+
+    def test_merge_events(self, temp_db_conn):
+        task = model.new_task({"name": "coding"}).unwrap()
+        db.insert_task(temp_db_conn, task)
+        a = insert_stopped_event(temp_db_conn, task, 1652704503, 600)
+        b = insert_stopped_event(temp_db_conn, task, 1652705503, 700)
+        a.laps += b.laps
+        a.work += b.work
+        a.notes = "merged"
+        db.merge_events(temp_db_conn, [(a, [b.id])])
+        c = db.get_event_by_id(temp_db_conn, a.id).unwrap()
+        assert c.work == 1300 and len(c.laps) == 2 and c.notes == "merged"
+        assert db.get_event_by_id(temp_db_conn, b.id).is_err()
+
+
+class TestArchive:
+    def test_archive_events(self, temp_db_conn):
+        conn = temp_db_conn
+        task = model.new_task({"name": "coding"}).unwrap()
+        db.insert_task(conn, task)
+        start_2020, _ = db.year_range(2020)
+        start_2021, _ = db.year_range(2021)
+        a = insert_stopped_event(conn, task, start_2020 + 3600, 600)
+        b = insert_stopped_event(conn, task, start_2021 + 3600, 600)
+        start_2022, _ = db.year_range(2022)
+        c = insert_stopped_event(conn, task, start_2022 + 3600, 600)
+        conn.commit()
+
+        assert db.archive_events(conn, 2022) == [(2020, 1), (2021, 1)]
+        assert db.archive_years(conn) == [2020, 2021]
+        assert db.get_event_by_id(conn, a.id).is_err()
+        assert db.get_event_by_id(conn, c.id).is_ok()
+        assert db.get_archived_event(conn, b.id).unwrap().work == 600
+
+        # 查询范围涉及归档数据库时，自动 ATTACH
+        _, end_2021 = db.year_range(2021)
+        assert db.count_events_by_date(conn, start_2020, end_2021) == 2
+        assert db.archive_events(conn, 2022) == []
+
+    def test_move_with_archives(self, tmp_path):
+        old, new = tmp_path.joinpath("old"), tmp_path.joinpath("new")
+        old.mkdir()
+        new.mkdir()
+        conn = db.connect(str(old.joinpath(db.DB_Filename)))
+        db.create_tables(conn)
+        conn.execute(stmt.Enable_wal)
+        task = model.new_task({"name": "coding"}).unwrap()
+        db.insert_task(conn, task)
+        start_2020, _ = db.year_range(2020)
+        a = insert_stopped_event(conn, task, start_2020 + 3600, 600)
+        conn.commit()
+        db.archive_events(conn, 2022)
+        insert_stopped_event(conn, task, db.year_range(2022)[0], 600)
+        conn.commit()
+
+        files = db.db_files(conn)
+        assert [f.name for f in files] == [
+            db.DB_Filename,
+            db.ArchiveFilename.format(year=2020),
+        ]
+        assert db.copy_db_files(conn, new).is_ok()
+        assert db.copy_db_files(conn, new).is_err()  # 不覆盖已有的文件
+        conn.close()
+        db.remove_db_files(files)
+        assert list(old.iterdir()) == []  # 包括 -wal, -shm 文件
+
+        with db.connect(str(new.joinpath(db.DB_Filename))) as conn:
+            assert db.count_events_by_date(conn, 0, model.now()) == 2
+            assert db.get_archived_event(conn, a.id).unwrap().work == 600
+        conn.close()
+
+
+class TestBackup:
+    def test_backup(self, temp_db_conn, tmp_path):
+        task = model.new_task({"name": "coding"}).unwrap()
+        db.insert_task(temp_db_conn, task)
+        temp_db_conn.commit()
+
+        folder = tmp_path.joinpath("backup")
+        folder.mkdir()
+        names = [f"20220501-0{i}0000" for i in range(3)]
+        for name in names:
+            dest = folder.joinpath(db.BackupFilename.format(time=name))
+            assert db.backup(temp_db_conn, dest).is_ok()
+
+        with db.connect(str(dest)) as conn:
+            assert db.get_task_by_name(conn, task.name).is_ok()
+        conn.close()
+
+        folder.joinpath(db.ArchiveFilename.format(year=2020)).touch()
+        removed = db.rotate_backups(folder, 2)
+        assert [f.name for f in removed] == ["tt-focus-20220501-000000.db"]
+        assert len(db.backup_files(folder)) == 2
+
+    def test_backup_with_archives(self, temp_db_conn, tmp_path):
+        conn = temp_db_conn
+        task = model.new_task({"name": "coding"}).unwrap()
+        db.insert_task(conn, task)
+        start_2020, _ = db.year_range(2020)
+        a = insert_stopped_event(conn, task, start_2020 + 3600, 600)
+        conn.commit()
+        db.archive_events(conn, 2022)
+
+        folder = tmp_path.joinpath("backup")
+        folder.mkdir()
+        old = folder.joinpath(db.BackupFilename.format(time="20220501-000000"))
+        assert db.backup(conn, old).is_ok()  # 旧版本的备份文件
+        for time in ("20220502-000000", "20220503-000000"):
+            snapshot = db.backup_snapshot(conn, folder, time).unwrap()
+        assert sorted(f.name for f in snapshot.iterdir()) == [
+            db.ArchiveFilename.format(year=2020),
+            db.DB_Filename,
+        ]
+        with db.connect(str(snapshot.joinpath(db.DB_Filename))) as restored:
+            assert db.get_archived_event(restored, a.id).unwrap().work == 600
+        restored.close()
+
+        removed = db.rotate_backups(folder, 1)
+        assert [f.name for f in removed] == [old.name, "tt-focus-20220502-000000"]
+        assert db.backup_files(folder) == [snapshot]
+
+
+def test_data_version(temp_db_conn):
+    temp_db_conn.commit()
+    path = str(db.db_file(temp_db_conn))
+    other = db.connect(path)
+    v = db.data_version(other)
+    cfg = model.Config(split_min=1, pause_min=2, pause_max=3)
+    db.update_cfg(temp_db_conn, cfg)
+    assert db.data_version(other) == v  # 尚未提交
+    temp_db_conn.commit()
+    assert db.data_version(other) != v
+    v = db.data_version(temp_db_conn)
+    cfg["split_min"] = 10
+    db.update_cfg(temp_db_conn, cfg)
+    temp_db_conn.commit()
+    assert db.data_version(temp_db_conn) == v  # 本连接的修改不影响该值
+    other.close()
+
+
+def test_day_work(temp_db_conn):
+    task = model.new_task({"name": "coding"}).unwrap()
+    db.insert_task(temp_db_conn, task)
+    start, end = db.year_range(2022)
+    day = 24 * 3600
+    insert_stopped_event(temp_db_conn, task, start + 3600, 600)
+    insert_stopped_event(temp_db_conn, task, start + 7200, 700)
+    insert_stopped_event(temp_db_conn, task, start + day + 3600, 800)
+    insert_stopped_event(temp_db_conn, task, end + 3600, 900)
+    assert db.day_work(temp_db_conn, start, end) == {
+        "2022-01-01": 1300,
+        "2022-01-02": 800,
+    }
+
+
+def query_plan(conn, query, param) -> str:
+    rows = conn.execute("EXPLAIN QUERY PLAN " + query, param).fetchall()
+    return "\n".join(row["detail"] for row in rows)
+
+
+def test_task_scoped_query_plans(temp_db_conn):
+    param = dict(start=0, end=1, task_id="x")
+    main_event = "event USING COVERING INDEX idx_event_task_started"
+    for query in (stmt.Count_task_events_by_date_in, stmt.Sum_task_work):
+        plan = query_plan(temp_db_conn, query.format(schema="main"), param)
+        assert main_event in plan, plan
+
+    # 列表需要 laps (计算 productivity), 但仍按索引范围查找，不需要排序。
+    query = stmt.Get_task_events_by_date_in.format(schema="main")
+    plan = query_plan(temp_db_conn, query, param)
+    assert "idx_event_task_started (task_id=? AND started>?" in plan, plan
+    plan = query_plan(temp_db_conn, stmt.Get_recent_task_events, ("x", 9))
+    assert "idx_event_task_started" in plan and "TEMP B-TREE" not in plan
+
+
+Old_tables: Final = """
+CREATE TABLE metadata (name text NOT NULL UNIQUE, value blob NOT NULL);
+CREATE TABLE task (
+    id text PRIMARY KEY COLLATE NOCASE,
+    name text NOT NULL UNIQUE COLLATE NOCASE,
+    alias text NOT NULL COLLATE NOCASE
+);
+CREATE TABLE event (
+    id text PRIMARY KEY COLLATE NOCASE,
+    task_id text REFERENCES task(id) COLLATE NOCASE,
+    started int NOT NULL,
+    status text NOT NULL COLLATE NOCASE,
+    laps blob NOT NULL,
+    work int NOT NULL,
+    notes text NOT NULL
+);
+CREATE INDEX idx_event_task_id ON event(task_id);
+CREATE INDEX idx_event_started ON event(started);
+INSERT INTO task VALUES ('t1', 'coding', '');
+INSERT INTO event VALUES ('rc8j1f', 't1', 1652700000, 'Stopped', X'90', 0, '');
+"""
+"""第一个版本的数据库结构 (user_version = 0)"""
+
+
+def test_migrate(tmp_path):
+    conn = db.connect(str(tmp_path / "old.db"))
+    conn.executescript(Old_tables)
+    assert db.user_version(conn) == 0
+    db.migrate(conn)
+    assert db.user_version(conn) == len(stmt.Migrations)
+    indexes = {row["name"] for row in conn.execute("PRAGMA index_list(event)")}
+    assert "idx_event_task_started" in indexes
+    assert "idx_event_task_id" not in indexes
+    assert conn.execute("SELECT count(*) FROM lap_op").fetchone()[0] == 0
+    fk = conn.execute("PRAGMA foreign_key_list(event)").fetchone()
+    assert fk["on_delete"] == "CASCADE"
+    assert db.count_task_events(conn, "t1") == 1
+    db.migrate(conn)  # 已是最新版本
+    conn.close()
+
+
+def test_events_by_task(temp_db_conn):
+    conn = temp_db_conn
+    a = model.new_task({"name": "coding"}).unwrap()
+    b = model.new_task({"name": "reading"}).unwrap()
+    db.insert_task(conn, a)
+    db.insert_task(conn, b)
+    start, _ = db.year_range(2022)
+    insert_stopped_event(conn, a, start + 3600, 600)
+    insert_stopped_event(conn, b, start + 7200, 700)
+    insert_stopped_event(conn, a, start + 40 * 24 * 3600, 800)
+
+    events = db.get_events_by_date(conn, "2022-01", "month", b.id).unwrap()
+    assert [e.work for e in events] == [700]
+    assert db.events_year_count(conn, "2022", a.id).unwrap() == [
+        ("2022-01", 1),
+        ("2022-02", 1),
+    ]
+    recent = db.get_recent_events(conn, 9, a.id).unwrap()
+    assert [e.work for e in recent] == [800, 600]
+
+
+def test_lap_op_replay(temp_db_conn):
+    conn = temp_db_conn
+    cfg = model.Config(split_min=1, pause_min=1, pause_max=60)
+    task = model.new_task({"name": "coding"}).unwrap()
+    db.insert_task(conn, task)
+    started = 1652700000
+    event = model.Event({"task_id": task.id, "started": started})
+    expected = model.Event({"task_id": task.id, "started": started})
+    db.insert_event(conn, event)
+
+    # 间隔 30 秒的操作会被忽略 (小于下限)，重放时也必须如此。
+    ops = [("split", 600), ("pause", 630), ("resume", 1200), ("split", 1230)]
+    ops = ops * 5
+    for i, (op, dt) in enumerate(ops):
+        at = started + dt + i // 4 * 1800
+        event.apply(op, cfg, at)
+        db.append_lap_op(conn, event, op, at, cfg)
+        expected.apply(op, cfg, at)
+        loaded = db.get_event_by_id(conn, event.id).unwrap()
+        assert (loaded.status, loaded.laps, loaded.work) == (
+            expected.status,
+            expected.laps,
+            expected.work,
+        )
+
+    # 未压缩的操作达到 CompactOps 个时写回 event 表。
+    pending = conn.execute(stmt.Count_pending_lap_ops, (event.id,))
+    assert pending.fetchone()[0] == len(ops) - db.CompactOps
+    db.compact_pending(conn)
+    row = conn.execute(stmt.Get_event_by_id, (event.id,)).fetchone()
+    assert model.unpack(row["laps"]) == expected.laps
+
+
+def test_undo(temp_db_conn):
+    conn = temp_db_conn
+    cfg = model.Config(split_min=1, pause_min=1, pause_max=60)
+    task = model.new_task({"name": "coding"}).unwrap()
+    db.insert_task(conn, task)
+    event = model.Event({"task_id": task.id, "started": 1652700000})
+    db.insert_event(conn, event)
+    event.apply("pause", cfg, 1652700600)
+    db.append_lap_op(conn, event, "pause", 1652700600, cfg)
+    before = (event.status, event.laps, event.work)
+    event.apply("stop", cfg, 1652701200)
+    db.append_lap_op(conn, event, "stop", 1652701200, cfg)
+
+    undone = db.undo_last_op(conn, event.id).unwrap()
+    assert (undone.status, undone.laps, undone.work) == before
+    loaded = db.get_event_by_id(conn, event.id).unwrap()
+    assert (loaded.status, loaded.laps, loaded.work) == before
+
+    # 从 edit 快照重放
+    loaded.stop(cfg, 1652701200)
+    loaded.work = 100
+    db.save_edit(conn, loaded)
+    assert db.undo_last_op(conn, event.id).unwrap().laps == before[1]
+
+    db.undo_last_op(conn, event.id).unwrap()
+    assert db.undo_last_op(conn, event.id).unwrap() is None
+    assert db.get_event_by_id(conn, event.id).is_err()
+
+
+def test_delete_task(temp_db_conn):
+    conn = temp_db_conn
+    a = model.new_task({"name": "coding"}).unwrap()
+    b = model.new_task({"name": "reading"}).unwrap()
+    db.insert_task(conn, a)
+    db.insert_task(conn, b)
+    for i in range(5):
+        insert_stopped_event(conn, a, 1652700000 + i, 600)
+    insert_stopped_event(conn, b, 1652800000, 600)
+
+    done = []
+    assert db.delete_task(conn, a.id, batch=2, progress=done.append) == 5
+    assert done == [2, 4, 5]
+    assert db.get_task_by_id(conn, a.id).is_err()
+    assert conn.execute("SELECT count(*) FROM lap_op").fetchone()[0] == 1
+
+    # 没有事件的任务类型也可以删除
+    c = model.new_task({"name": "writing"}).unwrap()
+    db.insert_task(conn, c)
+    assert db.delete_task(conn, c.id) == 0
+    assert db.get_task_by_id(conn, c.id).is_err()
+
+
+def test_delete_task_in_archives(temp_db_conn):
+    conn = temp_db_conn
+    a = model.new_task({"name": "coding"}).unwrap()
+    b = model.new_task({"name": "reading"}).unwrap()
+    db.insert_task(conn, a)
+    db.insert_task(conn, b)
+    start_2020, _ = db.year_range(2020)
+    for i in range(3):
+        insert_stopped_event(conn, a, start_2020 + i * 3600, 600)
+    insert_stopped_event(conn, b, start_2020 + 100, 600)
+    insert_stopped_event(conn, a, db.year_range(2022)[0], 600)
+    conn.commit()
+    db.archive_events(conn, 2022)
+
+    assert db.count_task_events(conn, a.id) == 4
+    assert db.delete_task(conn, a.id, batch=2) == 4
+    schema = db.attach_archive(conn, 2020)
+    rows = conn.execute(f"SELECT task_id FROM {schema}.event").fetchall()
+    assert [row[0] for row in rows] == [b.id]
+    rows = conn.execute(f"SELECT id FROM {schema}.task").fetchall()
+    assert [row[0] for row in rows] == [b.id]
+
+
+def test_readonly_connection(temp_db_conn):
+    conn = temp_db_conn
+    cfg = model.default_cfg()
+    task = model.new_task({"name": "coding"}).unwrap()
+    db.insert_task(conn, task)
+    event = model.Event({"task_id": task.id, "started": 1652700000})
+    db.insert_event(conn, event)
+    event.apply("split", cfg, 1652701000)
+    db.append_lap_op(conn, event, "split", 1652701000, cfg)
+    conn.commit()
+
+    ro = db.connect(str(db.db_file(conn)), readonly=True)
+    assert db.get_last_event(ro).unwrap().laps == event.laps
+
+    # 只读连接用临时的读写连接压缩操作
+    db.compact_pending(ro)
+    assert ro.execute(stmt.Get_pending_event_ids).fetchall() == []
+    assert db.day_work(ro, 1652600000, 1652800000) != {}
+    with pytest.raises(sqlite3.OperationalError):
+        ro.execute(stmt.Delete_event, (event.id,))
+    ro.close()
@@ -0,0 +1,74 @@
+from .. import db, fsck, model
+from .test_db import insert_stopped_event
+
+
+def set_laps(conn, event_id, laps, work, status="Stopped"):
+    conn.execute(
+        "UPDATE event SET laps=?, work=?, status=? WHERE id=?",
+        (model.pack(laps), work, status, event_id),
+    )
+
+
+def test_check_and_repair(temp_db_conn):
+    conn = temp_db_conn
+    task = model.new_task({"name": "coding"}).unwrap()
+    db.insert_task(conn, task)
+    ok = insert_stopped_event(conn, task, 1652700000, 600)
+    drift = insert_stopped_event(conn, task, 1652710000, 600)
+    length = insert_stopped_event(conn, task, 1652720000, 600)
+    status = insert_stopped_event(conn, task, 1652730000, 600)
+    overlap = insert_stopped_event(conn, task, 1652740000, 600)
+
+    set_laps(conn, drift.id, (("Split", 1652710000, 1652710600, 600),), 500)
+    set_laps(conn, length.id, (("Split", 1652720000, 1652720600, 60),), 60)
+    set_laps(
+        conn,
+        status.id,
+        (("Split", 1652730000, 1652730600, 600),),
+        600,
+        "Running",
+    )
+    laps = (
+        ("Split", 1652740000, 1652740600, 600),
+        ("Pause", 1652740500, 1652740700, 200),
+    )
+    set_laps(conn, overlap.id, laps, 600)
+    conn.commit()
+
+    conn.execute("PRAGMA foreign_keys = 0;")  # 在事务之外才有效
+    conn.execute("UPDATE event SET task_id='gone' WHERE id=?", (ok.id,))
+    conn.commit()
+    conn.execute("PRAGMA foreign_keys = 1;")
+
+    result = fsck.check(conn)
+    assert result.events == 5
+    kinds = {(p.event_id, p.kind, p.fixable) for p in result.problems}
+    assert kinds == {
+        (drift.id, "work", True),
+        (length.id, "lap", True),
+        (length.id, "work", True),
+        (status.id, "status", True),
+        (overlap.id, "order", False),
+        ("", "orphan", True),
+    }
+
+    assert fsck.repair(conn, result, batch=2) == 3
+    result = fsck.check(conn)
+    assert [p.kind for p in result.problems] == ["order"]
+    event = db.get_event_by_id(conn, length.id).unwrap()
+    assert event.work == 600 and event.laps[0][3] == 600
+    assert db.get_event_by_id(conn, status.id).unwrap().status.name == "Stopped"
+    assert db.get_task_by_id(conn, "gone").unwrap().name == "lost-gone"
+
+
+def test_event_ok():
+    laps = (
+        ("Split", 100, 200, 100),
+        ("Pause", 200, 300, 100),
+        ("Split", 300, 0, 0),
+    )
+    assert fsck.event_ok(100, "Running", laps, 100)
+    assert not fsck.event_ok(100, "Pausing", laps, 100)
+    assert not fsck.event_ok(100, "Running", laps, 200)
+    assert fsck.event_ok(100, "Stopped", (), 0)
+    assert not fsck.event_ok(150, "Running", laps, 100)
@@ -0,0 +1,64 @@
+import arrow
+from .. import db, goals, model, stmt
+from .test_db import insert_stopped_event
+
+
+def daily_work(conn) -> list[tuple]:
+    rows = conn.execute("SELECT * FROM daily_work WHERE work > 0")
+    return [tuple(row) for row in rows]
+
+
+def test_daily_work_triggers(temp_db_conn):
+    conn = temp_db_conn
+    task = model.new_task({"name": "coding"}).unwrap()
+    db.insert_task(conn, task)
+    monday = arrow.get("2022-05-16T10:00:00", tzinfo="local")
+    a = insert_stopped_event(conn, task, monday.int_timestamp, 600)
+    b = insert_stopped_event(conn, task, monday.int_timestamp + 3600, 900)
+    tuesday = monday.shift(days=1).int_timestamp
+    insert_stopped_event(conn, task, tuesday, 300)
+    assert daily_work(conn) == [
+        ("2022-05-16", task.id, 1500),
+        ("2022-05-17", task.id, 300),
+    ]
+
+    b.work = 1200
+    db.save_edit(conn, b)
+    db.delete_event(conn, a.id)
+    assert daily_work(conn)[0] == ("2022-05-16", task.id, 1200)
+
+    expected = daily_work(conn)
+    conn.executescript(stmt.Rebuild_daily_work)
+    assert daily_work(conn) == expected
+
+    db.delete_task(conn, task.id)
+    assert daily_work(conn) == []
+
+
+def test_progress(temp_db_conn):
+    conn = temp_db_conn
+    task = model.new_task({"name": "coding"}).unwrap()
+    db.insert_task(conn, task)
+    assert goals.progress(conn) == []
+
+    goals.set_goal(conn, task.id, "day", 3600)
+    goals.set_goal(conn, task.id, "week", 7200)
+    tuesday = arrow.get("2022-05-17T10:00:00", tzinfo="local")
+    insert_stopped_event(conn, task, tuesday.shift(days=-1).int_timestamp, 900)
+    insert_stopped_event(conn, task, tuesday.int_timestamp, 1800)
+
+    now = tuesday.shift(hours=2)
+    day, week = goals.progress(conn, now=now)
+    assert (day.period, day.done, day.percent()) == ("day", 1800, 50)
+    assert (week.period, week.done) == ("week", 2700)
+
+    # 正在计时的事件 (包括正在进行的工作小节) 也计入进度
+    event = model.Event({"task_id": task.id, "started": now.int_timestamp})
+    event.laps = ((model.LapName.Split.name, now.int_timestamp, 0, 0),)
+    db.insert_event(conn, event)
+    day, _ = goals.progress(conn, task.id, now.shift(minutes=10))
+    assert day.done == 1800 + 600
+
+    goals.set_goal(conn, task.id, "day", 0)
+    goals.set_goal(conn, task.id, "week", 0)
+    assert goals.get_goals(conn) == {}
@@ -0,0 +1,59 @@
+import json
+import sys
+from .. import db, hooks, model, util
+
+
+def test_hooks_for():
+    config = {"stop": ["a", "b"], "*": "c", "timeout": 3}
+    assert hooks.hooks_for(config, "stop") == ["a", "b", "c"]
+    assert hooks.hooks_for(config, "split") == ["c"]
+    assert hooks.hooks_for({}, "split") == []
+
+
+def test_fire_without_config(tmp_path):
+    assert hooks.fire(tmp_path, "split", {"id": "x"}) is False
+    tmp_path.joinpath(hooks.HooksFilename).write_text("not json")
+    assert hooks.fire(tmp_path, "split", {"id": "x"}) is False
+
+
+def test_run_all(tmp_path):
+    out = tmp_path.joinpath("out.json")
+    copy = f"{sys.executable} -c \"import sys; open(r'{out}', 'w').write(sys.stdin.read())\""
+    sleep = f'{sys.executable} -c "import time; time.sleep(5)"'
+    job = dict(
+        op="stop",
+        data={"id": "abc", "task": "coding", "status": "Stopped"},
+        hooks=[copy, sleep, "json:dumps", "no.such.module:func"],
+        timeout=0.5,
+    )
+    results = hooks.run_all(job)
+    assert [status for _, status, _ in results] == [
+        "ok",
+        "timeout",
+        "ok",
+        "error ModuleNotFoundError: No module named 'no'",
+    ]
+    assert json.loads(out.read_text())["task"] == "coding"
+
+    log = tmp_path.joinpath(hooks.HooksLogFilename)
+    hooks.write_log(log, "stop", results)
+    hooks.write_log(log, "stop", results)
+    summary = hooks.summarize_log(hooks.read_log(log))
+    assert [(h, n, s) for h, n, _, _, s in summary][1] == (sleep, 2, "timeout")
+
+
+def test_stop_hook_after_delete(temp_db_conn, monkeypatch):
+    conn = temp_db_conn
+    fired = []
+
+    def fake_fire(config_dir, op, data):
+        exists = db.get_event_by_id(conn, data["id"]).is_ok()
+        fired.append((op, data["deleted"], exists))
+        return True
+
+    monkeypatch.setattr(hooks, "fire", fake_fire)
+    db.insert_task(conn, model.new_task({"name": "coding"}).unwrap())
+    cfg = db.get_cfg(conn).unwrap()
+    util.event_start(conn, "coding")
+    util.event_stop(conn, cfg, "en")  # 时长不足，自动删除
+    assert fired == [("start", False, True), ("stop", True, False)]
@@ -0,0 +1,65 @@
+import importlib
+import sys
+
+import pytest
+from click.testing import CliRunner
+
+from .. import complete, db, model
+
+
+@pytest.fixture
+def main(tmp_path, monkeypatch):
+    """在临时文件夹中使用新的配置文件与数据库，导入 tt.main"""
+    monkeypatch.setattr(db, "app_config_dir", tmp_path)
+    monkeypatch.setattr(db, "app_cfg_path", tmp_path / db.AppCfgFilename)
+    monkeypatch.setattr(db, "default_db_path", tmp_path / db.DB_Filename)
+    monkeypatch.setattr(
+        complete, "cache_path", tmp_path / complete.CacheFilename
+    )
+    sys.modules.pop("tt.main", None)
+    yield importlib.import_module("tt.main")
+    sys.modules.pop("tt.main", None)
+
+
+def test_undo_stop(main, monkeypatch):
+    clock = [1652700000]
+    monkeypatch.setattr(model, "now", lambda: clock[0])
+    runner = CliRunner()
+
+    def tt(*args):
+        result = runner.invoke(main.cli, args)
+        assert result.exit_code == 0, result.output
+        return result.output
+
+    tt("add", "coding")
+    tt("start", "coding")
+    clock[0] += 3600
+    tt("stop")
+
+    with db.connect(main.db_path) as conn:
+        assert db.get_last_event(conn).unwrap().status.name == "Stopped"
+    tt("undo")
+    with db.connect(main.db_path) as conn:
+        event = db.get_last_event(conn).unwrap()
+    assert event.status.name == "Running" and event.work == 0
+
+    tt("undo")  # 撤销 start
+    with db.connect(main.db_path) as conn:
+        assert db.get_last_event(conn).is_err()
+
+
+def test_complete_cache_refresh(main, monkeypatch):
+    clock = [1652700000]
+    monkeypatch.setattr(model, "now", lambda: clock[0])
+    runner = CliRunner()
+    runner.invoke(main.cli, ["add", "coding"])
+    runner.invoke(main.cli, ["start", "coding"])
+    cache = complete.load_cache()
+    assert cache["tasks"] == [["coding", ""]] and len(cache["events"]) == 1
+
+    # split/pause 不改变补全的内容，不重写缓存。
+    complete.cache_path.unlink()
+    clock[0] += 600
+    assert runner.invoke(main.cli, ["split"]).exit_code == 0
+    assert runner.invoke(main.cli, ["pause"]).exit_code == 0
+    assert complete.load_cache() is None
@@ -0,0 +1,30 @@
+import arrow
+from .. import db, metrics, model
+from .test_db import insert_stopped_event
+
+
+def test_collect(temp_db_conn, tmp_path):
+    conn = temp_db_conn
+    task = model.new_task({"name": "coding"}).unwrap()
+    db.insert_task(conn, task)
+    now = arrow.get(2022, 5, 18, 12, tzinfo="local")  # 星期三
+    insert_stopped_event(conn, task, now.shift(days=-1).int_timestamp, 600)
+    event = model.Event({"task_id": task.id, "started": now.int_timestamp})
+    db.insert_event(conn, event)
+    conn.commit()
+
+    text = metrics.collect(conn, now.shift(seconds=90))
+    assert 'tt_event_status{status="Running"} 1' in text
+    assert 'tt_event_status{status="Stopped"} 0' in text
+    assert "tt_lap_age_seconds 90" in text
+    assert 'tt_work_today_seconds{task="coding"} 0' in text
+    assert 'tt_work_week_seconds{task="coding"} 600' in text
+
+    path = tmp_path / "tt.prom"
+    metrics.write_textfile(path, text)
+    assert path.read_text(encoding="utf-8") == text
+    assert list(tmp_path.glob("*.tmp")) == []
+
+
+def test_escape():
+    assert metrics.escape('a\\b"c\nd') == 'a\\\\b\\"c\\nd'
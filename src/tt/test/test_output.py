@@ -0,0 +1,38 @@
+import json
+
+from .. import db, model, output
+from .test_db import insert_stopped_event
+
+
+def read_json(capsys) -> dict:
+    data = json.loads(capsys.readouterr().out)
+    assert data["version"] == output.FormatVersion
+    return data
+
+
+def test_status(temp_db_conn, capsys):
+    output.status(temp_db_conn, "json")
+    data = read_json(capsys)
+    assert data["kind"] == "status" and data["event"] is None
+
+    task = model.new_task({"name": "coding"}).unwrap()
+    db.insert_task(temp_db_conn, task)
+    event = insert_stopped_event(temp_db_conn, task, 1652704503, 600)
+    output.status(temp_db_conn, "json")
+    data = read_json(capsys)["event"]
+    assert data["id"] == event.id and data["task"] == "coding"
+    assert data["laps"] == [["Split", 1652704503, 1652705103, 600]]
+
+    output.status(temp_db_conn, "json", "none")
+    assert read_json(capsys)["kind"] == "error"
+
+
+def test_msgpack(temp_db_conn, capsysbinary):
+    output.tasks(temp_db_conn, "msgpack")
+    data = model.unpack(capsysbinary.readouterr().out)
+    assert data["kind"] == "tasks" and data["tasks"] == ()
+
+
+def test_events_by_date(temp_db_conn, capsys):
+    output.events_by_date(temp_db_conn, "2022-13-01", "day", "json")
+    assert read_json(capsys)["kind"] == "error"
@@ -0,0 +1,63 @@
+from .. import db, model, report
+from .test_db import insert_stopped_event
+
+
+def fill(conn):
+    a = model.new_task({"name": "coding"}).unwrap()
+    b = model.new_task({"name": "reading"}).unwrap()
+    db.insert_task(conn, a)
+    db.insert_task(conn, b)
+    for year in (2019, 2020, 2021):
+        start, _ = db.year_range(year)
+        insert_stopped_event(conn, a, start + 3600, 600)
+        insert_stopped_event(conn, b, start + 7200, 900)
+        insert_stopped_event(conn, a, start + 86400 * 200, 1200)
+    conn.commit()
+    return a, b
+
+
+def test_split_parts(temp_db_conn):
+    fill(temp_db_conn)
+    db.archive_events(temp_db_conn, 2020)
+    start, _ = db.year_range(2019)
+    parts = report.split_parts(temp_db_conn, 0, model.now())
+    assert len(parts) == 3
+    assert parts[0][0] == str(db.archive_path(temp_db_conn, 2019))
+    assert parts[0][1] == start + 3600
+    assert [p[0] for p in parts[1:]] == [str(db.db_file(temp_db_conn))] * 2
+
+
+def test_summarize(temp_db_conn):
+    a, b = fill(temp_db_conn)
+    db.archive_events(temp_db_conn, 2020)
+    summary = report.summarize(temp_db_conn, 0, model.now())
+    assert summary.tasks[a.id].events == 6
+    assert summary.tasks[a.id].work == 5400
+    assert summary.tasks[b.id].name == "reading"
+    assert summary.work() == 8100
+    assert report.summarize(temp_db_conn, 0, model.now(), jobs=2) == summary
+
+    only_b = report.summarize(temp_db_conn, 0, model.now(), task_id=b.id)
+    assert list(only_b.tasks) == [b.id] and only_b.work() == 2700
+
+
+def test_focus_stats(temp_db_conn):
+    a, _ = fill(temp_db_conn)
+    db.archive_events(temp_db_conn, 2021)
+    result = report.focus_stats(temp_db_conn, 0, model.now(), a.id, jobs=2)
+    assert result.events == 6 and result.work() == 5400
+    assert result == report.focus_stats(temp_db_conn, 0, model.now(), a.id)
+
+
+def test_top(temp_db_conn):
+    a, b = fill(temp_db_conn)
+    db.archive_events(temp_db_conn, 2020)
+    laps = report.top(temp_db_conn, "laps", 4, 0, model.now())
+    assert [lap[0] for lap in laps] == [1200, 1200, 1200, 900]
+    assert report.top(temp_db_conn, "laps", 4, 0, model.now(), jobs=2) == laps
+
+    events = report.top(temp_db_conn, "events", 2, 0, model.now(), b.id)
+    start, _ = db.year_range(2021)
+    event_id = model.base_repr(start + 7200, 36)
+    assert events[0] == (900, start + 7200, event_id, b.id)
+    assert len(events) == 2 and events[1][0] == 900
@@ -0,0 +1,108 @@
+import asyncio
+import json
+import threading
+
+from .. import db, hooks, model, server, stmt
+
+
+async def request(
+    port: int,
+    method: str,
+    path: str,
+    body: dict | None = None,
+    headers: dict | None = None,
+) -> tuple[int, dict]:
+    reader, writer = await asyncio.open_connection(server.Host, port)
+    content = b"" if body is None else json.dumps(body).encode()
+    lines = [f"{method} {path} HTTP/1.1", f"Host: 127.0.0.1:{port}"]
+    lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+    lines += [f"Content-Length: {len(content)}", "Connection: close"]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + content)
+    response = await reader.read()
+    writer.close()
+    head, _, data = response.partition(b"\r\n\r\n")
+    status = int(head.split()[1])
+    return status, json.loads(data) if data else {}
+
+
+Json = {"Content-Type": "application/json"}
+
+
+def test_server(temp_db_conn, monkeypatch):
+    fired = []
+    monkeypatch.setattr(hooks, "fire", lambda _, op, data: fired.append(op))
+    temp_db_conn.execute(stmt.Enable_wal)
+    task = model.new_task({"name": "coding"}).unwrap()
+    db.insert_task(temp_db_conn, task)
+    temp_db_conn.commit()
+    db_path = str(db.db_file(temp_db_conn))
+
+    # 读取线程不能打开读写连接 (数据库只有 Writer 一个写入者)
+    rw_threads = []
+    connect = db.connect
+
+    def spy_connect(path, readonly=False, check_same_thread=True):
+        if not readonly:
+            rw_threads.append(threading.current_thread().name)
+        return connect(path, readonly, check_same_thread)
+
+    monkeypatch.setattr(db, "connect", spy_connect)
+
+    async def main():
+        s = server.Server(db_path, readers=2)
+        tcp = await asyncio.start_server(s.handle, server.Host, 0)
+        port = tcp.sockets[0].getsockname()[1]
+        try:
+            status, data = await request(port, "GET", "/status")
+            assert status == 200 and data["event"] is None
+
+            status, _ = await request(port, "POST", "/start", {"task": "x"})
+            assert status == 415  # 不是 application/json
+            status, data = await request(
+                port, "POST", "/start", {"task": "nope"}, Json
+            )
+            assert status == 400 and data["kind"] == "error"
+            status, data = await request(
+                port, "POST", "/start", {"task": "coding"}, Json
+            )
+            assert status == 200 and data["event"]["status"] == "Running"
+
+            # 并发读取
+            results = await asyncio.gather(
+                *(request(port, "GET", "/status") for _ in range(10))
+            )
+            assert {r[1]["event"]["task"] for r in results} == {"coding"}
+
+            status, data = await request(port, "POST", "/split", {}, Json)
+            pending = temp_db_conn.execute(stmt.Get_pending_event_ids)
+            assert len(pending.fetchall()) == 1
+            status, data = await request(port, "GET", "/report")
+            assert data["kind"] == "report"
+            pending = temp_db_conn.execute(stmt.Get_pending_event_ids)
+            assert pending.fetchall() == []  # 由 Writer 压缩
+
+            status, data = await request(port, "POST", "/pause", {}, Json)
+            assert data["event"]["status"] == "Pausing"
+            status, data = await request(port, "POST", "/undo", {}, Json)
+            assert data["event"]["status"] == "Running"
+
+            status, data = await request(port, "GET", "/events?task=coding")
+            assert status == 200 and len(data["events"]) == 1
+            status, data = await request(port, "GET", "/report")
+            assert data["kind"] == "report"
+
+            # 与命令行一样执行钩子
+            assert fired == ["start", "split", "pause"]
+            assert not any(x.startswith("tt-reader") for x in rw_threads)
+
+            assert (await request(port, "GET", "/nothing"))[0] == 404
+            assert (await request(port, "POST", "/status", {}, Json))[0] == 405
+            evil = {"Host": "evil.example:80"}
+            status, _ = await request(port, "GET", "/tasks", headers=evil)
+            assert status == 403
+        finally:
+            tcp.close()
+            await tcp.wait_closed()
+            s.close()
+
+    asyncio.run(main())
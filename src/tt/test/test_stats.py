@@ -0,0 +1,112 @@
+import random
+from collections import Counter
+
+import pytest
+
+from .. import model, stats
+from ..stats import FocusStats
+
+
+def test_percentile():
+    c = Counter({10: 1, 20: 1, 30: 1, 40: 1, 50: 1})
+    assert stats.percentile(c, 50) == 30
+    assert stats.percentile(c, 90) == 50
+    assert stats.percentile(c, 1) == 10
+    assert stats.percentile(Counter(), 50) == 0
+
+
+def make_laps(t: int) -> tuple[model.Lap, ...]:
+    return (
+        ("Split", t, t + 600, 600),
+        ("Split", t + 600, t + 1500, 900),  # 与上一个小节相连
+        ("Pause", t + 1500, t + 1800, 300),
+        ("Split", t + 1800, t + 2000, 200),
+    )
+
+
+class TestFocusStats:
+    def test_add_event(self):
+        a = FocusStats()
+        a.add_event("aaa", make_laps(1652704800))
+        assert a.events == 1
+        assert a.lap_count() == 3 and a.work() == 1700 and a.mean() == 566
+        assert a.pauses == Counter({300: 1})
+        assert a.splits == Counter({3: 1})
+        assert a.longest == 1500 and a.longest_event == "aaa"
+        assert sum(a.hours) == 1700
+
+    def test_open_lap_ignored(self):
+        a = FocusStats()
+        a.add_event("aaa", (("Split", 1652704800, 0, 0),))
+        assert a.lap_count() == 0 and a.splits == Counter({0: 1})
+
+    def test_merge(self):
+        a = FocusStats()
+        b = FocusStats()
+        c = FocusStats()
+        a.add_event("aaa", make_laps(1652704800))
+        b.add_event("bbb", make_laps(1652804800))
+        c.add_event("aaa", make_laps(1652704800))
+        c.add_event("bbb", make_laps(1652804800))
+        assert a.merge(b) == c
+
+    def test_pause_distribution(self):
+        a = FocusStats()
+        a.pauses = Counter({60: 2, 300: 1, 3600: 1})
+        dist = dict(a.pause_distribution())
+        assert dist["< 5m"] == 2 and dist["5-10m"] == 1 and dist[">= 60m"] == 1
+
+
+def random_rows(n: int) -> list[tuple[str, bytes]]:
+    rng = random.Random(n)
+    rows = []
+    t = 1652704800
+    for i in range(n):
+        laps: list[model.Lap] = []
+        start = t
+        for j in range(rng.randint(0, 6)):
+            name = rng.choice(["Split", "Split", "Pause"])
+            length = rng.choice([0, rng.randint(1, 9000)])
+            if rng.random() < 0.2:
+                start += rng.randint(1, 600)  # 小节之间有间断
+            laps.append((name, start, start + length, length))
+            start += length
+        if rng.random() < 0.1:
+            laps.append(("Split", start, 0, 0))
+        rows.append((f"e{i}", model.pack(tuple(laps))))
+        t = start + rng.randint(0, 90000)
+    return rows
+
+
+def test_numpy_backend_identical(monkeypatch):
+    pytest.importorskip("numpy")
+    rows = random_rows(3000)
+    a = stats.collect(rows, use_numpy=False)
+    monkeypatch.setattr(stats, "ChunkSize", 700)
+    b = stats.collect(rows, use_numpy=True)
+    assert a == b
+    assert stats.collect([], use_numpy=True) == FocusStats()
+
+
+def test_top_laps():
+    rows = []
+    all_laps = []
+    for i in range(200):
+        t = 1652704800 + i * 3600
+        laps = tuple(
+            (name, start, end, random.randint(1, 3000) if end else 0)
+            for name, start, end, _ in make_laps(t) + (("Split", t, 0, 0),)
+        )
+        work = sum(lap[3] for lap in laps if lap[0] == "Split")
+        rows.append((f"e{i}", "task", work, model.pack(laps)))
+        all_laps += [
+            (length, start, f"e{i}", "task")
+            for name, start, end, length in laps
+            if name == "Split" and end
+        ]
+
+    top = stats.top_laps(rows, 10)
+    assert top.sorted() == sorted(all_laps, reverse=True)[:10]
+    half = stats.top_laps(rows[:100], 10).merge(stats.top_laps(rows[100:], 10))
+    assert half.sorted() == top.sorted()
+    assert stats.top_laps([], 10).sorted() == []
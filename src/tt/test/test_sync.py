@@ -0,0 +1,99 @@
+import pytest
+from .. import db, model, stmt, sync
+from .test_db import insert_stopped_event
+
+
+@pytest.fixture
+def other_conn(tmp_path):
+    path = tmp_path.joinpath("other.db")
+    with db.connect(str(path)) as conn:
+        db.create_tables(conn)
+        db.init_cfg(conn)
+        yield conn
+
+
+def roundtrip(src, dest, since=0) -> sync.ApplyResult:
+    changes = sync.export_changes(src, since)
+    data = changes.pack()
+    return sync.apply_changes(dest, sync.load_changes(data).unwrap())
+
+
+def test_sync(temp_db_conn, other_conn):
+    a, b = temp_db_conn, other_conn
+    task = model.new_task({"name": "coding"}).unwrap()
+    db.insert_task(a, task)
+    e1 = insert_stopped_event(a, task, 1652700000, 600)
+    e2 = insert_stopped_event(a, task, 1652710000, 700)
+    a.commit()
+
+    r = roundtrip(a, b)
+    assert (r.tasks, r.events, r.deleted) == (1, 2, 0)
+    assert db.get_event_by_id(b, e2.id).unwrap().work == 700
+    assert roundtrip(a, b).skipped == 3  # 没有新的修改
+
+    # b 修改备注并删除一个事件
+    watermark = sync.export_changes(b, 0).watermark
+    with b:
+        db.set_event_notes(b, "from b", e1.id)
+        db.delete_event(b, e2.id)
+
+    changes = sync.export_changes(b, watermark)
+    assert len(changes.events) == 1 and len(changes.tombstones) == 1
+    r = sync.apply_changes(a, changes)
+    assert (r.events, r.deleted) == (1, 1)
+    assert db.get_event_by_id(a, e1.id).unwrap().notes == "from b"
+    assert db.get_event_by_id(a, e2.id).is_err()
+
+    # 较旧的修改不会覆盖较新的修改 (last-writer-wins)
+    with a:
+        db.set_event_notes(a, "from a", e1.id)
+    old = sync.export_changes(b, 0)
+    assert sync.apply_changes(a, old).events == 0
+    assert db.get_event_by_id(a, e1.id).unwrap().notes == "from a"
+
+
+def set_updated_at(conn, table, row_id, ms):
+    """明确地修改 updated_at (触发器不会改写), 模拟其他设备的时钟"""
+    conn.execute(f"UPDATE {table} SET updated_at=? WHERE id=?", (ms, row_id))
+    conn.commit()
+
+
+def test_sync_clock_skew(temp_db_conn, other_conn):
+    a, b = temp_db_conn, other_conn
+    now = a.execute(stmt.Get_now_ms).fetchone()[0]
+    future = now + 3600 * 1000  # b 的时钟快一小时
+
+    task = model.new_task({"name": "coding"}).unwrap()
+    db.insert_task(b, task)
+    e1 = insert_stopped_event(b, task, 1652700000, 600)
+    set_updated_at(b, "task", task.id, future)
+    set_updated_at(b, "event", e1.id, future)
+    assert roundtrip(b, a).events == 1
+
+    # 导入的行不推高水位线，a 之后的修改仍然会被导出。
+    watermark = sync.export_changes(a, 0).watermark
+    assert watermark < future
+    e2 = insert_stopped_event(a, task, 1652710000, 700)
+    a.commit()
+    changes = sync.export_changes(a, watermark)
+    assert e2.id in [row[0] for row in changes.events]
+
+    # 任务类型的墓碑只删除早于它的事件，保留较新的事件与任务类型。
+    set_updated_at(a, "task", task.id, now - 1000)
+    set_updated_at(a, "event", e1.id, now - 1000)
+    set_updated_at(a, "event", e2.id, now + 1000)
+    changes = sync.Changes(0, 0, tombstones=[("task", task.id, now)])
+    r = sync.apply_changes(a, changes)
+    assert (r.deleted, r.skipped) == (1, 1)
+    assert db.get_event_by_id(a, e1.id).is_err()
+    assert db.get_event_by_id(a, e2.id).unwrap().work == 700
+    assert sync.local_time(a, "task", task.id) > now  # 复活后同步回 b
+
+    changes = sync.Changes(0, 0, tombstones=[("task", task.id, future)])
+    r = sync.apply_changes(a, changes)
+    assert r.deleted == 2 and db.get_task_by_id(a, task.id).is_err()
+
+
+def test_load_changes():
+    assert sync.load_changes(b"not msgpack").is_err()
+    assert sync.load_changes(model.pack({"version": 0})).is_err()
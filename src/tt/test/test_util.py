@@ -0,0 +1,57 @@
+from .. import db, model, util
+from ..model import Event
+
+
+def stopped_event(task_id: str, started: int, work: int) -> Event:
+    laps = ((model.LapName.Split.name, started, started + work, work),)
+    return Event(
+        dict(
+            task_id=task_id,
+            started=started,
+            status="Stopped",
+            laps=model.pack(laps),
+            work=work,
+        )
+    )
+
+
+def test_find_merge_runs():
+    t = 1652704503
+    events = [
+        stopped_event("a", t, 600),
+        stopped_event("a", t + 700, 600),  # 间隔 100 秒
+        stopped_event("a", t + 1400, 600),  # 间隔 100 秒
+        stopped_event("b", t + 2100, 600),  # 任务类型不同
+        stopped_event("b", t + 9000, 600),  # 间隔太长
+        stopped_event("b", t + 9700, 600),
+    ]
+    runs = util.find_merge_runs(events, 300)
+    assert [len(run) for run in runs] == [3, 2]
+    assert runs[1][0] is events[4]
+
+    running = Event(dict(task_id="b", started=t + 10400))
+    runs = util.find_merge_runs(events[4:] + [running], 300)
+    assert [len(run) for run in runs] == [2]
+
+
+def test_merge_laps():
+    t = 1652704503
+    a = stopped_event("a", t, 600)
+    b = stopped_event("a", t + 700, 500)
+    b.notes = "b"
+    c = util.merge_laps([a, b])
+    assert c is a and c.work == 1100 and len(c.laps) == 2
+    assert c.notes == "b"
+
+
+def test_merge_duplicate_ids(temp_db_conn, capsys):
+    conn = temp_db_conn
+    task = model.new_task({"name": "coding"}).unwrap()
+    db.insert_task(conn, task)
+    a = stopped_event(task.id, 1652704503, 600)
+    db.insert_event(conn, a)
+
+    # 只有大小写不同的 ID 是同一个事件，不足两个事件。
+    util.merge_events(conn, "en", False, a.id, a.id.upper())
+    assert "at least two" in capsys.readouterr().out
+    assert db.get_event_by_id(conn, a.id).is_ok()
@@ -1,10 +1,15 @@
+import io
 import sqlite3
-from datetime import timedelta
-from typing import TypeAlias
+import sys
+import time
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Final, TypeAlias
 import arrow
 from result import Result, Err, Ok
 
-from . import db, model
+from . import db, fsck, goals, hooks, metrics, model, report, stats, sync
 from .model import (
     Config,
     AppConfig,
@@ -123,8 +128,10 @@ def event_start(conn: Conn, name: str | None) -> MultiText:
         else:
             name = task.unwrap()
 
-    r = db.get_task_by_name(conn, name)
+    r = db.get_task_by_name_or_alias(conn, name)
     if r.is_err():
+        if r.unwrap_err() is not db.NoResultError:
+            return r.unwrap_err()
         return MultiText(
             cn=f"不存在任务类型: {name}, 可使用 'tt add {name}' 添加此任务类型。",
             en=f"Not Found: {name}. Try 'tt add {name}' to add it as a task type.",
@@ -133,6 +140,7 @@ def event_start(conn: Conn, name: str | None) -> MultiText:
     t = r.unwrap()
     event = Event({"task_id": t.id})
     db.insert_event(conn, event)
+    fire_hooks(conn, "start", event)
     started = format_time(event.started)
 
     if t.alias:
@@ -164,8 +172,8 @@ def get_last_event(conn: Conn) -> Result[Event, MultiText]:
             raise UnknownReturn
 
 
-def check_command(op: str, status: EventStatus, lang: str) -> bool:
-    """检查 op 与 status 是否匹配，不匹配则返回 True。"""
+def check_op(op: str, status: EventStatus) -> MultiText | None:
+    """检查 op 与 status 是否匹配，不匹配则返回错误信息。"""
     alert = MultiText(
         cn=f"当前事件的状态是 {status.name}, 不可使用 {op} 命令。",
         en=f"The current event is '{status.name}', cannot use the '{op}' command.",
@@ -178,20 +186,21 @@ def check_command(op: str, status: EventStatus, lang: str) -> bool:
         cn="\n可使用: resume/stop", en="\nAvailable commands: resume/stop"
     )
 
-    err = False
     if status is EventStatus.Running and op == "resume":
-        err = True
         alert.append(when_running)
-    elif status is EventStatus.Pausing and op == "pause":
-        err = True
-        alert.append(when_pausing)
-    elif status is EventStatus.Pausing and op == "split":
-        err = True
+    elif status is EventStatus.Pausing and op in ("pause", "split"):
         alert.append(when_pausing)
+    else:
+        return None
+    return alert
 
-    if err:
-        print(alert.str(lang))
-    return err
+
+def check_command(op: str, status: EventStatus, lang: str) -> bool:
+    """检查 op 与 status 是否匹配，不匹配则返回 True。"""
+    err = check_op(op, status)
+    if err is not None:
+        print(err.str(lang))
+    return err is not None
 
 
 def event_operate(conn: Conn, cfg: Config, lang: str, op: str) -> Event | None:
@@ -204,23 +213,66 @@ def event_operate(conn: Conn, cfg: Config, lang: str, op: str) -> Event | None:
     if check_command(op, event.status, lang):
         return None
 
-    match op:
-        case "split":
-            event.split(cfg)
-        case "pause":
-            event.pause(cfg)
-        case "resume":
-            event.resume(cfg)
-        case "stop":
-            event.stop(cfg)
-        case _:
-            raise KeyError(f"Unknown operator: {op}")
-
-    db.update_laps(conn, event)
+    at = model.now()
+    event.apply(op, cfg, at)
+    db.append_lap_op(conn, event, op, at, cfg)
     show_event_details(conn, event, lang)
+
+    # 事件结束 (stop, 或 resume 时休息太久) 后可能因时长不足被删除，
+    # 因此在检查之后才执行钩子，钩子可以从 deleted 得知该事件已不存在。
+    deleted = event.status is EventStatus.Stopped and del_if_below_min(
+        conn, cfg, lang, event
+    )
+    fire_hooks(conn, op, event, deleted)
     return event
 
 
+def hook_data(conn: Conn, event: Event, deleted: bool = False) -> dict:
+    """传给钩子的事件数据。deleted: 该事件因时长不足已被自动删除。"""
+    task = db.get_task_by_id(conn, event.task_id)
+    data = event.to_dict()
+    data["laps"] = list(event.laps)
+    data["task"] = task.unwrap().name if task.is_ok() else ""
+    data["deleted"] = deleted
+    return data
+
+
+def fire_hooks(
+    conn: Conn, op: str, event: Event, deleted: bool = False
+) -> None:
+    """先提交事务，再在后台执行用户钩子 (不等待，见 hooks.py)。"""
+    conn.commit()
+    hooks.fire(db.app_config_dir, op, hook_data(conn, event, deleted))
+
+
+def show_hooks(lang: str) -> None:
+    config_path = db.app_config_dir.joinpath(hooks.HooksFilename)
+    config = hooks.load_config(config_path)
+    ops = ("start", "split", "pause", "resume", "stop", hooks.AnyOp)
+    configured = [(op, hooks_) for op in ops if (hooks_ := config.get(op))]
+    if not configured:
+        info = MultiText(
+            cn=f"未设置钩子 (配置文件: {config_path})",
+            en=f"No hooks (config file: {config_path})",
+        )
+        print(info.str(lang))
+        return
+
+    print(f"\n{config_path}")
+    for op, hooks_ in configured:
+        for hook in [hooks_] if isinstance(hooks_, str) else hooks_:
+            print(f"  {op:<6} {hook}")
+
+    log_path = db.app_config_dir.joinpath(hooks.HooksLogFilename)
+    summary = hooks.summarize_log(hooks.read_log(log_path))
+    if summary:
+        print(f"\n{log_path}")
+        print(f"  {'n':>5} {'avg ms':>9} {'max ms':>9}  last")
+        for hook, n, avg, max_ms, status in summary:
+            print(f"  {n:>5} {avg:>9.1f} {max_ms:>9.1f}  {status:<8} {hook}")
+    print()
+
+
 def event_split(conn: Conn, cfg: Config, lang: str) -> None:
     event_operate(conn, cfg, lang, "split")
 
@@ -229,23 +281,33 @@ def event_pause(conn: Conn, cfg: Config, lang: str) -> None:
     event_operate(conn, cfg, lang, "pause")
 
 
-def del_if_below_min(conn: Conn, cfg: Config, lang: str, event: Event) -> None:
-    if event.work <= cfg["split_min"]:
+def below_min(cfg: Config, event: Event) -> bool:
+    """已结束的事件的总工作时长是否小于下限 (小于下限的事件会被自动删除)"""
+    return event.work <= cfg["split_min"]
+
+
+def del_if_below_min(
+    conn: Conn, cfg: Config, lang: str, event: Event
+) -> bool:
+    """已删除时返回 True"""
+    if below_min(cfg, event):
         info = MultiText(
             cn="以上所示事件，由于总工作时长小于下限，已自动删除。\n",
             en="The event above is automatically deleted.\n",
         )
         print(info.str(lang))
         db.delete_event(conn, event.id)
+        return True
+    return False
 
 
-def event_resume(conn: Conn, cfg: Config, lang: str) -> None:
+def event_resume(conn: Conn, cfg: Config, lang: str) -> bool:
+    """休息太久时自动结束该事件并启动新事件，此时返回 True."""
     event = event_operate(conn, cfg, lang, "resume")
     if event is None:
-        return
+        return False
 
     if event.status is EventStatus.Stopped:
-        del_if_below_min(conn, cfg, lang, event)
         info = MultiText(
             cn="以上所示事件休息时长大于上限，已自动结束，并自动启动了新事件。\n",
             en="The event above is automatically stopped, and an new event is started.\n",
@@ -254,12 +316,94 @@ def event_resume(conn: Conn, cfg: Config, lang: str) -> None:
         info = event_start(conn, None)
         print(info.str(lang))
         print()
+        return True
+    return False
 
 
 def event_stop(conn: Conn, cfg: Config, lang: str) -> None:
     event = event_operate(conn, cfg, lang, "stop")
     if event:
-        del_if_below_min(conn, cfg, lang, event)
+        show_goals(conn, lang, event.task_id)
+
+
+def progress_bar(percent: int, width: int = 20) -> str:
+    n = min(width, percent * width // 100)
+    return "█" * n + "░" * (width - n)
+
+
+def show_goals(conn: Conn, lang: str, task_id: str | None = None) -> bool:
+    """显示今天及本周的目标进度 (只显示 task_id 的目标)，没有目标时返回 False."""
+    items = goals.progress(conn, task_id)
+    if not items:
+        return False
+
+    period_names = dict(
+        day=MultiText(cn="今天", en="today"),
+        week=MultiText(cn="本周", en="week"),
+    )
+    for p in items:
+        t = db.get_task_by_id(conn, p.task_id)
+        if t.is_err():
+            continue  # 已删除的任务类型
+        name = t.unwrap().name
+        period = period_names[p.period].str(lang)
+        print(
+            f"{name} {period:<5} {progress_bar(p.percent())} {p.percent():>3}% "
+            f"[{format_time_len(p.done)} / {format_time_len(p.target)}]"
+        )
+    print()
+    return True
+
+
+def set_goals(
+    conn: Conn,
+    lang: str,
+    task_name: str,
+    day: int | None,
+    week: int | None,
+) -> None:
+    """day, week 的单位是分钟, 0 表示删除该目标。"""
+    r = get_task_by_name(conn, task_name)
+    if r.is_err():
+        print(r.unwrap_err().str(lang))
+        return
+
+    task = r.unwrap()
+    with conn:
+        for period, minutes in (("day", day), ("week", week)):
+            if minutes is not None:
+                goals.set_goal(conn, task.id, period, minutes * 60)
+    if not show_goals(conn, lang, task.id):
+        info = MultiText(
+            cn=f"任务类型 {task.name} 没有目标。", en=f"No goals for {task.name}."
+        )
+        print(info.str(lang))
+
+
+def undo_last(conn: Conn, lang: str) -> None:
+    """撤销最新事件的最后一个操作 (start/split/pause/resume/stop/edit)
+
+    最新事件可能已结束 (撤销 stop), 因此不能使用 get_last_event.
+    """
+    r = db.get_last_event(conn)
+    if r.is_err():
+        print(r.unwrap_err().str(lang))
+        return
+
+    match db.undo_last_op(conn, r.unwrap().id):
+        case Err(err):
+            print(err.str(lang))
+        case Ok(event):
+            if event is None:  # 撤销 start, 该事件已不存在
+                info = MultiText(
+                    cn=f"已撤销 start, 事件 {r.unwrap().id} 已删除。\n",
+                    en=f"Undo start: event {r.unwrap().id} is deleted.\n",
+                )
+                print(info.str(lang))
+            else:
+                show_event_details(conn, event, lang)
+        case _:
+            raise UnknownReturn
 
 
 def show_stopped_status(lang: str) -> None:
@@ -270,8 +414,11 @@ def show_stopped_status(lang: str) -> None:
     print(info.str(lang))
 
 
-def show_event_details(conn: Conn, event: Event, lang: str) -> None:
-    task = db.get_task_by_id(conn, event.task_id).unwrap()
+def show_event_details(
+    conn: Conn, event: Event, lang: str, task: Task | None = None
+) -> None:
+    if task is None:
+        task = db.get_task_by_id(conn, event.task_id).unwrap()
     date = format_date(event.started)
     status = f"(id:{event.id}) {date} **{event.status.name.lower()}**"
     start = format_time(event.started)
@@ -337,6 +484,8 @@ def show_status(conn: Conn, lang: str, event_id: str | None = None) -> None:
         r = db.get_last_event(conn)
     else:
         r = db.get_event_by_id(conn, event_id)
+        if r.is_err():
+            r = db.get_archived_event(conn, event_id).or_else(lambda _: r)
     match r:
         case Err(err):
             print(err.str(lang))
@@ -347,6 +496,46 @@ def show_status(conn: Conn, lang: str, event_id: str | None = None) -> None:
                 show_event_details(conn, event, lang)
 
 
+def watch_status(conn: Conn, lang: str, interval: float = 1.0) -> None:
+    """每秒刷新当前事件的状态，按 Ctrl-C 退出。
+
+    计时根据内存中的事件计算，只有当 PRAGMA data_version 显示其他进程
+    修改了数据库时，才重新读取事件。
+    """
+    version = None
+    event: Event | None = None
+    task: Task | None = None
+    err: MultiText | None = None
+    try:
+        while True:
+            v = db.data_version(conn)
+            if v != version:
+                version = v
+                match db.get_last_event(conn):
+                    case Err(e):
+                        event, err = None, e
+                    case Ok(e):
+                        event, err = e, None
+                        if task is None or task.id != e.task_id:
+                            task = db.get_task_by_id(conn, e.task_id).unwrap()
+
+            buf = io.StringIO()
+            with redirect_stdout(buf):
+                if event is None and err is not None:
+                    print(err.str(lang))
+                elif event is None or event.status is EventStatus.Stopped:
+                    show_stopped_status(lang)
+                else:
+                    show_event_details(conn, event, lang, task)
+
+            # 先清屏再一次性输出，避免闪烁。
+            sys.stdout.write("\x1b[H\x1b[J" + buf.getvalue())
+            sys.stdout.flush()
+            time.sleep(interval - time.time() % interval)
+    except KeyboardInterrupt:
+        print()
+
+
 def set_event_notes(
     conn: Conn, lang: str, notes: str, event_id: str | None
 ) -> None:
@@ -404,8 +593,10 @@ def show_events(conn: Conn, events: list[Event], verbose: bool) -> None:
         print()
 
 
-def show_recent_events(conn: Conn, lang: str, verbose: bool = False) -> None:
-    r = db.get_recent_events(conn, RecentItemsMax)
+def show_recent_events(
+    conn: Conn, lang: str, verbose: bool = False, task_id: str | None = None
+) -> None:
+    r = db.get_recent_events(conn, RecentItemsMax, task_id)
     if r.is_err():
         print(r.unwrap_err().str(lang))
         return
@@ -425,9 +616,14 @@ def show_recent_events(conn: Conn, lang: str, verbose: bool = False) -> None:
 
 
 def show_events_by_date(
-    conn: Conn, date: str, d_or_m: str, lang: str, verbose: bool = False
+    conn: Conn,
+    date: str,
+    d_or_m: str,
+    lang: str,
+    verbose: bool = False,
+    task_id: str | None = None,
 ) -> None:
-    r = db.get_events_by_date(conn, date, d_or_m)
+    r = db.get_events_by_date(conn, date, d_or_m, task_id)
     if r.is_err():
         print(r.unwrap_err().str(lang))
         return
@@ -444,8 +640,10 @@ def show_events_by_date(
     show_events(conn, events, verbose)
 
 
-def show_events_year_count(conn: Conn, year: str, lang: str) -> None:
-    r = db.events_year_count(conn, year)
+def show_events_year_count(
+    conn: Conn, year: str, lang: str, task_id: str | None = None
+) -> None:
+    r = db.events_year_count(conn, year, task_id)
     if r.is_err():
         print(r.unwrap_err().str(lang))
         return
@@ -464,6 +662,67 @@ def show_events_year_count(conn: Conn, year: str, lang: str) -> None:
     print()
 
 
+HeatmapLevels: Final = "·░▒▓█"
+
+
+def heatmap_level(work: int, max_work: int) -> str:
+    if work <= 0:
+        return HeatmapLevels[0]
+    n = len(HeatmapLevels) - 1
+    return HeatmapLevels[min(n, 1 + work * n // (max_work + 1))]
+
+
+def show_heatmap(conn: Conn, year: str, lang: str) -> None:
+    """以日历热力图的形式显示一整年每天的工作时长。"""
+    r = db.get_dates(year, "year")
+    if r.is_err():
+        print(r.unwrap_err().str(lang))
+        return
+
+    start, end = db.year_range(int(year))
+    totals = db.day_work(conn, start, end)
+    if not totals:
+        info = MultiText(
+            cn=f"{year} 年没有事件。", en=f"There is no event in the year {year}"
+        )
+        print(info.str(lang))
+        return
+
+    max_work = max(totals.values())
+    first = date(int(year), 1, 1)
+    last = date(int(year), 12, 31)
+    monday = first - timedelta(days=first.weekday())
+    weeks = (last - monday).days // 7 + 1
+
+    # 月份标签，放在每个月第一天所在的那一列。
+    header = [" "] * (weeks + 3)
+    for m in range(1, 13):
+        col = (date(int(year), m, 1) - monday).days // 7
+        label = arrow.get(date(int(year), m, 1)).format("MMM")
+        if header[col] == " ":
+            header[col : col + 3] = label
+
+    weekdays = MultiText(cn="一二三四五六日", en="MTWTFSS").str(lang)
+    print(f"\n{year}   {''.join(header).rstrip()}")
+    for wd in range(7):
+        row = []
+        for w in range(weeks):
+            d = monday + timedelta(days=w * 7 + wd)
+            if d.year != int(year):
+                row.append(" ")
+            else:
+                work = totals.get(d.isoformat(), 0)
+                row.append(heatmap_level(work, max_work))
+        print(f"  {weekdays[wd]}    {''.join(row)}")
+
+    total = sum(totals.values())
+    info = MultiText(
+        cn=f"\n合计 [{format_time_len(total)}], {len(totals)} 天，单日最长 [{format_time_len(max_work)}]",
+        en=f"\ntotal [{format_time_len(total)}], {len(totals)} days, max [{format_time_len(max_work)}] per day",
+    )
+    print(f"{info.str(lang)}  {HeatmapLevels[0]} 0 {HeatmapLevels[1:]} max\n")
+
+
 def sum_event_work(laps: tuple[Lap, ...]) -> int:
     work = 0
     for lap in laps:
@@ -497,17 +756,31 @@ def set_last_work(conn: Conn, n: int, event_id: str | None, lang: str) -> None:
             last_lap = (last_lap[0], last_lap[1], last_lap[1] + work, work)
             event.laps = event.laps[:-1] + (last_lap,)
             event.work = sum_event_work(event.laps)
-            db.update_laps(conn, event)
+            db.save_edit(conn, event)
             show_event_details(conn, event, lang)
             print(
                 f"{format_time_len(last_work)} => {format_time_len(event.laps[-1][-1])}\n"
             )
 
 
+def merge_laps(events: list[Event]) -> Event:
+    """把已按开始时间排序的多个事件合并到第一个事件中。"""
+    first = events[0]
+    notes = [first.notes] if first.notes else []
+    for e in events[1:]:
+        first.laps += e.laps
+        first.work += e.work
+        if e.notes:
+            notes.append(e.notes)
+    first.notes = " ".join(notes)
+    return first
+
+
 def merge_events(
     conn: Conn, lang: str, preview: bool, *event_ids: str
 ) -> None:
-    event_ids = tuple(set(event_ids))
+    # 事件 ID 不区分大小写，"abc" 与 "ABC" 是同一个事件。
+    event_ids = tuple(dict.fromkeys(x.lower() for x in event_ids))
     info = MultiText(
         cn=f"\n即将合并事件: {event_ids}", en=f"\nEvents to be merged: {event_ids}"
     )
@@ -520,14 +793,14 @@ def merge_events(
         print(err.str(lang))
         return
 
-    events: list[Event] = []
-    for e_id in event_ids:
-        match db.get_event_by_id(conn, e_id):
-            case Err(err):
-                print(err.str(lang))
-                return
-            case Ok(event):
-                events.append(event)
+    # 一次查询取得全部事件 (已按开始时间排序)
+    events = db.get_events_by_ids(conn, event_ids)
+    if len(events) != len(event_ids):
+        found = {e.id.lower() for e in events}
+        e_id = next(x for x in event_ids if x.lower() not in found)
+        err = MultiText(cn=f"找不到此事件: {e_id}", en=f"Event Not Found: {e_id}")
+        print(err.str(lang))
+        return
 
     err1 = MultiText(
         cn="这些事件的任务类型不相同。\n", en="These events have different task type.\n"
@@ -540,8 +813,6 @@ def merge_events(
         en="These events are not adjacent to each other.\n",
     )
 
-    events.sort(key=lambda x: x.started)
-    start_day = format_date(events[0].started)
     task_id = events[0].task_id
 
     # 检查任务类型是否相同、是否未结束
@@ -560,22 +831,15 @@ def merge_events(
         return
 
     # 合并
-    laps = events[0].laps
-    for e in events[1:]:
-        laps += e.laps
-        events[0].work += e.work
-        events[0].notes += " " + e.notes
-
-    events[0].laps = laps
+    merged_ids = [e.id for e in events[1:]]
+    event = merge_laps(events)
 
-    # 更新数据库
+    # 更新数据库 (同一个事务)
     if not preview:
-        db.update_laps(conn, events[0])
-        for e in events[1:]:
-            db.delete_event(conn, e.id)
+        db.merge_events(conn, [(event, merged_ids)])
 
     # 显示结果
-    show_event_details(conn, events[0], lang)
+    show_event_details(conn, event, lang)
     info = MultiText(
         cn="\n以上是预估合并结果，并未真正执行合并。\n",
         en="Shown above is an estimate, did not actually merge.\n",
@@ -584,10 +848,86 @@ def merge_events(
         print(info.str(lang))
 
 
+def event_end(event: Event) -> int:
+    """事件的结束时间 (最后一个小节的结束时间)"""
+    if event.laps and event.laps[-1][2]:
+        return event.laps[-1][2]
+    return event.started
+
+
+def find_merge_runs(events: list[Event], gap_max: int) -> list[list[Event]]:
+    """在按开始时间排序的事件列表中，找出全部可合并的连续事件。
+
+    可合并的条件: 相邻、已结束、任务类型相同，并且前后间隔小于 gap_max 秒。
+    """
+    runs: list[list[Event]] = []
+    run: list[Event] = []
+    for e in events:
+        if (
+            run
+            and e.status is EventStatus.Stopped
+            and e.task_id == run[-1].task_id
+            and e.started - event_end(run[-1]) < gap_max
+        ):
+            run.append(e)
+            continue
+        if len(run) > 1:
+            runs.append(run)
+        run = [e] if e.status is EventStatus.Stopped else []
+
+    if len(run) > 1:
+        runs.append(run)
+    return runs
+
+
+def auto_merge_events(
+    conn: Conn, lang: str, preview: bool, date: str, d_or_m: str, gap: int
+) -> None:
+    """自动合并指定日期范围内的全部相邻事件，gap 的单位是分钟。"""
+    r = db.get_dates(date, d_or_m)
+    if r.is_err():
+        print(r.unwrap_err().str(lang))
+        return
+
+    start, end = r.unwrap()
+    runs = find_merge_runs(db.get_events_range(conn, start, end), gap * 60)
+    if not runs:
+        info = MultiText(
+            cn=f"{date} 没有可合并的事件。", en=f"No events to merge on {date}"
+        )
+        print(info.str(lang))
+        return
+
+    print()
+    merged = []
+    for run in runs:
+        merged_ids = [e.id for e in run[1:]]
+        event = merge_laps(run)
+        merged.append((event, merged_ids))
+        start_time = format_date_time(event.started)
+        work = format_time_len(event.work)
+        print(f"* id: {event.id} <- {', '.join(merged_ids)}, {start_time} [{work}]")
+
+    if preview:
+        info = MultiText(
+            cn=f"\n以上是预估合并结果 ({len(runs)} 组)，并未真正执行合并。\n",
+            en=f"\nShown above is an estimate ({len(runs)} groups), did not actually merge.\n",
+        )
+    else:
+        db.merge_events(conn, merged)
+        info = MultiText(
+            cn=f"\n已合并 {len(runs)} 组事件。\n", en=f"\nMerged {len(runs)} groups of events.\n"
+        )
+    print(info.str(lang))
+
+
 def get_task_by_name(conn: Conn, name: str) -> Result[Task, MultiText]:
-    match db.get_task_by_name(conn, name):
-        case Err(_):
-            err = MultiText(cn=f"找不到任务类型: {name}", en=f"Not Found: {name}")
+    match db.get_task_by_name_or_alias(conn, name):
+        case Err(err):
+            if err is db.NoResultError:
+                err = MultiText(
+                    cn=f"找不到任务类型: {name}", en=f"Not Found: {name}"
+                )
             return Err(err)
         case Ok(task):
             return Ok(task)
@@ -595,6 +935,15 @@ def get_task_by_name(conn: Conn, name: str) -> Result[Task, MultiText]:
             raise UnknownReturn
 
 
+def get_task_id(
+    conn: Conn, task_name: str | None
+) -> Result[str | None, MultiText]:
+    """task_name 为空时返回 Ok(None), 表示不限任务类型。"""
+    if not task_name:
+        return Ok(None)
+    return get_task_by_name(conn, task_name).map(lambda task: task.id)
+
+
 def set_task_alias(conn: Conn, alias: str, name: str, lang: str) -> None:
     match db.get_task_by_name(conn, name):
         case Err(_):
@@ -614,3 +963,293 @@ def set_task_name(conn: Conn, new_name: str, old_name: str, lang: str) -> None:
             print(
                 f"Task: {old_name} ({task.alias}) -> {new_name} ({task.alias})"
             )
+
+
+def archive_events(conn: Conn, before: str, lang: str) -> None:
+    if len(before) != 4 or not before.isdigit():
+        err = MultiText(
+            cn=f"年份格式错误: {before}  正确示范: 2022",
+            en=f"Wrong year: {before}  A correct example: 2022",
+        )
+        print(err.str(lang))
+        return
+
+    result = db.archive_events(conn, int(before))
+    if not result:
+        info = MultiText(
+            cn=f"{before} 年之前没有需要归档的事件。",
+            en=f"There is no event to archive before {before}",
+        )
+        print(info.str(lang))
+        return
+
+    print()
+    for year, n in result:
+        print(f"* {year}: {n} -> {db.archive_path(conn, year)}")
+    print()
+
+
+def check_db(conn: Conn, lang: str, fix: bool) -> None:
+    """检查全部事件的完整性，fix 为 True 时修复可修复的问题。"""
+    result = fsck.check(conn)
+    fixable = sum(p.fixable for p in result.problems)
+    if result.problems:
+        print()
+    for p in result.problems:
+        mark = "*" if p.fixable else "!"
+        print(f"{mark} {p.event_id or '-'} [{p.kind}] {p.detail}")
+
+    info = MultiText(
+        cn=f"\n检查了 {result.events} 个事件，发现 {len(result.problems)} 个问题 (其中 {fixable} 个可修复)",
+        en=f"\nChecked {result.events} events, {len(result.problems)} problems ({fixable} fixable)",
+    )
+    print(info.str(lang))
+    if fixable == 0:
+        print()
+        return
+
+    if not fix:
+        info = MultiText(
+            cn="可使用 'tt fsck --fix' 修复标记为 * 的问题。\n",
+            en="Try 'tt fsck --fix' to repair the problems marked with *.\n",
+        )
+        print(info.str(lang))
+        return
+
+    n = fsck.repair(conn, result)
+    info = MultiText(
+        cn=f"已修复 {n} 个事件，为 {len(result.orphans)} 个孤立的 task_id 添加了任务类型。\n",
+        en=f"Repaired {n} events, added task types for {len(result.orphans)} orphaned task_ids.\n",
+    )
+    print(info.str(lang))
+
+
+def backup_db(conn: Conn, folder: str, keep: int, every: int, lang: str) -> None:
+    """备份数据库到 folder, 只保留最新的 keep 个备份。
+
+    如果最新的备份距今不足 every 分钟，则跳过本次备份 (方便用 cron 定期执行)。
+    """
+    dest_folder = Path(folder)
+    files = db.backup_files(dest_folder)
+    if every > 0 and files:
+        age = model.now() - int(files[-1].stat().st_mtime)
+        if age < every * 60:
+            info = MultiText(
+                cn=f"跳过: 最新的备份只有 {format_time_len(age)} 之前: {files[-1]}",
+                en=f"Skipped: the latest backup is only {format_time_len(age)} old: {files[-1]}",
+            )
+            print(info.str(lang))
+            return
+
+    time = arrow.now().format(db.BackupTimeFormat)
+    match db.backup_snapshot(conn, dest_folder, time):
+        case Err(err):
+            print(err.str(lang))
+        case Ok(dest):
+            for f in sorted(dest.iterdir()):
+                print(f"Backup: {f}")
+            for f in db.rotate_backups(dest_folder, keep):
+                print(f"Removed: {f}")
+
+
+def sync_export(conn: Conn, file: str, since: int | None, lang: str) -> None:
+    """导出 since 之后的修改 (省略 since 则从上一次导出的水位线开始)"""
+    if since is None:
+        since = sync.get_watermark(conn)
+    changes = sync.export_changes(conn, since)
+    data = changes.pack()
+    dest = Path(file)
+    temp = dest.with_name(dest.name + ".tmp")
+    temp.write_bytes(data)
+    temp.replace(dest)
+    with conn:
+        db.set_meta(conn, sync.WatermarkName, changes.watermark)
+
+    info = MultiText(
+        cn=f"导出: {len(changes.tasks)} 个任务类型, {len(changes.events)} 个事件, "
+        f"{len(changes.tombstones)} 个删除 -> {dest} ({len(data)} bytes)",
+        en=f"Exported: {len(changes.tasks)} tasks, {len(changes.events)} events, "
+        f"{len(changes.tombstones)} deletions -> {dest} ({len(data)} bytes)",
+    )
+    print(info.str(lang))
+    print(f"watermark: {changes.watermark}")
+
+
+def sync_apply(conn: Conn, file: str, lang: str) -> None:
+    match sync.load_changes(Path(file).read_bytes()):
+        case Err(err):
+            print(err.str(lang))
+        case Ok(changes):
+            r = sync.apply_changes(conn, changes)
+            info = MultiText(
+                cn=f"应用: {r.tasks} 个任务类型, {r.events} 个事件, {r.deleted} 个删除 "
+                f"(忽略 {r.skipped} 个较旧的修改)",
+                en=f"Applied: {r.tasks} tasks, {r.events} events, {r.deleted} deletions "
+                f"({r.skipped} older changes skipped)",
+            )
+            print(info.str(lang))
+            for conflict in r.conflicts:
+                print(f"! {conflict}")
+        case _:
+            raise UnknownReturn
+
+
+def write_metrics(conn: Conn, textfile: str | None) -> None:
+    """textfile 为 None 时输出到屏幕"""
+    text = metrics.collect(conn)
+    if textfile:
+        metrics.write_textfile(Path(textfile), text)
+    else:
+        print(text, end="")
+
+
+def get_stats(
+    conn: Conn,
+    date_from: str | None,
+    date_to: str | None,
+    task_name: str | None,
+    jobs: int = 1,
+) -> Result[stats.FocusStats, MultiText]:
+    match db.get_date_range(date_from, date_to):
+        case Err(err):
+            return Err(err)
+        case Ok((start, end)):
+            r = get_task_id(conn, task_name)
+            if r.is_err():
+                return Err(r.unwrap_err())
+            task_id = r.unwrap()
+            result = report.focus_stats(conn, start, end, task_id, jobs)
+            return Ok(result)
+        case _:
+            raise UnknownReturn
+
+
+def show_top(
+    conn: Conn,
+    lang: str,
+    kind: str,
+    n: int,
+    date_from: str | None,
+    date_to: str | None,
+    task_name: str | None,
+    jobs: int = 1,
+) -> None:
+    """kind: "laps" (最长的工作小节) 或 "events" (工作时长最长的事件)"""
+    r = db.get_date_range(date_from, date_to)
+    if r.is_err():
+        print(r.unwrap_err().str(lang))
+        return
+    start, end = r.unwrap()
+    t = get_task_id(conn, task_name)
+    if t.is_err():
+        print(t.unwrap_err().str(lang))
+        return
+
+    rows = report.top(conn, kind, n, start, end, t.unwrap(), jobs)
+    if not rows:
+        info = MultiText(cn="该范围内没有事件。", en="There is no event in the range.")
+        print(info.str(lang))
+        return
+
+    if kind == "laps":
+        header = MultiText(cn="最长的工作小节", en="Longest laps")
+    else:
+        header = MultiText(cn="工作时长最长的事件", en="Biggest events")
+    print(f"\n[{header.str(lang)}]\n")
+    names = {task.id: task.name for task in db.get_all_task(conn)}
+    for i, (length, started, event_id, task_id) in enumerate(rows, 1):
+        name = names.get(task_id, task_id)
+        print(
+            f"{i:>4}. [{format_time_len(length)}] "
+            f"{format_date_time(started)}  id: {event_id}, {name}"
+        )
+    print()
+
+
+def show_stats(
+    conn: Conn,
+    lang: str,
+    date_from: str | None,
+    date_to: str | None,
+    task_name: str | None,
+    jobs: int = 1,
+) -> None:
+    r = get_stats(conn, date_from, date_to, task_name, jobs)
+    if r.is_err():
+        print(r.unwrap_err().str(lang))
+        return
+
+    result = r.unwrap()
+    if result.lap_count() == 0:
+        info = MultiText(cn="该范围内没有事件。", en="There is no event in the range.")
+        print(info.str(lang))
+        return
+
+    laps = result.laps
+    n_pauses = sum(result.pauses.values())
+    n_splits = sum(k * v for k, v in result.splits.items())
+    text = MultiText(
+        cn=f"""
+    事件数量: {result.events}
+    工作小节: {result.lap_count()}  合计 [{format_time_len(result.work())}]
+    小节长度: 平均 [{format_time_len(result.mean())}]  中位数 [{format_time_len(stats.percentile(laps, 50))}]  p90 [{format_time_len(stats.percentile(laps, 90))}]
+每事件小节数: 平均 {n_splits / result.events:.1f}  最多 {max(result.splits)}
+最长连续专注: [{format_time_len(result.longest)}] (id:{result.longest_event})
+    休息次数: {n_pauses}""",
+        en=f"""
+      events: {result.events}
+        laps: {result.lap_count()}  total [{format_time_len(result.work())}]
+  lap length: mean [{format_time_len(result.mean())}]  median [{format_time_len(stats.percentile(laps, 50))}]  p90 [{format_time_len(stats.percentile(laps, 90))}]
+laps / event: mean {n_splits / result.events:.1f}  max {max(result.splits)}
+longest focus: [{format_time_len(result.longest)}] (id:{result.longest_event})
+      pauses: {n_pauses}""",
+    )
+    print(text.str(lang))
+    for label, n in result.pause_distribution():
+        print(f"{label:>13}: {n}")
+
+    header = MultiText(cn="\n[每个钟点的工作时长]\n", en="\nWork by hour of day:\n")
+    print(header.str(lang))
+    max_work = max(result.hours)
+    for hour, work in enumerate(result.hours):
+        bar = "█" * round(work * 40 / max_work) if max_work else ""
+        print(f"  {hour:02}  {bar} {format_time_len(work) if work else ''}")
+    print()
+
+
+def show_report(
+    conn: Conn,
+    lang: str,
+    date_from: str | None,
+    date_to: str | None,
+    jobs: int = 1,
+    task_id: str | None = None,
+) -> None:
+    """每个任务类型的事件数量与工作时长合计"""
+    r = db.get_date_range(date_from, date_to)
+    if r.is_err():
+        print(r.unwrap_err().str(lang))
+        return
+
+    start, end = r.unwrap()
+    summary = report.summarize(conn, start, end, jobs, task_id)
+    if not summary.tasks:
+        info = MultiText(cn="该范围内没有事件。", en="There is no event in the range.")
+        print(info.str(lang))
+        return
+
+    total = summary.work()
+    items = sorted(summary.tasks.values(), key=lambda x: x.work, reverse=True)
+    width = max(len(item.name) for item in items)
+    print()
+    for item in items:
+        share = round(item.work * 100 / total) if total else 0
+        print(
+            f"* {item.name:<{width}}  [{format_time_len(item.work)}] "
+            f"{share:>3}%  ({item.events})"
+        )
+    info = MultiText(
+        cn=f"\n合计 [{format_time_len(total)}], {summary.events()} 个事件\n",
+        en=f"\ntotal [{format_time_len(total)}], {summary.events()} events\n",
+    )
+    print(info.str(lang))